@@ -1,5 +1,8 @@
-from django.contrib import admin
-from .models import Invoice, Payer, Purpose
+from django.contrib import admin, messages
+from .models import (ExchangeRate, FavouritePDF, GeneratedInvoice, Invoice, InvoiceJob,
+                     InvoiceNumberSeries, Payer, Purpose)
+from .utils.batch_totals import BatchTotals
+from .utils.money import Money
 
 
 @admin.register(Payer)
@@ -25,5 +28,60 @@ class InvoiceAdmin(admin.ModelAdmin):
                     "invoice_number"]
     search_fields = ["receiver__email", "payer__name_ka", "invoice_number"]
     list_select_related = ["receiver", "payer"]
+    actions = ["recalculate_totals"]
 
+    @admin.action(description="Recalculate totals of selected invoices")
+    def recalculate_totals(self, request, queryset):
+        """
+        Store the total amount of every selected invoice, calculated in one batch.
+        """
+        totals = BatchTotals.for_invoices(queryset)
+        invoices = [Invoice(id=invoice_id, total_amount=total.to_decimal())
+                    for invoice_id, (total, _, _) in totals.items()]
+        Invoice.objects.bulk_update(invoices, ["total_amount"], batch_size=1000)
 
+        grand_totals = {}
+        for invoice_totals in totals.values():
+            currency = invoice_totals[0].currency
+            sums = grand_totals.get(currency, (Money(0, currency),) * 3)
+            grand_totals[currency] = tuple(a + b for a, b in zip(sums, invoice_totals))
+        summary = "; ".join(f"{currency}: total {total}, VAT {vat}, without VAT {net}"
+                            for currency, (total, vat, net) in sorted(grand_totals.items()))
+        self.message_user(request, f"Recalculated {len(invoices)} invoices. {summary}",
+                          messages.SUCCESS)
+
+
+@admin.register(InvoiceJob)
+class InvoiceJobAdmin(admin.ModelAdmin):
+    list_display = ["id", "owner__email", "status", "created_at", "finished_at"]
+    list_filter = ["status"]
+    exclude = ["pdf"]
+    list_select_related = ["owner"]
+
+
+@admin.register(FavouritePDF)
+class FavouritePDFAdmin(admin.ModelAdmin):
+    list_display = ["invoice__invoice_number", "built_at"]
+    exclude = ["pdf"]
+    list_select_related = ["invoice"]
+
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ["currency", "date", "rate"]
+    list_filter = ["currency"]
+    date_hierarchy = "date"
+
+
+@admin.register(InvoiceNumberSeries)
+class InvoiceNumberSeriesAdmin(admin.ModelAdmin):
+    list_display = ["receiver__email", "next_number"]
+    list_select_related = ["receiver"]
+
+
+@admin.register(GeneratedInvoice)
+class GeneratedInvoiceAdmin(admin.ModelAdmin):
+    list_display = ["invoice_number", "owner__email", "payer_name", "total_amount",
+                    "currency", "created_at"]
+    search_fields = ["owner__email", "payer_name", "invoice_number", "sha256"]
+    list_select_related = ["owner"]
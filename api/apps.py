@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from api import signals  # noqa: F401
+
+        # Fail at startup rather than on the first request if an invoice
+        # template is missing or broken.
+        if getattr(settings, "INVOICE_TEMPLATE_PRELOAD", True):
+            from api.utils.template_registry import TemplateRegistry
+            TemplateRegistry.load()
@@ -12,4 +12,11 @@ TEMPLATES = (
     ("template2", "template2"),
     ("template3", "template3"),
     ("template4", "template4"),
-)
\ No newline at end of file
+)
+
+JOB_STATUSES = (
+    ("pending", "pending"),
+    ("running", "running"),
+    ("done", "done"),
+    ("failed", "failed"),
+)
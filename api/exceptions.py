@@ -12,3 +12,19 @@ class LanguageNotSupportedError(Exception):
     Exception raised when the requested language is not supported.
     """
     pass
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Exception raised when a request or block runs more database queries
+    than its budget.
+    """
+    pass
+
+
+class PayerImportError(Exception):
+    """
+    Exception raised when a payer import file cannot be read as a whole,
+    as opposed to rows that fail validation.
+    """
+    pass
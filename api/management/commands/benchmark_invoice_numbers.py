@@ -0,0 +1,112 @@
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+
+from api.utils.invoice_numbers import InvoiceNumbers
+from user.models import User
+
+
+def _allocate(receiver_ids: List[int], count: int, offset: int) -> List[Tuple[int, str]]:
+    """
+    Allocate numbers round-robin over the receivers on one thread.
+    """
+    receivers = [User(pk=receiver_id) for receiver_id in receiver_ids]
+    try:
+        numbers = []
+        for index in range(offset, offset + count):
+            receiver = receivers[index % len(receivers)]
+            numbers.append((receiver.pk, InvoiceNumbers.next(receiver)))
+        return numbers
+    finally:
+        connections.close_all()
+
+
+def _run_process(receiver_ids: List[int], threads: int, count: int,
+                 process: int) -> List[Tuple[int, str]]:
+    """
+    Allocate numbers on several threads of one process.
+    """
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(_allocate, receiver_ids, count, process * threads + thread)
+                   for thread in range(threads)]
+        return [number for future in futures for number in future.result()]
+
+
+class Command(BaseCommand):
+    help = ("Allocate invoice numbers from many threads and processes "
+            "against the configured database and report the allocation "
+            "rate. Uniqueness and contiguity are checked by the tests in "
+            "api/tests.py. Temporary receivers are created and deleted again.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--receivers", type=int, default=4,
+                            help="Receivers whose series are allocated from")
+        parser.add_argument("--processes", type=int, default=4,
+                            help="Forked worker processes, 0 to use threads of this process only")
+        parser.add_argument("--threads", type=int, default=8,
+                            help="Threads per process")
+        parser.add_argument("--numbers", type=int, default=1000,
+                            help="Numbers allocated by every thread")
+        parser.add_argument("--policy", choices=InvoiceNumbers.GAP_POLICIES,
+                            default=getattr(settings, "INVOICE_NUMBER_GAP_POLICY", "blocks"))
+        parser.add_argument("--block-size", type=int,
+                            default=getattr(settings, "INVOICE_NUMBER_BLOCK_SIZE", 100))
+
+    def handle(self, *args, **options):
+        if options["processes"] and connections["default"].vendor == "sqlite" and \
+                connections["default"].is_in_memory_db():
+            raise CommandError("Worker processes cannot share an in-memory SQLite "
+                               "database, use --processes 0 or another database")
+
+        tag = uuid.uuid4().hex[:12]
+        receiver_ids = [
+            User.objects.create_user(
+                f"Invoice numbers benchmark {index}", f"benchmark-{tag}-{index}",
+                f"benchmark-{tag}-{index}@invoice-numbers.invalid", None,
+                bank_account_number="-", bank_name_ka="-", bank_code="-",
+            ).pk
+            for index in range(options["receivers"])
+        ]
+        try:
+            with override_settings(INVOICE_NUMBER_GAP_POLICY=options["policy"],
+                                   INVOICE_NUMBER_BLOCK_SIZE=options["block_size"]):
+                elapsed, numbers = self._run(receiver_ids, options)
+        finally:
+            User.objects.filter(pk__in=receiver_ids).delete()
+
+        workers = max(1, options["processes"]) * options["threads"]
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(numbers)} numbers from {workers} threads in "
+            f"{max(1, options['processes'])} processes, policy {options['policy']}: "
+            f"{elapsed * 1000:.0f} ms, {len(numbers) / elapsed:.0f} numbers/s"
+        ))
+
+    @staticmethod
+    def _run(receiver_ids: List[int], options) -> Tuple[float, List[Tuple[int, str]]]:
+        """
+        Allocate the numbers and time it.
+        """
+        InvoiceNumbers.reset()
+        if not options["processes"]:
+            start = time.perf_counter()
+            numbers = _run_process(receiver_ids, options["threads"], options["numbers"], 0)
+            return time.perf_counter() - start, numbers
+
+        # Forked children must not share the parent's connection
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        with context.Pool(options["processes"]) as pool:
+            start = time.perf_counter()
+            results = pool.starmap(_run_process, [
+                (receiver_ids, options["threads"], options["numbers"], process)
+                for process in range(options["processes"])
+            ])
+            elapsed = time.perf_counter() - start
+        return elapsed, [number for result in results for number in result]
@@ -0,0 +1,220 @@
+import json
+import math
+import multiprocessing
+import platform
+import re
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from typing import Any, Dict, List
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.utils.invoice_generator import Language, TemplateType
+from api.utils.render_profiles import RenderProfile, RenderProfiles
+
+
+PAGE_RE = re.compile(rb"/Type\s*/Page\b")
+
+
+def _percentile(samples: List[float], quantile: float) -> float:
+    """
+    Nearest-rank percentile of a list of samples.
+    """
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, math.ceil(quantile * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _invoice_data(template: str, language: str, lines: int) -> Dict[str, Any]:
+    """
+    Build invoice generation data with a synthetic payer and purposes.
+    """
+    from api.models import Payer
+
+    payer = Payer(identification_code="405000000", name_ka="შპს გადამხდელი",
+                  name_en="Payer LLC", phone_number="+995 555 000 000")
+    return {
+        "payer": payer,
+        "currency": "GEL",
+        "language": language,
+        "template": template,
+        # Fixed number: the synthetic receiver has no number series
+        "invoice_number": "00000000000000",
+        "should_use_invoice_date_currency_rate": False,
+        "purposes": [
+            {"description": f"Service line {number}",
+             "amount": Decimal(f"{(number % 997) + 1}.{number % 100:02d}"),
+             "has_vat": number % 2 == 0}
+            for number in range(lines)
+        ],
+    }
+
+
+def _run_case(template: str, language: str, lines: int, iterations: int,
+              profile: str) -> Dict[str, Any]:
+    """
+    Render one benchmark case in a fresh process so peak RSS is per case.
+    """
+    from django.test.utils import override_settings
+    from user.models import User
+    from api.utils.invoice_generator import InvoiceGenerator
+    from api.utils.timing import StageTimer
+
+    user = User(receiver_name_ka="შპს მიმღები", receiver_name_en="Receiver LLC",
+                identification_code="400000000", phone_number="+995 555 111 111",
+                bank_account_number="GE00TB0000000000000000",
+                bank_name_ka="ბანკი", bank_name_en="Bank", bank_code="TBCBGE22")
+
+    samples = []
+    stages: Dict[str, float] = {}
+    pdf = b""
+    with override_settings(INVOICE_RENDER_POOL_ENABLED=False,
+                           INVOICE_PDF_CACHE_ENABLED=False,
+                           INVOICE_RENDER_MAX_RENDERS=0,
+                           INVOICE_RENDER_MAX_RSS_MB=0):
+        # Warm-up render, not measured
+        InvoiceGenerator(_invoice_data(template, language, 1), user).generate_invoice()
+        for _ in range(iterations):
+            invoice_data = _invoice_data(template, language, lines)
+            invoice_data["render_profile"] = profile
+            timer = StageTimer()
+            start = time.perf_counter()
+            with timer.activate():
+                pdf = InvoiceGenerator(invoice_data, user).generate_invoice()
+            samples.append((time.perf_counter() - start) * 1000)
+            for name, duration in timer.stages.items():
+                stages[name] = stages.get(name, 0.0) + duration / iterations
+
+    return {
+        "template": template,
+        "language": language,
+        "lines": lines,
+        "profile": profile,
+        "iterations": iterations,
+        "p50_ms": round(_percentile(samples, 0.50), 2),
+        "p95_ms": round(_percentile(samples, 0.95), 2),
+        "p99_ms": round(_percentile(samples, 0.99), 2),
+        "mean_ms": round(sum(samples) / len(samples), 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "pdf_bytes": len(pdf),
+        "pages": len(PAGE_RE.findall(pdf)),
+        "stages_ms": {name: round(duration, 2) for name, duration in stages.items()},
+    }
+
+
+class Command(BaseCommand):
+    help = ("Benchmark InvoiceGenerator.generate_invoice across templates, "
+            "languages and line counts, optionally failing on regressions "
+            "against a stored baseline. Run offline with "
+            "DJANGO_SETTINGS_MODULE=invoice_generator_api.settings_benchmark.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--templates", nargs="+",
+                            default=[template.value for template in TemplateType])
+        parser.add_argument("--languages", nargs="+",
+                            default=[language.value for language in Language])
+        parser.add_argument("--lines", type=int, nargs="+",
+                            default=[1, 10, 100, 1000, 10000],
+                            help="Purpose line counts to benchmark")
+        parser.add_argument("--profiles", nargs="+",
+                            default=[RenderProfiles.default().value],
+                            choices=[profile.value for profile in RenderProfile],
+                            help="Render profiles to benchmark")
+        parser.add_argument("--iterations", type=int, default=10,
+                            help="Measured renders per case")
+        parser.add_argument("--line-budget", type=int, default=20000,
+                            help="Cap on rendered lines per case; large cases "
+                                 "run fewer iterations")
+        parser.add_argument("--output", help="Write the JSON result to this file")
+        parser.add_argument("--baseline", help="JSON result to compare against")
+        parser.add_argument("--threshold", type=float, default=0.2,
+                            help="Allowed relative slowdown of p95 and peak RSS")
+        parser.add_argument("--max-rss-mb", type=float,
+                            help="Fail when any case exceeds this peak RSS")
+
+    def handle(self, *args, **options):
+        cases = [
+            (template, language, lines,
+             max(1, min(options["iterations"], options["line_budget"] // lines)),
+             profile)
+            for template in options["templates"]
+            for language in options["languages"]
+            for lines in options["lines"]
+            for profile in options["profiles"]
+        ]
+
+        self.stdout.write(f"{'case':<36}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+                          f"{'rss MB':>9}{'bytes':>10}{'pages':>7}")
+        results = []
+        context = multiprocessing.get_context("spawn")
+        for case in cases:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context,
+                                     initializer=django.setup) as executor:
+                result = executor.submit(_run_case, *case).result()
+            results.append(result)
+            self.stdout.write(
+                f"{self._case_name(result):<36}{result['p50_ms']:>10.1f}"
+                f"{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+                f"{result['peak_rss_mb']:>9.1f}{result['pdf_bytes']:>10}"
+                f"{result['pages']:>7}"
+            )
+
+        report = {
+            "meta": {
+                "created_at": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+            },
+            "results": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options["max_rss_mb"]:
+            over_budget = [f"{self._case_name(result)}: {result['peak_rss_mb']} MB"
+                           for result in results
+                           if result["peak_rss_mb"] > options["max_rss_mb"]]
+            if over_budget:
+                raise CommandError(f"Peak RSS above {options['max_rss_mb']} MB:\n"
+                                   + "\n".join(over_budget))
+
+        if options["baseline"]:
+            self._compare(results, options["baseline"], options["threshold"])
+
+    def _compare(self, results, baseline_path, threshold):
+        """
+        Fail when a case is slower or uses more memory than the baseline allows.
+        """
+        with open(baseline_path) as baseline_file:
+            baseline = {self._case_name(result): result
+                        for result in json.load(baseline_file)["results"]}
+
+        regressions = []
+        for result in results:
+            expected = baseline.get(self._case_name(result))
+            if expected is None:
+                continue
+            for metric in ("p95_ms", "peak_rss_mb"):
+                limit = expected[metric] * (1 + threshold)
+                if result[metric] > limit:
+                    regressions.append(f"{self._case_name(result)} {metric}: "
+                                       f"{result[metric]} > {limit:.1f} "
+                                       f"(baseline {expected[metric]})")
+
+        if regressions:
+            raise CommandError("Performance regressions:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS(
+            f"No regressions above {threshold:.0%} against {baseline_path}"
+        ))
+
+    @staticmethod
+    def _case_name(result):
+        # Results from before render profiles were rendered with the default one
+        profile = result.get("profile", RenderProfiles.default().value)
+        return f"{result['template']}/{result['language']}/{result['lines']}/{profile}"
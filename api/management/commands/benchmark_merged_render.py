@@ -0,0 +1,45 @@
+import copy
+import time
+
+from django.core.management.base import BaseCommand
+from django.template.loader import get_template
+
+from api.utils.render_pool import WARMUP_CONTEXT, _render_job, _render_merged_job
+from api.utils.stylesheets import StylesheetCache
+
+
+class Command(BaseCommand):
+    help = ("Compare the per-invoice cost of one merged multi-invoice PDF "
+            "against rendering every invoice with its own write_pdf() call.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, nargs="+", default=[1, 10, 50, 200],
+                            help="Number of invoices per run")
+        parser.add_argument("--template", default="invoice_template_1_en.html",
+                            help="Template file to render")
+
+    def handle(self, *args, **options):
+        template_name = options["template"]
+        StylesheetCache.load()
+        template = get_template(template_name)
+
+        self.stdout.write(f"{'invoices':>10}{'separate ms/inv':>18}"
+                          f"{'merged ms/inv':>16}{'speedup':>10}")
+        for count in options["count"]:
+            parts = []
+            for number in range(count):
+                context = copy.deepcopy(WARMUP_CONTEXT)
+                context["invoice_number"] = f"{number:014d}"
+                parts.append((template.render(context), template_name))
+
+            start = time.perf_counter()
+            for html, name in parts:
+                _render_job(html, name)
+            separate = (time.perf_counter() - start) * 1000 / count
+
+            start = time.perf_counter()
+            _render_merged_job(parts)
+            merged = (time.perf_counter() - start) * 1000 / count
+
+            self.stdout.write(f"{count:>10}{separate:>18.2f}{merged:>16.2f}"
+                              f"{separate / merged:>9.1f}x")
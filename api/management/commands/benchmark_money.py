@@ -0,0 +1,118 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+from typing import Any, Dict, List, Tuple
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utils.batch_totals import BatchTotals
+from api.utils.invoice_generator import InvoiceService, VATCalculator
+
+
+def _decimal_totals(purposes: List[Dict[str, Any]]) -> Tuple[Decimal, Decimal, list]:
+    """
+    Reference implementation: the per-line Decimal calculation the
+    integer engine replaced.
+    """
+    total_amount = Decimal("0.00")
+    vat_total = Decimal("0.00")
+    lines = []
+    for purpose in purposes:
+        amount = Decimal(str(purpose["amount"]))
+        vat_amount = (amount * VATCalculator.VAT_RATE if purpose["has_vat"]
+                      else Decimal("0.00"))
+        lines.append((round(vat_amount, 2), round(amount + vat_amount, 2)))
+        total_amount += amount + vat_amount
+        vat_total += vat_amount
+    return round(total_amount, 2), round(vat_total, 2), lines
+
+
+def _random_purposes(rng: random.Random, lines: int) -> List[Dict[str, Any]]:
+    """
+    Random purposes, biased towards amounts whose VAT ends in half a
+    minor unit so the rounding rule is exercised.
+    """
+    purposes = []
+    for _ in range(lines):
+        if rng.random() < 0.3:
+            # 0.18 * x ends in exactly half a tetri when x * 18 % 100 == 50
+            minor = rng.choice((25, 75, 125, 175, 225, 275)) + 300 * rng.randrange(1000)
+        else:
+            minor = rng.randrange(0, 10 ** rng.randint(1, 10))
+        purposes.append({"description": "", "amount": Decimal(minor).scaleb(-2),
+                         "has_vat": rng.random() < 0.5})
+    return purposes
+
+
+class Command(BaseCommand):
+    help = ("Check that the batch totals match calculate_totals on random "
+            "invoices, then compare the speed of the Decimal calculation, the "
+            "integer-cents totals and the batch totals. That the integer-cents "
+            "totals equal the Decimal calculation is tested in api/tests.py.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--invoices", type=int, default=2000,
+                            help="Random invoices to total in a batch")
+        parser.add_argument("--lines", type=int, default=100000,
+                            help="Purpose lines of the timed invoice")
+        parser.add_argument("--iterations", type=int, default=5,
+                            help="Timed runs per implementation")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        invoices = {number: _random_purposes(rng, rng.randint(1, 50))
+                    for number in range(options["invoices"])}
+        rows = [(number, purpose["amount"], purpose["has_vat"])
+                for number, purposes in invoices.items() for purpose in purposes]
+        batch = BatchTotals.from_purposes(rows).as_dict()
+        for number, purposes in invoices.items():
+            total, vat = InvoiceService.calculate_totals({"purposes": purposes}, annotate=False)
+            if batch[number] != (total, vat, total - vat):
+                raise CommandError(f"Batch totals of invoice {number} differ: "
+                                   f"expected {total} / {vat}, got {batch[number]}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Batch totals of {len(invoices)} random invoices match calculate_totals"
+        ))
+        loop_ms = self._median(options["iterations"], lambda: [
+            InvoiceService.calculate_totals({"purposes": purposes}, annotate=False)
+            for purposes in invoices.values()
+        ])
+        rows_ms = self._median(options["iterations"],
+                               lambda: BatchTotals.from_purposes(rows).as_dict())
+        columns = ([number for number, _, _ in rows],
+                   [int(amount.scaleb(2)) for _, amount, _ in rows],
+                   [vat_flag for _, _, vat_flag in rows])
+        columns_ms = self._median(options["iterations"],
+                                  lambda: BatchTotals(*columns).as_dict())
+        self.stdout.write(f"{len(invoices)} invoices, {len(rows)} lines: "
+                          f"calculate_totals loop {loop_ms:.1f} ms, "
+                          f"batch from Decimal rows {rows_ms:.1f} ms "
+                          f"({loop_ms / rows_ms:.2f}x), "
+                          f"batch from minor-unit columns {columns_ms:.1f} ms "
+                          f"({loop_ms / columns_ms:.2f}x)")
+
+        purposes = _random_purposes(rng, options["lines"])
+        decimal_ms = self._median(options["iterations"],
+                                  lambda: _decimal_totals(purposes))
+        self.stdout.write(f"{options['lines']} lines: decimal {decimal_ms:.1f} ms")
+        for label, annotate in (("annotated", True), ("totals only", False)):
+            money_ms = self._median(
+                options["iterations"],
+                lambda: InvoiceService.calculate_totals({"purposes": purposes}, annotate)
+            )
+            self.stdout.write(f"{options['lines']} lines: integer cents, {label} "
+                              f"{money_ms:.1f} ms ({decimal_ms / money_ms:.2f}x)")
+
+    @staticmethod
+    def _median(iterations, func):
+        """
+        Median wall time of a callable in milliseconds.
+        """
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
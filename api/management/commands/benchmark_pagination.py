@@ -0,0 +1,121 @@
+import statistics
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.models import Invoice, Payer
+from api.pagination import KeysetPagination
+from api.views import FavouritesViewSet, PayerViewSet
+from user.models import User
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Compare the latency of shallow and deep list pages of payers and "
+            "favourites with keyset pagination against LIMIT/OFFSET, both "
+            "served by the list views. The synthetic rows are created in a "
+            "transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--payers", type=int, default=100000)
+        parser.add_argument("--favourites", type=int, default=100000)
+        parser.add_argument("--page-size", type=int, default=KeysetPagination.page_size)
+        parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100, 1000],
+                            help="Page numbers to time; the last page is always timed")
+        parser.add_argument("--iterations", type=int, default=5,
+                            help="Timed runs per page")
+
+    def handle(self, *args, **options):
+        if options["payers"] < 1 or options["favourites"] < 0:
+            raise CommandError("--payers must be positive and --favourites not negative")
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        tag = uuid.uuid4().hex[:12]
+        user = User.objects.create_user(
+            "Pagination benchmark", f"benchmark-{tag}", f"benchmark-{tag}@pagination.invalid",
+            None, bank_account_number="-", bank_name_ka="-", bank_code="-",
+        )
+        Payer.objects.bulk_create(
+            (Payer(identification_code=f"{number:09d}", name_ka=f"გადამხდელი {number}",
+                   owner=user) for number in range(options["payers"])),
+            batch_size=5000,
+        )
+        payer = Payer.objects.filter(owner=user).first()
+        Invoice.objects.bulk_create(
+            (Invoice(name=f"Favourite {number}", receiver=user, payer=payer, currency="GEL",
+                     invoice_number=f"benchmark-{tag}-{number}")
+             for number in range(options["favourites"])),
+            batch_size=5000,
+        )
+        self.stdout.write(f"{options['payers']} payers and {options['favourites']} "
+                          f"favourites created")
+
+        size = options["page_size"]
+        cases = [("payers", PayerViewSet, Payer.objects.filter(owner=user), options["payers"]),
+                 ("favourites", FavouritesViewSet, Invoice.objects.filter(receiver=user),
+                  options["favourites"])]
+        self.stdout.write(f"{'list':<12}{'page':>8}{'keyset ms':>12}{'offset ms':>12}")
+        # Requests are built for the view directly, not served by a host
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            for name, viewset, queryset, count in cases:
+                last_page = max(1, -(-count // size))
+                ordered = queryset.order_by(*KeysetPagination.ordering)
+                offset_viewset = type(f"Offset{viewset.__name__}", (viewset,), {
+                    "pagination_class": LimitOffsetPagination,
+                    "get_queryset": lambda view, ordered=ordered: ordered,
+                })
+                for page in sorted({*options["pages"], last_page}):
+                    if page > last_page:
+                        continue
+                    offset = (page - 1) * size
+                    # Cursor of the page, as the previous page's next link
+                    cursor = (KeysetPagination.cursor_token(ordered[offset - 1])
+                              if offset else None)
+                    keyset_ms = self._median(options["iterations"], lambda: self._list(
+                        viewset, user, {"cursor": cursor, "page_size": size}
+                    ))
+                    offset_ms = self._median(options["iterations"], lambda: self._list(
+                        offset_viewset, user, {"offset": offset, "limit": size}
+                    ))
+                    self.stdout.write(f"{name:<12}{page:>8}{keyset_ms:>12.2f}{offset_ms:>12.2f}")
+
+    @staticmethod
+    def _list(viewset, user, params):
+        """
+        Serve one list page through the view.
+        """
+        params = {key: value for key, value in params.items() if value is not None}
+        request = APIRequestFactory().get("/", params, secure=True)
+        force_authenticate(request, user=user)
+        response = viewset.as_view({"get": "list"})(request)
+        if response.status_code != 200 or len(response.data["results"]) == 0:
+            raise CommandError(f"Unexpected list response {response.status_code}")
+        response.render()
+        return response
+
+    @staticmethod
+    def _median(iterations, func):
+        """
+        Median wall time of a callable in milliseconds.
+        """
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
@@ -0,0 +1,110 @@
+import json
+import resource
+import tempfile
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.utils.payer_import import PayerImport
+from api.views import PayerViewSet
+from user.models import User
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Import payers from a generated CSV or NDJSON file through the bulk "
+            "import and create the same kind of payers one request at a time, "
+            "reporting rows per second and the peak RSS of the process. A "
+            "second import of the file times the update path. Everything runs "
+            "in a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100000,
+                            help="Rows in the imported file")
+        parser.add_argument("--api-rows", type=int, default=1000,
+                            help="Payers created one request at a time")
+        parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+        parser.add_argument("--batch-size", type=int, default=PayerImport.BATCH_SIZE)
+        parser.add_argument("--invalid-every", type=int, default=100,
+                            help="Make every n-th row invalid, 0 for none")
+
+    def handle(self, *args, **options):
+        if options["rows"] < 1 or options["api_rows"] < 1 or options["batch_size"] < 1:
+            raise CommandError("--rows, --api-rows and --batch-size must be positive")
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        tag = uuid.uuid4().hex[:12]
+        user = User.objects.create_user(
+            "Import benchmark", f"benchmark-{tag}", f"benchmark-{tag}@import.invalid",
+            None, bank_account_number="-", bank_name_ka="-", bank_code="-",
+        )
+        request = APIRequestFactory().post("/", secure=True)
+        request.user = user
+
+        with tempfile.TemporaryFile() as file:
+            self._write_file(file, options)
+            size_mb = file.tell() / 1024 / 1024
+            self.stdout.write(f"{options['rows']} {options['format']} rows, {size_mb:.1f} MB")
+            self.stdout.write(f"{'run':<12}{'seconds':>10}{'rows/s':>12}{'rss MB':>10}"
+                              f"{'created':>10}{'updated':>10}{'failed':>10}")
+            for name in ("import", "reimport"):
+                file.seek(0)
+                start = time.perf_counter()
+                report = PayerImport(request, options["batch_size"]).run(file, options["format"])
+                seconds = time.perf_counter() - start
+                # Stays flat as --rows grows, the file is read line by line
+                peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+                self.stdout.write(
+                    f"{name:<12}{seconds:>10.2f}{report['rows'] / seconds:>12.0f}{peak:>10.1f}"
+                    f"{report['created']:>10}{report['updated']:>10}{report['failed']:>10}"
+                )
+
+        # Requests are built for the view directly, not served by a host
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            create = PayerViewSet.as_view({"post": "create"})
+            start = time.perf_counter()
+            for number in range(options["api_rows"]):
+                request = APIRequestFactory().post(
+                    "/", {"identification_code": f"api-{number}", "name_ka": f"გადამხდელი {number}"},
+                    format="json", secure=True,
+                )
+                force_authenticate(request, user=user)
+                response = create(request)
+                if response.status_code != 201:
+                    raise CommandError(f"Unexpected create response {response.status_code}")
+            seconds = time.perf_counter() - start
+        self.stdout.write(f"{'per-row API':<12}{seconds:>10.2f}"
+                          f"{options['api_rows'] / seconds:>12.0f}")
+
+    @staticmethod
+    def _write_file(file, options):
+        """
+        Write the generated payers, with every n-th row missing its name.
+        """
+        invalid_every = options["invalid_every"]
+        if options["format"] == "csv":
+            file.write(b"identification_code,name_ka,name_en,phone_number\n")
+        for number in range(options["rows"]):
+            name_ka = "" if invalid_every and number % invalid_every == 0 else f"გადამხდელი {number}"
+            if options["format"] == "csv":
+                line = f"{number:09d},{name_ka},Payer {number},+995 555 {number % 1000000:06d}\n"
+            else:
+                line = json.dumps({
+                    "identification_code": f"{number:09d}", "name_ka": name_ka or None,
+                    "name_en": f"Payer {number}", "phone_number": f"+995 555 {number % 1000000:06d}",
+                }, ensure_ascii=False) + "\n"
+            file.write(line.encode("utf-8"))
@@ -0,0 +1,147 @@
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.models import Payer
+from api.views import PayerViewSet
+from user.models import User
+
+
+# Georgian syllables with their transliteration, for names in both scripts
+SYLLABLES = [
+    ("გა", "ga"), ("მა", "ma"), ("ლი", "li"), ("თე", "te"), ("ნო", "no"), ("რი", "ri"),
+    ("სა", "sa"), ("ქარ", "kar"), ("თვე", "tve"), ("ლო", "lo"), ("ბა", "ba"), ("დი", "di"),
+    ("ვე", "ve"), ("ზუ", "zu"), ("ხა", "kha"), ("შვი", "shvi"), ("ძე", "dze"), ("წი", "tsi"),
+    ("ჭა", "cha"), ("ყი", "qi"), ("კო", "ko"), ("პე", "pe"), ("ტუ", "tu"), ("ფო", "po"),
+]
+LEGAL_FORMS = [("შპს", "LLC"), ("სს", "JSC"), ("ი/მ", "IE"), ("ააიპ", "NNLE")]
+
+
+class Command(BaseCommand):
+    help = ("Generate payers with Georgian and English names for one user and time "
+            "the payer search endpoint for prefix, substring, identification code "
+            "and missing queries. The payers are committed, as an index timed "
+            "inside an open transaction is not the one served, and deleted "
+            "afterwards unless --keep is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--payers", type=int, default=100000,
+                            help="Payers of the searching user")
+        parser.add_argument("--other-payers", type=int, default=0,
+                            help="Payers of another user, created first")
+        parser.add_argument("--queries", type=int, default=200,
+                            help="Timed queries per kind")
+        parser.add_argument("--limit", type=int, default=10)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--keep", action="store_true",
+                            help="Commit the generated users and payers")
+
+    def handle(self, *args, **options):
+        if options["payers"] < 1 or options["other_payers"] < 0 or options["queries"] < 1:
+            raise CommandError("--payers and --queries must be positive and "
+                               "--other-payers not negative")
+        rng = random.Random(options["seed"])
+        users = []
+        try:
+            with transaction.atomic():
+                # Older rows of another user come first in the index
+                if options["other_payers"]:
+                    users.append(self._create_payers(rng, options["other_payers"]))
+                users.append(self._create_payers(rng, options["payers"]))
+            self.stdout.write(f"{options['payers']} payers created for {users[-1].email}")
+            self._run(rng, users[-1], options)
+        finally:
+            if not options["keep"]:
+                for user in users:
+                    Payer.objects.filter(owner=user).delete()
+                    user.delete()
+
+    def _run(self, rng, user, options):
+
+        payers = list(Payer.objects.filter(owner=user)
+                      .values_list("name_ka", "name_en", "identification_code"))
+        kinds = {
+            "ka prefix": lambda: self._prefix(rng, rng.choice(payers)[0].split()[-1]),
+            "en prefix": lambda: self._prefix(rng, rng.choice(payers)[1].split()[0]),
+            "ka substring": lambda: self._substring(rng, rng.choice(payers)[0]),
+            "code prefix": lambda: rng.choice(payers)[2][:rng.randint(3, 6)],
+            "exact code": lambda: rng.choice(payers)[2],
+            "legal form": lambda: rng.choice(LEGAL_FORMS)[0],
+            "missing": lambda: "".join(rng.choice("xyzq") for _ in range(5)),
+        }
+        self.stdout.write(f"{'query':<14}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+                          f"{'results':>10}")
+        # Requests are built for the view directly, not served by a host
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            for name, make_query in kinds.items():
+                samples = []
+                results = 0
+                for _ in range(options["queries"]):
+                    query = make_query()
+                    start = time.perf_counter()
+                    results += len(self._search(user, query, options["limit"]))
+                    samples.append((time.perf_counter() - start) * 1000)
+                samples.sort()
+                self.stdout.write(
+                    f"{name:<14}{self._percentile(samples, 50):>10.2f}"
+                    f"{self._percentile(samples, 99):>10.2f}{samples[-1]:>10.2f}"
+                    f"{results / len(samples):>10.1f}"
+                )
+
+    @staticmethod
+    def _create_payers(rng, count):
+        tag = uuid.uuid4().hex[:12]
+        user = User.objects.create_user(
+            "Search benchmark", f"benchmark-{tag}", f"benchmark-{tag}@search.invalid",
+            None, bank_account_number="-", bank_name_ka="-", bank_code="-",
+        )
+        codes = rng.sample(range(10 ** 8, 10 ** 9), count)
+
+        def payer(code):
+            form_ka, form_en = rng.choice(LEGAL_FORMS)
+            words = [[rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))]
+                     for _ in range(rng.randint(1, 2))]
+            name_ka = " ".join("".join(ka for ka, _ in word) for word in words)
+            name_en = " ".join("".join(en for _, en in word).capitalize() for word in words)
+            return Payer(identification_code=str(code), name_ka=f"{form_ka} {name_ka}",
+                         name_en=f"{name_en} {form_en}", owner=user)
+
+        Payer.objects.bulk_create((payer(code) for code in codes), batch_size=5000)
+        return user
+
+    @staticmethod
+    def _prefix(rng, word):
+        return word[:rng.randint(3, max(3, len(word)))]
+
+    @staticmethod
+    def _substring(rng, name):
+        length = rng.randint(3, min(6, len(name)))
+        start = rng.randint(0, len(name) - length)
+        return name[start:start + length]
+
+    @staticmethod
+    def _search(user, query, limit):
+        """
+        Serve one search through the view.
+        """
+        request = APIRequestFactory().get("/", {"q": query, "limit": limit}, secure=True)
+        force_authenticate(request, user=user)
+        response = PayerViewSet.as_view({"get": "search"})(request)
+        if response.status_code != 200:
+            raise CommandError(f"Unexpected search response {response.status_code}")
+        response.render()
+        return response.data["results"]
+
+    @staticmethod
+    def _percentile(samples, percent):
+        """
+        Nearest-rank percentile of sorted samples.
+        """
+        index = max(0, -(-len(samples) * percent // 100) - 1)
+        return samples[index]
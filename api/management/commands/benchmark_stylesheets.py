@@ -0,0 +1,59 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.template.loader import get_template
+from weasyprint import CSS, HTML
+
+from api.utils.invoice_generator import Language, TemplateSelector, TemplateType
+from api.utils.render_pool import WARMUP_CONTEXT
+from api.utils.stylesheets import STYLE_BLOCK_RE, StylesheetCache
+
+
+class Command(BaseCommand):
+    help = ("Compare PDF render time with embedded template CSS against "
+            "precompiled shared stylesheets for every template and language.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20,
+                            help="Renders per template and mode")
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        StylesheetCache.load()
+
+        self.stdout.write(f"{'template':<28}{'css parse ms':>14}"
+                          f"{'embedded ms':>14}{'shared ms':>12}{'saved ms':>12}")
+        for language in Language:
+            for template_type in TemplateType:
+                template_name = TemplateSelector.TEMPLATE_MAPPING[language][template_type]
+                html = get_template(template_name).render(WARMUP_CONTEXT)
+                style_block, _ = StylesheetCache.get(template_name)
+                css = STYLE_BLOCK_RE.search(style_block).group(1)
+                body, stylesheets = StylesheetCache.split(html, template_name)
+                font_config = StylesheetCache.font_config()
+
+                parse = self._median(iterations, lambda: CSS(string=css))
+                embedded = self._median(
+                    iterations, lambda: HTML(string=html).write_pdf()
+                )
+                shared = self._median(
+                    iterations,
+                    lambda: HTML(string=body).write_pdf(stylesheets=stylesheets,
+                                                        font_config=font_config)
+                )
+                self.stdout.write(f"{template_name:<28}{parse:>14.2f}"
+                                  f"{embedded:>14.2f}{shared:>12.2f}"
+                                  f"{embedded - shared:>12.2f}")
+
+    @staticmethod
+    def _median(iterations, func):
+        """
+        Median wall time of a callable in milliseconds.
+        """
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
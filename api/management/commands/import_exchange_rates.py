@@ -0,0 +1,116 @@
+import csv
+import datetime
+import sys
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Tuple
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.choices import CURRENCIES
+from api.models import ExchangeRate
+from api.utils.exchange_rates import ExchangeRates
+
+
+class Command(BaseCommand):
+    help = ("Import National Bank exchange rates from a CSV file with date, "
+            "currency and rate (GEL per one unit) columns. Rates already "
+            "stored for a currency and date are overwritten.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file, or - to read standard input")
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Rows written per query")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        if options["path"] == "-":
+            imported = self._import(sys.stdin, options["batch_size"])
+        else:
+            try:
+                with open(options["path"], newline="", encoding="utf-8-sig") as file:
+                    imported = self._import(file, options["batch_size"])
+            except OSError as e:
+                raise CommandError(f"Cannot read {options['path']}: {e}")
+
+        ExchangeRates.clear()
+        self.stdout.write(self.style.SUCCESS(f"Imported {imported} exchange rates"))
+
+    def _import(self, file, batch_size: int) -> int:
+        """
+        Stream the rows into the database in batches, in one transaction.
+
+        :param file: Open CSV file
+        :param batch_size: Rows written per query
+
+        :return: Number of imported rows
+
+        :raises: CommandError: On the first invalid row
+        """
+        reader = csv.DictReader(file)
+        missing = {"date", "currency", "rate"} - set(reader.fieldnames or ())
+        if missing:
+            raise CommandError(f"Missing columns: {', '.join(sorted(missing))}")
+
+        imported = 0
+        # Keyed by currency and date: a repeated row replaces the earlier
+        # one, as one upsert may not update the same row twice
+        batch: Dict[Tuple[str, datetime.date], ExchangeRate] = {}
+        with transaction.atomic():
+            for row in reader:
+                rate = self._parse(row, reader.line_num)
+                batch[rate.currency, rate.date] = rate
+                if len(batch) >= batch_size:
+                    imported += self._write(list(batch.values()))
+                    batch = {}
+            if batch:
+                imported += self._write(list(batch.values()))
+        return imported
+
+    @staticmethod
+    def _parse(row: dict, line: int) -> ExchangeRate:
+        """
+        Validate one CSV row.
+
+        :param row: CSV row
+        :param line: Line number for error messages
+
+        :return: Unsaved ExchangeRate
+
+        :raises: CommandError: If the row is invalid
+        """
+        currency = (row["currency"] or "").strip().upper()
+        if currency not in dict(CURRENCIES) or currency == ExchangeRates.BASE_CURRENCY:
+            raise CommandError(f"Line {line}: unsupported currency {row['currency']!r}")
+        try:
+            date = datetime.date.fromisoformat((row["date"] or "").strip())
+        except ValueError:
+            raise CommandError(f"Line {line}: invalid date {row['date']!r}, expected YYYY-MM-DD")
+        try:
+            rate = Decimal((row["rate"] or "").strip())
+        except InvalidOperation:
+            raise CommandError(f"Line {line}: invalid rate {row['rate']!r}")
+        field = ExchangeRate._meta.get_field("rate")
+        if (not rate.is_finite() or rate <= 0
+                or rate != round(rate, field.decimal_places)
+                or rate >= 10 ** (field.max_digits - field.decimal_places)):
+            raise CommandError(f"Line {line}: rate {row['rate']!r} must be positive with at "
+                               f"most {field.decimal_places} decimal places")
+        return ExchangeRate(currency=currency, date=date, rate=rate)
+
+    @staticmethod
+    def _write(batch: List[ExchangeRate]) -> int:
+        """
+        Insert a batch, overwriting the rates of existing currency and dates.
+
+        :param batch: Unsaved exchange rates
+
+        :return: Number of written rows
+        """
+        ExchangeRate.objects.bulk_create(
+            batch, update_conflicts=True,
+            unique_fields=["currency", "date"], update_fields=["rate"],
+        )
+        return len(batch)
@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from api.models import GeneratedInvoice, Invoice, Payer
+
+
+# Columns shown for review and filled on the kept payer when it has no value
+COLUMNS = ["name_ka", "name_en", "phone_number"]
+
+
+class Command(BaseCommand):
+    help = ("Merge payers sharing an owner and identification code, which "
+            "migration 0010 requires before the code becomes unique per owner. "
+            "The most recently updated payer of each group is kept unless "
+            "--keep names another; empty columns of the kept payer are filled "
+            "from the merged ones, and their favourites and invoice history "
+            "move to it. Run with --dry-run first to review every group.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only list the groups and what would be merged")
+        parser.add_argument("--keep", type=int, nargs="+", default=[],
+                            help="Ids of payers to keep instead of the most recently updated")
+
+    def handle(self, *args, **options):
+        keep_ids = set(options["keep"])
+        groups = list(Payer.objects.values("owner_id", "identification_code")
+                      .annotate(count=Count("id")).filter(count__gt=1)
+                      .order_by("owner_id", "identification_code"))
+        if not groups:
+            self.stdout.write("No duplicate payers")
+            return
+
+        with transaction.atomic():
+            for group in groups:
+                payers = list(Payer.objects
+                              .filter(owner_id=group["owner_id"],
+                                      identification_code=group["identification_code"])
+                              .order_by("-updated_at", "-id"))
+                chosen = [payer for payer in payers if payer.pk in keep_ids]
+                if len(chosen) > 1:
+                    raise CommandError(f"--keep names several payers of owner "
+                                       f"{group['owner_id']}, identification code "
+                                       f"{group['identification_code']!r}")
+                keep = chosen[0] if chosen else payers[0]
+                merged = [payer for payer in payers if payer.pk != keep.pk]
+                self._report(group, keep, merged)
+                if not options["dry_run"]:
+                    self._merge(keep, merged)
+
+            if options["dry_run"]:
+                self.stdout.write(f"{len(groups)} groups would be merged, nothing was changed")
+                return
+        self.stdout.write(self.style.SUCCESS(f"Merged {len(groups)} groups of payers"))
+
+    def _report(self, group, keep, merged):
+        """
+        Describe a group: the kept payer, the merged ones and what moves.
+        """
+        self.stdout.write(f"Owner {group['owner_id']}, identification code "
+                          f"{group['identification_code']!r}:")
+        for payer in [keep, *merged]:
+            action = "keep " if payer is keep else "merge"
+            values = ", ".join(f"{column}={getattr(payer, column)!r}" for column in COLUMNS)
+            favourites = Invoice.objects.filter(payer=payer).count()
+            history = GeneratedInvoice.objects.filter(payer=payer).count()
+            self.stdout.write(f"  {action} payer {payer.pk} (updated {payer.updated_at:%Y-%m-%d %H:%M}): "
+                              f"{values}; {favourites} favourites, {history} generated invoices")
+
+    @staticmethod
+    def _merge(keep, merged):
+        """
+        Move the favourites and history of merged payers to the kept one and delete them.
+        """
+        ids = [payer.pk for payer in merged]
+        filled = []
+        for column in COLUMNS:
+            if getattr(keep, column):
+                continue
+            value = next((getattr(payer, column) for payer in merged if getattr(payer, column)), None)
+            if value:
+                setattr(keep, column, value)
+                filled.append(column)
+        if filled:
+            keep.save(update_fields=[*filled, "updated_at"])
+        Invoice.objects.filter(payer_id__in=ids).update(payer=keep)
+        GeneratedInvoice.objects.filter(payer_id__in=ids).update(payer=keep)
+        Payer.objects.filter(pk__in=ids).delete()
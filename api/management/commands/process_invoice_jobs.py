@@ -0,0 +1,65 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.utils.invoice_jobs import InvoiceJobRunner
+
+
+class Command(BaseCommand):
+    help = "Drain pending asynchronous invoice generation jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int,
+                            default=settings.INVOICE_JOB_CONCURRENCY,
+                            help="Number of jobs processed at the same time")
+        parser.add_argument("--poll-interval", type=float, default=1.0,
+                            help="Seconds to wait when the queue is empty")
+        parser.add_argument("--stale-after", type=int,
+                            default=settings.INVOICE_JOB_STALE_AFTER,
+                            help="Requeue running jobs older than this many seconds")
+        parser.add_argument("--once", action="store_true",
+                            help="Exit when the queue is empty")
+
+    def handle(self, *args, **options):
+        requeued = InvoiceJobRunner.requeue_stale(options["stale_after"])
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale jobs")
+
+        stop = threading.Event()
+        concurrency = options["concurrency"]
+        self.stdout.write(f"Processing invoice jobs with concurrency {concurrency}")
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            workers = [executor.submit(self._work, stop, options["poll_interval"],
+                                       options["once"])
+                       for _ in range(concurrency)]
+            try:
+                processed = sum(worker.result() for worker in workers)
+            except KeyboardInterrupt:
+                stop.set()
+                processed = sum(worker.result() for worker in workers)
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} jobs"))
+
+    @staticmethod
+    def _work(stop, poll_interval, once):
+        """
+        Claim and process jobs until stopped.
+
+        :return: Number of processed jobs
+        """
+        processed = 0
+        try:
+            while not stop.is_set():
+                job = InvoiceJobRunner.claim_next()
+                if job is None:
+                    if once:
+                        break
+                    stop.wait(poll_interval)
+                    continue
+                InvoiceJobRunner.process(job)
+                processed += 1
+        finally:
+            connection.close()
+        return processed
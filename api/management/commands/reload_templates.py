@@ -0,0 +1,35 @@
+import pathlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utils.template_registry import TemplateRegistry
+
+
+class Command(BaseCommand):
+    help = ("Validate the invoice templates and signal running processes to "
+            "reload them by touching INVOICE_TEMPLATE_RELOAD_FILE.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true",
+                            help="Only validate the templates")
+
+    def handle(self, *args, **options):
+        try:
+            templates = TemplateRegistry.compile()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"{len(templates)} invoice templates are valid")
+
+        if options["check"]:
+            return
+        if not settings.INVOICE_TEMPLATE_RELOAD_FILE:
+            raise CommandError("INVOICE_TEMPLATE_RELOAD_FILE is not set, running "
+                               "processes pick up template changes on restart only")
+
+        pathlib.Path(settings.INVOICE_TEMPLATE_RELOAD_FILE).touch()
+        self.stdout.write(self.style.SUCCESS(
+            f"Reload requested, running processes reload within "
+            f"{TemplateRegistry.RELOAD_CHECK_INTERVAL} seconds"
+        ))
@@ -0,0 +1,49 @@
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from api.exceptions import QueryBudgetExceeded
+from api.utils.query_budget import QueryBudget
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware:
+    """
+    Development-only check of the query budgets views declare in
+    ``query_budgets``.
+
+    With ``INVOICE_QUERY_BUDGET`` set to "log" a request over budget is
+    logged with its queries; with "raise" it fails with
+    ``QueryBudgetExceeded``. The middleware removes itself unless
+    ``DEBUG`` is on.
+    """
+
+    MODES = ("log", "raise")
+
+    def __init__(self, get_response):
+        self.mode = getattr(settings, "INVOICE_QUERY_BUDGET", "")
+        if not settings.DEBUG or self.mode not in self.MODES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.query_budget = None
+        with QueryBudget(0, strict=False) as budget:
+            response = self.get_response(request)
+
+        if request.query_budget is None:
+            return response
+        name, budget.budget = request.query_budget
+        budget.label = f"{request.method} {request.path} ({name})"
+        if budget.exceeded:
+            if self.mode == "raise":
+                raise QueryBudgetExceeded(budget.report())
+            logger.warning(budget.report())
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = QueryBudget.for_view(view_func, request.method)
+        return None
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 19:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_invoicejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FavouritePDF',
+            fields=[
+                ('invoice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pdf_artifact', serialize=False, to='api.invoice')),
+                ('pdf', models.BinaryField()),
+                ('source_updated_at', models.DateTimeField()),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-17 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_favouritepdf'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(choices=[('GEL', 'GEL'), ('USD', 'USD'), ('EUR', 'EUR'), ('GBP', 'GBP')], max_length=4)),
+                ('date', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=4, max_digits=10)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('currency', 'date'), name='unique_exchange_rate_per_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-17 19:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_exchangerate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceNumberSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_number', models.PositiveBigIntegerField(default=1)),
+                ('receiver', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='invoice_number_series', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 19:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_invoicenumberseries'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['receiver', 'created_at', 'id'], name='api_invoice_receive_167505_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payer',
+            index=models.Index(fields=['owner', 'created_at', 'id'], name='api_payer_owner_i_191b59_idx'),
+        ),
+    ]
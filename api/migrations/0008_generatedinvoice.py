@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-17 19:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeneratedInvoice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payer_name', models.CharField(max_length=100)),
+                ('invoice_number', models.CharField(max_length=100)),
+                ('currency', models.CharField(choices=[('GEL', 'GEL'), ('USD', 'USD'), ('EUR', 'EUR'), ('GBP', 'GBP')], max_length=4)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('vat_total', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('language', models.CharField(max_length=2)),
+                ('template', models.CharField(max_length=100)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('size', models.PositiveBigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='generated_invoices', to=settings.AUTH_USER_MODEL)),
+                ('payer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.payer')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', 'created_at', 'id'], name='api_generat_owner_i_4b7ce0_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,103 @@
+from django.db import migrations
+
+
+# PostgreSQL: trigram indexes for the LIKE patterns Django generates for
+# name_ka__icontains, name_en__icontains and identification_code__contains
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS api_payer_name_ka_trgm "
+    "ON api_payer USING gin ((UPPER(name_ka::text)) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS api_payer_name_en_trgm "
+    "ON api_payer USING gin ((UPPER(name_en::text)) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS api_payer_identification_code_trgm "
+    "ON api_payer USING gin (identification_code gin_trgm_ops)",
+]
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS api_payer_name_ka_trgm",
+    "DROP INDEX IF EXISTS api_payer_name_en_trgm",
+    "DROP INDEX IF EXISTS api_payer_identification_code_trgm",
+]
+
+# SQLite: a contentless FTS5 table with the trigram tokenizer (SQLite
+# 3.34+), kept in sync with api_payer by triggers. Its rowid is
+# owner_id << 32 | id, so one owner's payers are a rowid range the
+# search reads without stepping over other owners' matches.
+FTS_ROWID = "({row}.owner_id << 32) + {row}.id"
+FTS_COLUMNS = "name_ka, name_en, identification_code"
+FTS_INSERT = (
+    "INSERT INTO api_payer_fts (rowid, name_ka, name_en, identification_code) "
+    f"VALUES ({FTS_ROWID.format(row='new')}, new.name_ka, new.name_en, new.identification_code);"
+)
+FTS_DELETE = (
+    "INSERT INTO api_payer_fts (api_payer_fts, rowid, name_ka, name_en, identification_code) "
+    f"VALUES ('delete', {FTS_ROWID.format(row='old')}, "
+    "old.name_ka, old.name_en, old.identification_code);"
+)
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS api_payer_fts USING fts5("
+    f"{FTS_COLUMNS}, content='', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS api_payer_fts_insert AFTER INSERT ON api_payer "
+    f"BEGIN {FTS_INSERT} END",
+    "CREATE TRIGGER IF NOT EXISTS api_payer_fts_delete AFTER DELETE ON api_payer "
+    f"BEGIN {FTS_DELETE} END",
+    "CREATE TRIGGER IF NOT EXISTS api_payer_fts_update "
+    f"AFTER UPDATE OF owner_id, {FTS_COLUMNS} ON api_payer "
+    f"BEGIN {FTS_DELETE} {FTS_INSERT} END",
+    # Safe to run again, e.g. after a migration remakes api_payer, which
+    # drops the triggers
+    "INSERT INTO api_payer_fts (api_payer_fts) VALUES ('delete-all')",
+    f"INSERT INTO api_payer_fts (rowid, {FTS_COLUMNS}) "
+    f"SELECT {FTS_ROWID.format(row='api_payer')}, {FTS_COLUMNS} FROM api_payer",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS api_payer_fts_insert",
+    "DROP TRIGGER IF EXISTS api_payer_fts_delete",
+    "DROP TRIGGER IF EXISTS api_payer_fts_update",
+    "DROP TABLE IF EXISTS api_payer_fts",
+]
+
+
+def _sqlite_has_trigram_fts(cursor):
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE temp.api_payer_fts_probe "
+                       "USING fts5(value, tokenize='trigram')")
+    except Exception:
+        return False
+    cursor.execute("DROP TABLE temp.api_payer_fts_probe")
+    return True
+
+
+def _run(statements, schema_editor):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        _run(POSTGRESQL_FORWARD, schema_editor)
+    elif vendor == "sqlite":
+        with schema_editor.connection.cursor() as cursor:
+            if not _sqlite_has_trigram_fts(cursor):
+                # Search falls back to unindexed LIKE matching
+                return
+        _run(SQLITE_FORWARD, schema_editor)
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        _run(POSTGRESQL_BACKWARD, schema_editor)
+    elif vendor == "sqlite":
+        _run(SQLITE_BACKWARD, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_generatedinvoice'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
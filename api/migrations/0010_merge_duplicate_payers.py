@@ -0,0 +1,48 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+# Duplicate groups listed in the error, the rest are counted
+LISTED_DUPLICATES = 20
+
+
+def check_duplicate_payers(apps, schema_editor):
+    """
+    Stop the migration while payers share an owner and identification
+    code, which the next migration makes unique. Nothing is merged here:
+    `manage.py merge_duplicate_payers --dry-run` lists what would be
+    merged and `manage.py merge_duplicate_payers` merges after review.
+    """
+    Payer = apps.get_model("api", "Payer")
+
+    duplicates = list(Payer.objects.values("owner_id", "identification_code")
+                      .annotate(count=Count("id")).filter(count__gt=1)
+                      .order_by("owner_id", "identification_code"))
+    if not duplicates:
+        return
+    lines = [
+        f"owner {group['owner_id']}, identification code {group['identification_code']!r}: "
+        f"{group['count']} payers"
+        for group in duplicates[:LISTED_DUPLICATES]
+    ]
+    if len(duplicates) > LISTED_DUPLICATES:
+        lines.append(f"and {len(duplicates) - LISTED_DUPLICATES} more")
+    raise RuntimeError(
+        f"Identification codes used by several payers of the same owner "
+        f"({len(duplicates)}):\n" + "\n".join(lines) + "\nReview them with `python manage.py "
+        "merge_duplicate_payers --dry-run`, merge them with `python manage.py "
+        "merge_duplicate_payers` and migrate again."
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_payer_search'),
+    ]
+
+    # The unique constraint is added by the next migration, once this one
+    # found no duplicates
+    operations = [
+        migrations.RunPython(check_duplicate_payers, migrations.RunPython.noop),
+    ]
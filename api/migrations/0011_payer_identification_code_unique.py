@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-17 19:41
+
+import importlib
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def restore_search_index(apps, schema_editor):
+    # SQLite adds the constraint by remaking api_payer, which drops the
+    # triggers that keep the payer search index in sync
+    if schema_editor.connection.vendor == "sqlite":
+        payer_search = importlib.import_module("api.migrations.0009_payer_search")
+        payer_search.create_search_indexes(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_merge_duplicate_payers'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Runs after the constraint is removed when migrating backwards
+        migrations.RunPython(migrations.RunPython.noop, restore_search_index),
+        migrations.AddConstraint(
+            model_name='payer',
+            constraint=models.UniqueConstraint(fields=('owner', 'identification_code'), name='api_payer_owner_identification_code_uniq'),
+        ),
+        migrations.RunPython(restore_search_index, migrations.RunPython.noop),
+    ]
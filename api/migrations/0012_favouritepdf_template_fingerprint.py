@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_payer_identification_code_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favouritepdf',
+            name='template_fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
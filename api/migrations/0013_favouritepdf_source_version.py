@@ -0,0 +1,22 @@
+# Generated by Django 5.1.7 on 2026-10-17 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_favouritepdf_template_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='favouritepdf',
+            name='source_updated_at',
+        ),
+        migrations.AddField(
+            model_name='favouritepdf',
+            name='source_version',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+from api.utils.invoice_numbers import InvoiceNumbers
+
+
+def seed_invoice_number_series(apps, schema_editor):
+    """
+    Start every receiver's series after the highest number already issued
+    to it, on favourites or in the history, so new numbers never repeat
+    one that is in use. Numbers of another format, e.g. the timestamps
+    issued before the series existed, are skipped.
+    """
+    Invoice = apps.get_model("api", "Invoice")
+    GeneratedInvoice = apps.get_model("api", "GeneratedInvoice")
+    InvoiceNumberSeries = apps.get_model("api", "InvoiceNumberSeries")
+
+    highest = {}
+    issued = [Invoice.objects.values_list("receiver_id", "invoice_number"),
+              GeneratedInvoice.objects.values_list("owner_id", "invoice_number")]
+    for numbers in issued:
+        for receiver_id, invoice_number in numbers.iterator():
+            number = InvoiceNumbers.parse(invoice_number)
+            if number is not None and number > highest.get(receiver_id, 0):
+                highest[receiver_id] = number
+
+    for receiver_id, number in highest.items():
+        series, created = InvoiceNumberSeries.objects.get_or_create(
+            receiver_id=receiver_id, defaults={"next_number": number + 1}
+        )
+        if not created and series.next_number <= number:
+            series.next_number = number + 1
+            series.save(update_fields=["next_number"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_favouritepdf_source_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_invoice_number_series, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,8 @@
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
-from api.choices import CURRENCIES
+from api.choices import CURRENCIES, JOB_STATUSES
 from user.models import User
 
 
@@ -13,6 +16,15 @@ class Payer(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     owner = models.ForeignKey("user.User", on_delete=models.CASCADE)
 
+    class Meta:
+        # Keyset pagination of a user's payers (api.pagination)
+        indexes = [models.Index(fields=["owner", "created_at", "id"])]
+        # Bulk imports upsert on it (api.utils.payer_import)
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "identification_code"],
+                                    name="api_payer_owner_identification_code_uniq"),
+        ]
+
     def __str__(self):
         return self.name_ka
 
@@ -48,5 +60,93 @@ class Invoice(models.Model):
     should_use_invoice_date_currency_rate = models.BooleanField(default=False)
     template = models.CharField(max_length=100, default="template1")
 
+    class Meta:
+        # Keyset pagination of a user's favourites (api.pagination)
+        indexes = [models.Index(fields=["receiver", "created_at", "id"])]
+
+    def __str__(self):
+        return self.invoice_number
+
+
+class InvoiceNumberSeries(models.Model):
+    receiver = models.OneToOneField("user.User",
+                                    on_delete=models.CASCADE,
+                                    related_name="invoice_number_series")
+    # First number not yet reserved by any process
+    next_number = models.PositiveBigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.receiver_id}: {self.next_number}"
+
+
+class ExchangeRate(models.Model):
+    currency = models.CharField(choices=CURRENCIES, max_length=4)
+    date = models.DateField()
+    # GEL per one unit of the currency, as published by the National Bank
+    rate = models.DecimalField(max_digits=10, decimal_places=4)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["currency", "date"],
+                                    name="unique_exchange_rate_per_day"),
+        ]
+
+    def __str__(self):
+        return f"{self.currency} {self.date}: {self.rate}"
+
+
+class FavouritePDF(models.Model):
+    invoice = models.OneToOneField("Invoice",
+                                   on_delete=models.CASCADE,
+                                   primary_key=True,
+                                   related_name="pdf_artifact")
+    pdf = models.BinaryField()
+    source_version = models.CharField(max_length=64, blank=True, default="")
+    template_fingerprint = models.CharField(max_length=64, blank=True, default="")
+    built_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return str(self.invoice_id)
+
+
+class InvoiceJob(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey("user.User", on_delete=models.CASCADE)
+    status = models.CharField(choices=JOB_STATUSES, max_length=10, default="pending")
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    pdf = models.BinaryField(blank=True, null=True)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self):
+        return str(self.id)
+
+
+class GeneratedInvoice(models.Model):
+    owner = models.ForeignKey("user.User",
+                              on_delete=models.CASCADE,
+                              related_name="generated_invoices")
+    # History outlives the payer; its name is kept below
+    payer = models.ForeignKey("Payer", on_delete=models.SET_NULL, blank=True, null=True)
+    payer_name = models.CharField(max_length=100)
+    invoice_number = models.CharField(max_length=100)
+    currency = models.CharField(choices=CURRENCIES, max_length=4)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2)
+    vat_total = models.DecimalField(max_digits=14, decimal_places=2)
+    language = models.CharField(max_length=2)
+    template = models.CharField(max_length=100)
+    # Hex SHA-256 of the PDF, its address in the blob store
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["owner", "created_at", "id"])]
+
     def __str__(self):
-        return self.invoice_number
\ No newline at end of file
+        return self.invoice_number
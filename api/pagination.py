@@ -0,0 +1,170 @@
+import base64
+import datetime
+import json
+from typing import Any, List, Optional, Tuple
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over ``(created_at, id)``.
+
+    A page is selected with ``WHERE (created_at, id) > cursor ORDER BY
+    created_at, id LIMIT n``, which an index on the owner, ``created_at``
+    and ``id`` answers without skipping rows, so every page costs the
+    same however deep it is. Unlike DRF's ``CursorPagination``, the id
+    is part of the cursor, so rows created in the same microsecond are
+    never paged with an offset.
+
+    The response is ``{"next": url, "previous": url, "results": [...]}``.
+    Cursors are opaque; ``page_size`` picks the page size up to
+    ``max_page_size``.
+    """
+
+    ordering = ("created_at", "id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None) -> Optional[List[Any]]:
+        """
+        Get the page of the request's cursor.
+
+        :param queryset: Queryset to paginate
+        :param request: Request object
+        :param view: View object
+
+        :return: Rows of the page
+
+        :raises: NotFound: If the cursor is malformed
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position, self.reverse = self.decode_cursor(request)
+
+        field, tiebreaker = self.ordering
+        if self.reverse:
+            queryset = queryset.order_by(f"-{field}", f"-{tiebreaker}")
+        else:
+            queryset = queryset.order_by(field, tiebreaker)
+        if position is not None:
+            value, key = position
+            direction = "lt" if self.reverse else "gt"
+            # The plain range condition lets the index seek to the cursor
+            queryset = queryset.filter(
+                Q(**{f"{field}__{direction}e": value}),
+                Q(**{f"{field}__{direction}": value}) | Q(**{f"{tiebreaker}__{direction}": key}),
+            )
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data) -> Response:
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request) -> int:
+        """
+        Page size requested by the client, or the default.
+
+        :param request: Request object
+
+        :return: Page size
+        """
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(requested, 1), self.max_page_size)
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self) -> Optional[str]:
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, row: Any, reverse: bool) -> str:
+        """
+        Build the URL of the page after (or before) a row.
+
+        :param row: Last row of the page, or the first one when going back
+        :param reverse: Whether the cursor pages backwards
+
+        :return: Absolute URL
+        """
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param,
+                                   self.cursor_token(row, reverse))
+
+    @classmethod
+    def cursor_token(cls, row: Any, reverse: bool = False) -> str:
+        """
+        Build the opaque cursor of the page after (or before) a row.
+
+        :param row: Object with the ordering fields as attributes
+        :param reverse: Whether the cursor pages backwards
+
+        :return: URL-safe cursor
+        """
+        field, tiebreaker = cls.ordering
+        position = {"v": getattr(row, field).isoformat(), "k": getattr(row, tiebreaker)}
+        if reverse:
+            position["r"] = 1
+        return base64.urlsafe_b64encode(
+            json.dumps(position, separators=(",", ":")).encode("ascii")
+        ).decode("ascii").rstrip("=")
+
+    def decode_cursor(self, request) -> Tuple[Optional[Tuple[datetime.datetime, int]], bool]:
+        """
+        Read the position of the request's cursor.
+
+        :param request: Request object
+
+        :return: ((created_at, id) or None for the first page, reverse)
+
+        :raises: NotFound: If the cursor is malformed
+        """
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            position = json.loads(raw)
+            value = datetime.datetime.fromisoformat(position["v"])
+            key = int(position["k"])
+            return (value, key), bool(position.get("r"))
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
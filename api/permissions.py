@@ -9,7 +9,8 @@ class IsOwner(permissions.BasePermission):
         return request.user and request.user.is_authenticated
 
     def has_object_permission(self, request, view, obj):
-        return obj.owner == request.user if request.user.is_authenticated else False
+        # Compare ids so the owner is not loaded for every check
+        return obj.owner_id == request.user.pk if request.user.is_authenticated else False
 
 
 class IsCorrectUser(permissions.BasePermission):
@@ -0,0 +1,41 @@
+import io
+from typing import Any
+from xml.sax.saxutils import XMLGenerator
+
+from rest_framework.renderers import BaseRenderer
+
+
+class XMLRenderer(BaseRenderer):
+    """
+    Renders response data (e.g. errors) as XML for clients that only accept XML.
+    """
+    media_type = "application/xml"
+    format = "xml"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        stream = io.StringIO()
+        xml = XMLGenerator(stream, encoding=self.charset)
+        xml.startDocument()
+        xml.startElement("response", {})
+        self._write(xml, data)
+        xml.endElement("response")
+        xml.endDocument()
+        return stream.getvalue().encode(self.charset)
+
+    def _write(self, xml: XMLGenerator, data: Any) -> None:
+        if isinstance(data, dict):
+            for key, value in data.items():
+                xml.startElement(str(key), {})
+                self._write(xml, value)
+                xml.endElement(str(key))
+        elif isinstance(data, (list, tuple)):
+            for item in data:
+                xml.startElement("item", {})
+                self._write(xml, item)
+                xml.endElement("item")
+        elif data is not None:
+            xml.characters(str(data))
@@ -1,9 +1,13 @@
 from django.db import transaction
+from django.urls import reverse
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
 
-from api.models import Payer, Purpose, Invoice
-from api.utils.invoice_generator import InvoiceNumberGenerator
+from api.models import GeneratedInvoice, Payer, Purpose, Invoice, InvoiceJob
+from api.utils.favourite_pdfs import FavouritePDFs
+from api.utils.invoice_generator import InvoiceService
+from api.utils.invoice_numbers import InvoiceNumbers
+from api.utils.render_profiles import RenderProfile
 
 
 class PayerSerializer(serializers.ModelSerializer):
@@ -14,6 +18,14 @@ class PayerSerializer(serializers.ModelSerializer):
     def validate(self, attrs):
         # Add an owner to validated data
         attrs["owner"] = self.context["request"].user
+        code = attrs.get("identification_code")
+        # Bulk imports upsert on the code instead (api.utils.payer_import)
+        if (code is not None and not self.context.get("upsert")
+                and (self.instance is None or code != self.instance.identification_code)
+                and Payer.objects.filter(owner=attrs["owner"], identification_code=code).exists()):
+            raise serializers.ValidationError(
+                {"identification_code": "A payer with this identification code already exists."}
+            )
         return attrs
 
 
@@ -23,8 +35,40 @@ class PurposeSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class PrefetchedPayerField(serializers.PrimaryKeyRelatedField):
+    """
+    Payer primary key field that resolves ids from payers preloaded in
+    ``context["payers"]`` (a dict of id to Payer), falling back to a query
+    of the payers of ``context["owner"]`` or of the requesting user.
+    """
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        owner = self.context.get("owner")
+        if owner is None and "request" in self.context:
+            owner = self.context["request"].user
+        # Never resolve another user's payer
+        return queryset.filter(owner=owner) if owner is not None else queryset.none()
+
+    def to_internal_value(self, data):
+        payers = self.context.get("payers")
+        if payers is None:
+            return super().to_internal_value(data)
+        try:
+            payer = payers.get(int(data))
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if payer is None:
+            self.fail("does_not_exist", pk_value=data)
+        return payer
+
+
 class InvoiceGenerationSerializer(ModelSerializer):
     purposes = PurposeSerializer(many=True)  # Nested serializer
+    payer = PrefetchedPayerField(queryset=Payer.objects.all())
+    # Overrides the user's default render profile for this invoice
+    render_profile = serializers.ChoiceField(
+        choices=[profile.value for profile in RenderProfile], required=False
+    )
 
     class Meta:
         model = Invoice
@@ -85,20 +129,21 @@ class InvoiceFavoriteSerializer(ModelSerializer):
         """
         purposes = validated_data.pop("purposes")
         payer = validated_data.pop("payer")
-        invoice_number = InvoiceNumberGenerator().generate()
-
-        validated_data['invoice_number'] = invoice_number
+        receiver = self.context["request"].user
+        validated_data['invoice_number'] = InvoiceNumbers.next(receiver)
+        validated_data['total_amount'] = self._total_amount(purposes)
 
         invoice = Invoice.objects.create(
-            receiver=self.context["request"].user,
+            receiver=receiver,
             payer=payer,
             **validated_data
         )
         # Bulk create purposes
         purposes_list = [Purpose(
-            invoice=invoice, **purpose
+            invoice=invoice, **self._with_vat_amount(purpose)
         ) for purpose in purposes]
         Purpose.objects.bulk_create(purposes_list)
+        self._schedule_pdf(invoice)
         return invoice
 
     @transaction.atomic
@@ -113,22 +158,58 @@ class InvoiceFavoriteSerializer(ModelSerializer):
         """
         purposes_data = validated_data.pop('purposes', None)
         payer = validated_data.pop('payer', instance.payer)
-        invoice_number = InvoiceNumberGenerator().generate()
-        validated_data['invoice_number'] = invoice_number
+        validated_data['invoice_number'] = InvoiceNumbers.next(instance.receiver)
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.payer = payer
 
         if purposes_data is not None:
+            instance.total_amount = self._total_amount(purposes_data)
             instance.purposes.all().delete()
             purposes_list = [Purpose(
-                invoice=instance, **purpose
+                invoice=instance, **self._with_vat_amount(purpose)
             ) for purpose in purposes_data]
             Purpose.objects.bulk_create(purposes_list)
         instance.save()
+        self._schedule_pdf(instance)
         return instance
 
+    @staticmethod
+    def _total_amount(purposes):
+        """
+        Total amount of the purposes, VAT included.
+
+        :param purposes: Validated purposes
+
+        :return: Total amount
+        """
+        total_amount, _ = InvoiceService.calculate_totals({"purposes": purposes},
+                                                          annotate=False)
+        return total_amount.to_decimal()
+
+    @staticmethod
+    def _with_vat_amount(purpose):
+        """
+        Copy a validated purpose with its VAT amount.
+
+        :param purpose: Validated purpose
+
+        :return: Purpose fields
+        """
+        vat_amount, _ = InvoiceService.line_totals(purpose)
+        return {**purpose, "vat_amount": vat_amount.to_decimal()}
+
+    @staticmethod
+    def _schedule_pdf(invoice):
+        """
+        Build the favourite's PDF in the background once the change is committed.
+
+        :param invoice: Saved favourite invoice
+        """
+        if FavouritePDFs.enabled():
+            transaction.on_commit(lambda: FavouritePDFs.schedule(invoice.id))
+
 
 class InvoiceDisplaySerializer(ModelSerializer):
     purposes = PurposeSerializer(many=True)
@@ -155,3 +236,38 @@ class InvoiceDisplaySerializer(ModelSerializer):
                 f"['template1', 'template2', 'template3', 'template4']"
             )
         return attrs
+
+
+class InvoiceJobSerializer(ModelSerializer):
+    queued_ms = serializers.SerializerMethodField()
+    render_ms = serializers.SerializerMethodField()
+
+    class Meta:
+        model = InvoiceJob
+        fields = ["id", "status", "error", "created_at", "started_at",
+                  "finished_at", "queued_ms", "render_ms"]
+        read_only_fields = fields
+
+    def get_queued_ms(self, obj):
+        if not obj.started_at:
+            return None
+        return int((obj.started_at - obj.created_at).total_seconds() * 1000)
+
+    def get_render_ms(self, obj):
+        if not obj.started_at or not obj.finished_at:
+            return None
+        return int((obj.finished_at - obj.started_at).total_seconds() * 1000)
+
+
+class GeneratedInvoiceSerializer(ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = GeneratedInvoice
+        exclude = ["owner"]
+        read_only_fields = ["payer", "payer_name", "invoice_number", "currency",
+                            "total_amount", "vat_total", "language", "template",
+                            "sha256", "size", "created_at"]
+
+    def get_download_url(self, obj):
+        return reverse("api:generated_invoice-download", args=[obj.pk])
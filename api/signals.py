@@ -0,0 +1,48 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.models import ExchangeRate, Payer
+from api.utils.exchange_rates import ExchangeRates
+from api.utils.favourite_pdfs import FavouritePDFs
+from api.utils.template_registry import templates_reloaded
+from user.models import User
+
+
+@receiver(post_save, sender=Payer)
+def payer_saved(sender, instance, created, **kwargs):
+    """
+    Refresh the favourite PDFs billed to a changed payer.
+    """
+    if not created:
+        transaction.on_commit(lambda: FavouritePDFs.invalidate(payer=instance))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Refresh the favourite PDFs of a user whose invoice details may have changed.
+    """
+    if created:
+        return
+    # Saves of unrelated fields only, e.g. last_login on every login
+    if update_fields is not None and not set(FavouritePDFs.RECEIVER_FIELDS) & set(update_fields):
+        return
+    transaction.on_commit(lambda: FavouritePDFs.invalidate(receiver=instance))
+
+
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def exchange_rate_changed(sender, instance, **kwargs):
+    """
+    Reload the exchange rates of this process on the next lookup.
+    """
+    transaction.on_commit(ExchangeRates.clear)
+
+
+@receiver(templates_reloaded)
+def templates_changed(sender, **kwargs):
+    """
+    Drop the favourite PDFs rendered from the previous templates.
+    """
+    FavouritePDFs.templates_changed()
@@ -1,3 +1,1115 @@
-from django.test import TestCase
+import collections
+import io
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import django
+import pypdfium2
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from PIL import ImageChops, ImageFilter
+from pypdf import PdfReader
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.exceptions import InvoiceGenerationError
+from api.management.commands.benchmark_invoices import _run_case
+from api.models import (FavouritePDF, GeneratedInvoice, Invoice, InvoiceJob,
+                        InvoiceNumberSeries, Payer, Purpose)
+from api.utils.blob_store import BlobStore
+from api.utils.favourite_pdfs import FavouritePDFs
+from api.utils.invoice_generator import InvoiceGenerator, InvoiceService, VATCalculator
+from api.utils.invoice_jobs import InvoiceJobRunner
+from api.utils.invoice_numbers import InvoiceNumbers
+from api.utils.payer_search import PayerSearch
+from api.utils.pdf_cache import PDFCache
+from api.utils.query_budget import QueryBudget
+from api.utils.render_pool import RenderPool
+from api.utils.render_profiles import RenderProfiles
+from api.utils.stamped_renderer import StampedRenderer
+from api.utils.template_registry import TemplateRegistry, templates_reloaded
+from api.views import (FavouritesViewSet, GeneratedInvoiceViewSet, InvoiceJobAPIView,
+                       PayerViewSet, RenderTimingsAPIView, RenderWorkersAPIView)
+from user.models import User
+
+
+def create_user(tag, **fields):
+    """
+    Create a receiver with the required bank details.
+    """
+    return User.objects.create_user(
+        f"მიმღები {tag}", f"receiver-{tag}", f"{tag}@tests.invalid", "password",
+        bank_account_number="GE00TB0000000000000000", bank_name_ka="ბანკი",
+        bank_code="TBCBGE22", **fields,
+    )
+
+
+def invoice_data(payer, **fields):
+    """
+    Validated invoice generation data for a payer.
+    """
+    return {
+        "payer": payer,
+        "currency": "GEL",
+        "language": "en",
+        "template": "template1",
+        "should_use_invoice_date_currency_rate": False,
+        "purposes": [
+            {"description": "Consulting", "amount": Decimal("100.00"), "has_vat": True},
+            {"description": "Travel", "amount": Decimal("25.50"), "has_vat": False},
+        ],
+        **fields,
+    }
+
+
+def create_favourite(user, payer, **fields):
+    """
+    Create a favourite invoice of a user.
+    """
+    fields = {"name": "Monthly", "currency": "GEL", "language": "en",
+              "template": "template1", **fields}
+    return Invoice.objects.create(receiver=user, payer=payer,
+                                  invoice_number=InvoiceNumbers.next(user), **fields)
+
+
+def render_html(html, template_name, profile):
+    """
+    Stand-in for the PDF renderer returning the rendered HTML, so tests
+    can read the invoice number printed on the document.
+    """
+    return html.encode("utf-8")
+
+
+class InvoiceNumbersConcurrencyTests(TransactionTestCase):
+    """
+    Numbers allocated from many threads at once are unique, and
+    contiguous with the gapless policy.
+    """
+
+    THREADS = 8
+    NUMBERS = 25
+
+    def setUp(self):
+        self.receivers = [create_user(f"numbers-{index}") for index in range(2)]
+        InvoiceNumbers.reset()
+
+    def tearDown(self):
+        InvoiceNumbers.reset()
+
+    def _allocate(self):
+        allocated = []
+        errors = []
+
+        def worker(offset):
+            try:
+                for index in range(offset, offset + self.NUMBERS):
+                    receiver = self.receivers[index % len(self.receivers)]
+                    allocated.append((receiver.pk, InvoiceNumbers.next(receiver)))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(offset,))
+                   for offset in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(allocated), self.THREADS * self.NUMBERS)
+        return allocated
+
+    def _assert_unique(self, allocated):
+        duplicates = [number for number, seen in
+                      collections.Counter(number for _, number in allocated).items()
+                      if seen > 1]
+        self.assertEqual(duplicates, [])
+
+    @override_settings(INVOICE_NUMBER_GAP_POLICY="gapless")
+    def test_gapless_numbers_are_unique_and_contiguous(self):
+        allocated = self._allocate()
+        self._assert_unique(allocated)
+        for receiver in self.receivers:
+            numbers = {number for receiver_id, number in allocated if receiver_id == receiver.pk}
+            self.assertEqual(numbers, {InvoiceNumbers.format(receiver, number)
+                                       for number in range(1, len(numbers) + 1)})
+
+    @override_settings(INVOICE_NUMBER_GAP_POLICY="blocks", INVOICE_NUMBER_BLOCK_SIZE=7)
+    def test_block_numbers_are_unique(self):
+        self._assert_unique(self._allocate())
+
+
+@override_settings(INVOICE_NUMBER_GAP_POLICY="gapless", INVOICE_PDF_CACHE_ENABLED=True,
+                   INVOICE_PDF_CACHE_DIR="", INVOICE_RENDER_POOL_ENABLED=False)
+class InvoiceNumberAllocationTests(TestCase):
+    """
+    Invoice numbers are only used up by PDFs that are rendered.
+    """
+
+    def setUp(self):
+        self.user = create_user("allocation")
+        self.payer = Payer.objects.create(owner=self.user, identification_code="123456789",
+                                          name_ka="გადამხდელი", name_en="Payer")
+        cache = mock.patch.object(PDFCache, "_instance", None)
+        cache.start()
+        self.addCleanup(cache.stop)
+
+    def _next_number(self):
+        return InvoiceNumberSeries.objects.get(receiver=self.user).next_number
+
+    def test_cache_hits_do_not_allocate_numbers(self):
+        with mock.patch.object(RenderPool, "render", side_effect=render_html) as render:
+            generated = []
+            for _ in range(3):
+                generator = InvoiceGenerator(invoice_data(self.payer), self.user)
+                generated.append((generator.generate_invoice(),
+                                  generator.invoice_data["invoice_number"]))
+
+        self.assertEqual(render.call_count, 1)
+        number = InvoiceNumbers.format(self.user, 1)
+        for pdf, invoice_number in generated:
+            self.assertEqual(invoice_number, number)
+            self.assertIn(number, pdf.decode("utf-8"))
+        self.assertEqual(self._next_number(), 2)
+
+    def test_failed_render_gives_the_number_back(self):
+        with mock.patch.object(RenderPool, "render", side_effect=RuntimeError("layout failed")):
+            with self.assertRaises(InvoiceGenerationError):
+                InvoiceGenerator(invoice_data(self.payer), self.user).generate_invoice()
+        self.assertFalse(InvoiceNumberSeries.objects.filter(receiver=self.user).exists())
+
+        with mock.patch.object(RenderPool, "render", side_effect=render_html):
+            generator = InvoiceGenerator(invoice_data(self.payer), self.user)
+            pdf = generator.generate_invoice()
+        self.assertEqual(generator.invoice_data["invoice_number"],
+                         InvoiceNumbers.format(self.user, 1))
+        self.assertIn(generator.invoice_data["invoice_number"], pdf.decode("utf-8"))
+        self.assertEqual(self._next_number(), 2)
+
+
+class PDFCacheTests(SimpleTestCase):
+    """
+    Cached PDFs are returned with the invoice number printed on them.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.disk_dir = directory.name
+
+    def test_memory_hit_returns_the_number(self):
+        cache = PDFCache(memory_bytes=1024)
+        cache.set("a" * 64, b"%PDF-1.7 one", "1-000001")
+        self.assertEqual(cache.get("a" * 64), (b"%PDF-1.7 one", "1-000001"))
+        self.assertIsNone(cache.get("b" * 64))
+
+    def test_disk_hit_returns_the_number(self):
+        PDFCache(memory_bytes=1024, disk_dir=self.disk_dir,
+                 disk_bytes=1024).set("a" * 64, b"%PDF-1.7 one", "1-000001")
+        cache = PDFCache(memory_bytes=1024, disk_dir=self.disk_dir, disk_bytes=1024)
+        self.assertEqual(cache.get("a" * 64), (b"%PDF-1.7 one", "1-000001"))
+        self.assertEqual(cache.stats()["hits_disk"], 1)
+
+    def test_disk_file_without_number_is_a_miss(self):
+        path = os.path.join(self.disk_dir, "aa", "a" * 64 + ".pdf")
+        os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as file:
+            file.write(b"%PDF-1.7 written before numbers were kept\n%%EOF")
+        cache = PDFCache(memory_bytes=1024, disk_dir=self.disk_dir, disk_bytes=1024)
+        self.assertIsNone(cache.get("a" * 64))
+        self.assertFalse(os.path.exists(path))
+
+    def test_invoice_number_is_not_part_of_the_key(self):
+        context = {"currency": "GEL", "total_amount": "118.00"}
+        self.assertEqual(
+            PDFCache.make_key({**context, "invoice_number": "1-000001"}, "template"),
+            PDFCache.make_key({**context, "invoice_number": "1-000002"}, "template"),
+        )
+
+
+# Blocks are reserved on a connection of their own, which cannot see the
+# receivers a TestCase creates, so TestCases number invoices gaplessly
+@override_settings(INVOICE_NUMBER_GAP_POLICY="gapless", INVOICE_PDF_CACHE_ENABLED=True,
+                   INVOICE_PDF_CACHE_DIR="", INVOICE_RENDER_POOL_ENABLED=False)
+class InvoiceCachingTests(TestCase):
+    """
+    Identical invoices share the cached PDF and its number; invoices
+    with a number of their own are never cached.
+    """
+
+    def setUp(self):
+        self.user = create_user("caching")
+        self.payer = Payer.objects.create(owner=self.user, identification_code="123456789",
+                                          name_ka="გადამხდელი", name_en="Payer")
+        cache = mock.patch.object(PDFCache, "_instance", None)
+        cache.start()
+        self.addCleanup(cache.stop)
+
+    def test_identical_invoices_share_the_pdf_and_number(self):
+        with mock.patch.object(RenderPool, "render", side_effect=render_html) as render:
+            first = InvoiceGenerator(invoice_data(self.payer), self.user)
+            first_pdf = first.generate_invoice()
+            second = InvoiceGenerator(invoice_data(self.payer), self.user)
+            second_pdf = second.generate_invoice()
+            changed = InvoiceGenerator(invoice_data(self.payer, currency="USD"), self.user)
+            changed_pdf = changed.generate_invoice()
+
+        self.assertEqual(render.call_count, 2)
+        self.assertEqual(second_pdf, first_pdf)
+        self.assertEqual(second.invoice_data["invoice_number"],
+                         first.invoice_data["invoice_number"])
+        self.assertNotEqual(changed.invoice_data["invoice_number"],
+                            first.invoice_data["invoice_number"])
+        self.assertIn(changed.invoice_data["invoice_number"], changed_pdf.decode("utf-8"))
+
+    def test_template_changes_are_not_served_from_the_cache(self):
+        fingerprint = mock.patch.object(TemplateRegistry, "fingerprint", return_value="a" * 64)
+        with mock.patch.object(RenderPool, "render", side_effect=render_html) as render:
+            with fingerprint as patched:
+                InvoiceGenerator(invoice_data(self.payer), self.user).generate_invoice()
+                InvoiceGenerator(invoice_data(self.payer), self.user).generate_invoice()
+                self.assertEqual(render.call_count, 1)
+                # The template was edited and reloaded
+                patched.return_value = "b" * 64
+                InvoiceGenerator(invoice_data(self.payer), self.user).generate_invoice()
+        self.assertEqual(render.call_count, 2)
+
+    def test_numbered_invoices_are_not_cached(self):
+        with mock.patch.object(RenderPool, "render", side_effect=render_html) as render:
+            for invoice_number in ("FAV-1", "FAV-1", "FAV-2"):
+                generator = InvoiceGenerator(
+                    invoice_data(self.payer, invoice_number=invoice_number), self.user
+                )
+                pdf = generator.generate_invoice()
+                self.assertEqual(generator.invoice_data["invoice_number"], invoice_number)
+                self.assertIn(invoice_number, pdf.decode("utf-8"))
+
+        self.assertEqual(render.call_count, 3)
+        self.assertEqual(PDFCache.instance().stats()["memory_entries"], 0)
+        self.assertFalse(InvoiceNumberSeries.objects.filter(receiver=self.user).exists())
+
+
+@override_settings(INVOICE_NUMBER_GAP_POLICY="gapless", INVOICE_PDF_CACHE_ENABLED=True,
+                   INVOICE_PDF_CACHE_DIR="", INVOICE_RENDER_POOL_ENABLED=False,
+                   INVOICE_HISTORY_ENABLED=True)
+class InvoiceHistoryTests(TestCase):
+    """
+    Generated invoices are recorded with the number printed on their PDF.
+    """
+
+    def setUp(self):
+        self.user = create_user("history")
+        self.payer = Payer.objects.create(owner=self.user, identification_code="123456789",
+                                          name_ka="გადამხდელი", name_en="Payer")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.payload = {
+            "payer": self.payer.pk, "currency": "GEL", "language": "en",
+            "template": "template1",
+            "purposes": [{"description": "Consulting", "amount": "100.00", "has_vat": True}],
+        }
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        blob_store = override_settings(INVOICE_BLOB_STORE_DIR=directory.name)
+        blob_store.enable()
+        self.addCleanup(blob_store.disable)
+        for patcher in (mock.patch.object(PDFCache, "_instance", None),
+                        mock.patch.object(RenderPool, "render", side_effect=render_html)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _generate(self, payload):
+        response = self.client.post(reverse("api:generate_invoice"), payload,
+                                    format="json", secure=True)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode("utf-8"), response
+
+    def test_records_the_number_printed_on_the_pdf(self):
+        pdfs = [self._generate(self.payload)[0],
+                self._generate({**self.payload, "currency": "USD"})[0]]
+
+        records = list(GeneratedInvoice.objects.order_by("id"))
+        self.assertEqual(len(records), 2)
+        for pdf, record in zip(pdfs, records):
+            self.assertIn(record.invoice_number, pdf)
+        self.assertEqual(records[1].invoice_number, InvoiceNumbers.format(self.user, 2))
+
+    def test_same_invoice_twice_is_recorded_once(self):
+        first_pdf, first = self._generate(self.payload)
+        # Served the first PDF from the cache, with its number
+        second_pdf, second = self._generate(self.payload)
+
+        self.assertEqual(second_pdf, first_pdf)
+        record = GeneratedInvoice.objects.get(owner=self.user)
+        self.assertIn(record.invoice_number, first_pdf)
+        self.assertEqual(second["Content-Location"], first["Content-Location"])
+
+    def test_records_invoice_jobs(self):
+        job = InvoiceJob.objects.create(owner=self.user, payload=self.payload)
+        InvoiceJobRunner.process(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "done")
+        record = GeneratedInvoice.objects.get(owner=self.user)
+        self.assertEqual(record.invoice_number, InvoiceNumbers.format(self.user, 1))
+        self.assertIn(record.invoice_number, bytes(job.pdf).decode("utf-8"))
+
+
+@override_settings(INVOICE_NUMBER_GAP_POLICY="gapless", INVOICE_RENDER_POOL_ENABLED=False)
+class PayerOwnershipTests(TestCase):
+    """
+    Invoices can only be generated for the receiver's own payers.
+    """
+
+    def setUp(self):
+        self.user = create_user("payer-owner")
+        self.stranger = Payer.objects.create(owner=create_user("payer-stranger"),
+                                             identification_code="987654321",
+                                             name_ka="სხვა", name_en="Stranger")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.payload = {
+            "payer": self.stranger.pk, "currency": "GEL", "language": "en",
+            "template": "template1",
+            "purposes": [{"description": "Consulting", "amount": "100.00", "has_vat": True}],
+        }
+
+    def test_request_names_another_users_payer(self):
+        response = self.client.post(reverse("api:generate_invoice"), self.payload,
+                                    format="json", secure=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("payer", response.json()["error"])
+
+    def test_job_names_another_users_payer(self):
+        job = InvoiceJob.objects.create(owner=self.user, payload=self.payload)
+        with mock.patch.object(RenderPool, "render", side_effect=render_html) as render:
+            InvoiceJobRunner.process(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+        self.assertIn("payer", job.error)
+        render.assert_not_called()
+        self.assertFalse(InvoiceNumberSeries.objects.filter(receiver=self.user).exists())
+
+
+@override_settings(INVOICE_NUMBER_GAP_POLICY="gapless", INVOICE_FAVOURITE_PDF_ENABLED=False)
+class FavouritePDFTemplateTests(TransactionTestCase):
+    """
+    Favourite PDFs of reloaded templates are not served.
+    """
+
+    def setUp(self):
+        self.user = create_user("favourite-templates")
+        self.payer = Payer.objects.create(owner=self.user, identification_code="123456789",
+                                          name_ka="გადამხდელი", name_en="Payer")
+        self.favourite = create_favourite(self.user, self.payer)
+        self.other = create_favourite(self.user, self.payer, template="template2")
+
+    def _store(self, invoice, fingerprint):
+        return FavouritePDF.objects.create(invoice=invoice, pdf=b"%PDF-1.7",
+                                           source_version=FavouritePDFs.source_version(invoice),
+                                           template_fingerprint=fingerprint)
+
+    def test_artifact_of_another_template_source_is_stale(self):
+        current = self._store(self.favourite, FavouritePDFs.template_fingerprint(self.favourite))
+        self.assertTrue(FavouritePDFs.is_fresh(current, self.favourite))
+        current.template_fingerprint = "0" * 64
+        self.assertFalse(FavouritePDFs.is_fresh(current, self.favourite))
+
+    def test_reload_drops_artifacts_of_outdated_templates(self):
+        self._store(self.favourite, "0" * 64)
+        self._store(self.other, FavouritePDFs.template_fingerprint(self.other))
+
+        futures = []
+        templates_changed = FavouritePDFs.templates_changed
+        with mock.patch.object(FavouritePDFs, "templates_changed",
+                               side_effect=lambda: futures.append(templates_changed())):
+            templates_reloaded.send(sender=TemplateRegistry)
+        self.assertEqual([future.result(timeout=10) for future in futures], [1])
+        self.assertEqual(list(FavouritePDF.objects.values_list("invoice_id", flat=True)),
+                         [self.other.pk])
+
+
+@override_settings(INVOICE_NUMBER_GAP_POLICY="gapless", INVOICE_FAVOURITE_PDF_ENABLED=False)
+class FavouritePDFSourceTests(TestCase):
+    """
+    Favourite PDFs go stale when anything printed on them changes,
+    without touching the favourites.
+    """
+
+    def setUp(self):
+        self.user = create_user("favourite-source")
+        self.payer = Payer.objects.create(owner=self.user, identification_code="123456789",
+                                          name_ka="გადამხდელი", name_en="Payer")
+        self.favourite = create_favourite(self.user, self.payer)
+        self.artifact = FavouritePDF.objects.create(
+            invoice=self.favourite, pdf=b"%PDF-1.7",
+            source_version=FavouritePDFs.source_version(self.favourite),
+            template_fingerprint=FavouritePDFs.template_fingerprint(self.favourite),
+        )
+
+    def _is_fresh(self):
+        invoice = Invoice.objects.select_related("payer", "receiver").get(pk=self.favourite.pk)
+        return FavouritePDFs.is_fresh(self.artifact, invoice)
+
+    def test_payer_change_makes_the_pdf_stale(self):
+        self.assertTrue(self._is_fresh())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.payer.name_en = "Renamed payer"
+            self.payer.save()
+        self.assertFalse(self._is_fresh())
+
+    def test_receiver_change_makes_the_pdf_stale(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.bank_account_number = "GE11TB1111111111111111"
+            self.user.save()
+        self.assertFalse(self._is_fresh())
+
+    def test_changes_do_not_touch_the_favourites(self):
+        updated_at = self.favourite.updated_at
+        with self.captureOnCommitCallbacks(execute=True):
+            self.payer.save()
+            self.user.save()
+        self.favourite.refresh_from_db()
+        self.assertEqual(self.favourite.updated_at, updated_at)
+        self.assertTrue(self._is_fresh())
+
+    @override_settings(INVOICE_FAVOURITE_PDF_ENABLED=True)
+    def test_only_stale_pdfs_are_rebuilt(self):
+        with mock.patch.object(FavouritePDFs, "schedule") as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.save()
+                self.payer.save()
+            schedule.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.bank_account_number = "GE11TB1111111111111111"
+                self.user.save()
+            schedule.assert_called_once_with(self.favourite.pk)
+
+
+@override_settings(INVOICE_NUMBER_GAP_POLICY="gapless", INVOICE_FAVOURITE_PDF_ENABLED=False)
+class FavouritePDFErrorTests(TestCase):
+    """
+    Failed and timed out favourite PDF rebuilds are reported as JSON errors.
+    """
+
+    def setUp(self):
+        self.user = create_user("favourite-errors")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.payer = Payer.objects.create(owner=self.user, identification_code="123456789",
+                                          name_ka="გადამხდელი", name_en="Payer")
+        self.favourite = create_favourite(self.user, self.payer)
+        self.url = reverse("api:favourite-pdf", args=[self.favourite.pk])
+
+    @override_settings(INVOICE_RENDER_TIMEOUT=0.01)
+    def test_rebuild_timeout(self):
+        with mock.patch.object(FavouritePDFs, "schedule", return_value=Future()):
+            response = self.client.get(self.url, secure=True)
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("timed out", response.json()["error"])
+
+    def test_rebuild_failure(self):
+        future = Future()
+        future.set_exception(ValueError("broken font"))
+        with mock.patch.object(FavouritePDFs, "schedule", return_value=future):
+            response = self.client.get(self.url, secure=True)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json(), {"error": "Failed to generate PDF: broken font"})
+
+
+@override_settings(INVOICE_NUMBER_GAP_POLICY="gapless", INVOICE_RENDER_POOL_ENABLED=False)
+class MergedInvoiceTests(TestCase):
+    """
+    Merged PDF failures are reported as JSON errors.
+    """
+
+    def setUp(self):
+        self.user = create_user("merged")
+        self.payer = Payer.objects.create(owner=self.user, identification_code="123456789",
+                                          name_ka="გადამხდელი", name_en="Payer")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.payload = [{
+            "payer": self.payer.pk, "currency": "GEL", "language": "en",
+            "template": "template1",
+            "purposes": [{"description": "Consulting", "amount": "100.00", "has_vat": True}],
+        }] * 2
+
+    def test_unexpected_error_is_a_json_500(self):
+        with mock.patch.object(InvoiceGenerator, "generate_merged",
+                               side_effect=KeyError("purposes")):
+            response = self.client.post(reverse("api:generate_invoices_merged"), self.payload,
+                                        format="json", secure=True)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json(), {"error": "'purposes'"})
+
+    def test_failed_render_gives_the_numbers_back(self):
+        with mock.patch.object(RenderPool, "render_merged", side_effect=RuntimeError("layout")):
+            response = self.client.post(reverse("api:generate_invoices_merged"), self.payload,
+                                        format="json", secure=True)
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(InvoiceNumberSeries.objects.filter(receiver=self.user).exists())
+
+    def test_favourites_keep_their_numbers(self):
+        favourites = [create_favourite(self.user, self.payer, name=name)
+                      for name in ("Monthly", "Yearly")]
+        Purpose.objects.create(invoice=favourites[0], description="Consulting",
+                               amount=Decimal("100.00"), has_vat=True)
+        next_number = InvoiceNumberSeries.objects.get(receiver=self.user).next_number
+
+        def render_merged(parts, profile):
+            return "".join(html for html, _ in parts).encode("utf-8")
+
+        with mock.patch.object(RenderPool, "render_merged", side_effect=render_merged):
+            response = self.client.post(reverse("api:generate_invoices_merged"),
+                                        {"favourites": [favourite.pk for favourite in favourites]},
+                                        format="json", secure=True)
+        self.assertEqual(response.status_code, 200)
+        html = b"".join(response.streaming_content if response.streaming
+                        else [response.content]).decode("utf-8")
+        for favourite in favourites:
+            self.assertIn(favourite.invoice_number, html)
+        self.assertEqual(InvoiceNumberSeries.objects.get(receiver=self.user).next_number,
+                         next_number)
+
+
+class MoneyPropertyTests(SimpleTestCase):
+    """
+    Invoice totals in integer minor units equal the per-line Decimal
+    calculation they replaced, on random invoices.
+    """
+
+    SEED = 20250301
+    INVOICES = 2000
+
+    @staticmethod
+    def _decimal_totals(purposes):
+        """
+        Reference implementation: the per-line Decimal calculation.
+        """
+        total_amount = Decimal("0.00")
+        vat_total = Decimal("0.00")
+        lines = []
+        for purpose in purposes:
+            amount = Decimal(str(purpose["amount"]))
+            vat_amount = (amount * VATCalculator.VAT_RATE if purpose["has_vat"]
+                          else Decimal("0.00"))
+            lines.append((round(vat_amount, 2), round(amount + vat_amount, 2)))
+            total_amount += amount + vat_amount
+            vat_total += vat_amount
+        return round(total_amount, 2), round(vat_total, 2), lines
+
+    @staticmethod
+    def _random_purposes(rng):
+        """
+        Random purposes, biased towards amounts whose VAT ends in half a
+        minor unit so the rounding rule is exercised.
+        """
+        purposes = []
+        for _ in range(rng.randint(0, 50)):
+            if rng.random() < 0.3:
+                # 0.18 * x ends in exactly half a tetri when x * 18 % 100 == 50
+                minor = rng.choice((25, 75, 125, 175, 225, 275)) + 300 * rng.randrange(1000)
+            else:
+                minor = rng.randrange(0, 10 ** rng.randint(1, 10))
+            purposes.append({"description": "", "amount": Decimal(minor).scaleb(-2),
+                             "has_vat": rng.random() < 0.5})
+        return purposes
+
+    def test_totals_equal_the_decimal_calculation(self):
+        rng = random.Random(self.SEED)
+        for number in range(self.INVOICES):
+            purposes = self._random_purposes(rng)
+            expected_total, expected_vat, expected_lines = self._decimal_totals(purposes)
+            annotated = [dict(purpose) for purpose in purposes]
+            total, vat = InvoiceService.calculate_totals({"purposes": annotated})
+            with self.subTest(invoice=number, purposes=purposes):
+                # Compared as strings, so "5.00" does not pass for "5"
+                self.assertEqual((str(total), str(vat)),
+                                 (str(expected_total), str(expected_vat)))
+                self.assertEqual(
+                    [(str(purpose["vat_amount"]), str(purpose["total"])) for purpose in annotated],
+                    [(str(vat_amount), str(line_total))
+                     for vat_amount, line_total in expected_lines],
+                )
+                self.assertEqual(
+                    [InvoiceService.line_totals(purpose) for purpose in purposes],
+                    [(purpose["vat_amount"], purpose["total"]) for purpose in annotated],
+                )
+
+
+@override_settings(INVOICE_NUMBER_GAP_POLICY="gapless", INVOICE_FAVOURITE_PDF_ENABLED=False)
+class QueryBudgetTests(TestCase):
+    """
+    Every endpoint stays within the queries its view declares in
+    ``query_budgets``, with several rows to catch per-row queries.
+
+    Requests are authenticated with a JWT, so the user lookup the
+    budgets include is counted.
+    """
+
+    ROWS = 5
+
+    def setUp(self):
+        self.user = create_user("budgets", is_staff=True)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        self.payers = [
+            Payer.objects.create(owner=self.user, identification_code=f"12345678{index}",
+                                 name_ka=f"გადამხდელი {index}", name_en=f"Payer {index}")
+            for index in range(self.ROWS)
+        ]
+        self.favourites = []
+        for payer in self.payers:
+            favourite = create_favourite(self.user, payer)
+            Purpose.objects.bulk_create([
+                Purpose(invoice=favourite, description=f"Line {line}", amount=Decimal("10.00"),
+                        has_vat=True, vat_amount=Decimal("1.80"))
+                for line in range(3)
+            ])
+            self.favourites.append(favourite)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        blob_store = override_settings(INVOICE_BLOB_STORE_DIR=directory.name)
+        blob_store.enable()
+        self.addCleanup(blob_store.disable)
+        digest, size = BlobStore().put(b"%PDF-1.7 history")
+        self.records = [
+            GeneratedInvoice.objects.create(
+                owner=self.user, payer=payer, payer_name=payer.name_ka,
+                invoice_number=InvoiceNumbers.next(self.user), currency="GEL",
+                total_amount=Decimal("118.00"), vat_total=Decimal("18.00"), language="ka",
+                template="template1", sha256=digest, size=size,
+            )
+            for payer in self.payers
+        ]
+
+    def _request(self, view, action, method, url, data=None):
+        """
+        Send a request inside the budget the view declares for the action.
+        """
+        with QueryBudget(view.query_budgets[action], f"{view.__name__}.{action}"):
+            response = getattr(self.client, method)(url, data, format="json", secure=True)
+        self.assertLess(response.status_code, 300, getattr(response, "data", None))
+        return response
+
+    def _favourite_payload(self, payer):
+        return {
+            "name": "Renamed", "payer": payer.pk, "currency": "USD", "language": "en",
+            "template": "template2",
+            "purposes": [{"description": "New line", "amount": "20.00", "has_vat": False}],
+        }
+
+    def test_payers(self):
+        payer = self.payers[0]
+        # Whether the search index exists is looked up once per process
+        PayerSearch._has_fts("default")
+        detail = reverse("api:payer-detail", args=[payer.pk])
+        self._request(PayerViewSet, "list", "get", reverse("api:payer-list"))
+        self._request(PayerViewSet, "retrieve", "get", detail)
+        self._request(PayerViewSet, "search", "get", reverse("api:payer-search"), {"q": "Payer"})
+        self._request(PayerViewSet, "update", "put", detail,
+                      {"identification_code": "987654321", "name_ka": "ახალი"})
+        self._request(PayerViewSet, "partial_update", "patch", detail, {"name_en": "New"})
+        self._request(PayerViewSet, "destroy", "delete", detail)
+
+    def test_favourites(self):
+        favourite = self.favourites[0]
+        detail = reverse("api:favourite-detail", args=[favourite.pk])
+        FavouritePDF.objects.create(
+            invoice=favourite, pdf=b"%PDF-1.7 favourite",
+            source_version=FavouritePDFs.source_version(favourite),
+            template_fingerprint=FavouritePDFs.template_fingerprint(favourite),
+        )
+        self._request(FavouritesViewSet, "list", "get", reverse("api:favourite-list"))
+        self._request(FavouritesViewSet, "retrieve", "get", detail)
+        self._request(FavouritesViewSet, "pdf", "get",
+                      reverse("api:favourite-pdf", args=[favourite.pk]))
+        self._request(FavouritesViewSet, "update", "put", detail,
+                      self._favourite_payload(self.payers[1]))
+        self._request(FavouritesViewSet, "partial_update", "patch", detail,
+                      {"name": "Patched",
+                       "purposes": [{"description": "Patched", "amount": "5.00",
+                                     "has_vat": True}]})
+        self._request(FavouritesViewSet, "destroy", "delete", detail)
+
+    def test_history(self):
+        record = self.records[0]
+        self._request(GeneratedInvoiceViewSet, "list", "get",
+                      reverse("api:generated_invoice-list"))
+        self._request(GeneratedInvoiceViewSet, "retrieve", "get",
+                      reverse("api:generated_invoice-detail", args=[record.pk]))
+        self._request(GeneratedInvoiceViewSet, "download", "get",
+                      reverse("api:generated_invoice-download", args=[record.pk]))
+
+    def test_jobs_and_metrics(self):
+        job = InvoiceJob.objects.create(owner=self.user, payload={})
+        self._request(InvoiceJobAPIView, "get", "get", reverse("api:invoice_job", args=[job.id]))
+        self._request(RenderTimingsAPIView, "get", "get", reverse("api:render_timings"))
+        self._request(RenderWorkersAPIView, "get", "get", reverse("api:render_workers"))
+
+
+@override_settings(INVOICE_FAVOURITE_PDF_ENABLED=False)
+class PayerImportTests(TestCase):
+    """
+    Bulk imports update only the columns a file or row has.
+    """
+
+    def setUp(self):
+        self.user = create_user("import")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.payer = Payer.objects.create(owner=self.user, identification_code="123456789",
+                                          name_ka="ძველი", name_en="Old",
+                                          phone_number="+995 555 000000")
+
+    def _import(self, body, content_type):
+        response = self.client.post(reverse("api:payer-bulk-import"), body,
+                                    content_type=content_type, secure=True)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.payer.refresh_from_db()
+        return response.data
+
+    def test_ndjson_row_without_optional_keys(self):
+        report = self._import('{"identification_code": "123456789", "name_ka": "x"}\n',
+                              "application/x-ndjson")
+        self.assertEqual(report["updated"], 1)
+        self.assertEqual((self.payer.name_ka, self.payer.name_en, self.payer.phone_number),
+                         ("x", "Old", "+995 555 000000"))
+
+    def test_csv_without_optional_columns(self):
+        self._import("identification_code,name_ka\n123456789,x\n", "text/csv")
+        self.assertEqual((self.payer.name_ka, self.payer.name_en, self.payer.phone_number),
+                         ("x", "Old", "+995 555 000000"))
+
+    def test_csv_empty_cell_clears(self):
+        self._import("identification_code,name_ka,name_en\n123456789,x,\n", "text/csv")
+        self.assertEqual((self.payer.name_en, self.payer.phone_number),
+                         (None, "+995 555 000000"))
+
+    def test_duplicate_code_rejected_per_payer(self):
+        response = self.client.post(reverse("api:payer-list"),
+                                    {"identification_code": "123456789", "name_ka": "x"},
+                                    format="json", secure=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("identification_code", response.data)
+
+        other = Payer.objects.create(owner=self.user, identification_code="555555555",
+                                     name_ka="სხვა")
+        detail = reverse("api:payer-detail", args=[other.pk])
+        response = self.client.put(detail, {"identification_code": "123456789", "name_ka": "x"},
+                                   format="json", secure=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("identification_code", response.data)
+        response = self.client.put(detail, {"identification_code": "555555555", "name_ka": "x"},
+                                   format="json", secure=True)
+        self.assertEqual(response.status_code, 200, response.data)
+
+        # Codes are unique per owner only
+        self.client.force_authenticate(create_user("import-other"))
+        response = self.client.post(reverse("api:payer-list"),
+                                    {"identification_code": "123456789", "name_ka": "x"},
+                                    format="json", secure=True)
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_last_row_wins_across_key_sets(self):
+        rows = [
+            {"identification_code": "123456789", "name_ka": "a", "name_en": "A"},
+            {"identification_code": "555555555", "name_ka": "b"},
+            {"identification_code": "123456789", "name_ka": "c"},
+            {"identification_code": "123456789", "name_ka": "d", "phone_number": None},
+        ]
+        report = self._import("".join(json.dumps(row) + "\n" for row in rows),
+                              "application/x-ndjson")
+        self.assertEqual((report["created"], report["failed"]), (1, 0))
+        self.assertEqual((self.payer.name_ka, self.payer.name_en, self.payer.phone_number),
+                         ("d", "A", None))
+
+
+@override_settings(INVOICE_FAVOURITE_PDF_ENABLED=False)
+class DuplicatePayerMigrationTests(TransactionTestCase):
+    """
+    Duplicate payers stop the unique identification code migration until
+    they are merged with the management command.
+    """
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate([("api", "0009_payer_search")])
+        self.user = create_user("duplicates")
+        self.old = Payer.objects.create(owner=self.user, identification_code="123456789",
+                                        name_ka="ძველი", phone_number="+995 555 000000")
+        self.new = Payer.objects.create(owner=self.user, identification_code="123456789",
+                                        name_ka="ახალი")
+        self.favourite = create_favourite(self.user, self.old)
+
+    def tearDown(self):
+        Payer.objects.all().delete()
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes("api"))
+
+    def _migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([("api", "0011_payer_identification_code_unique")])
+
+    def test_migration_names_duplicates(self):
+        with self.assertRaisesMessage(RuntimeError, "identification code '123456789': 2 payers"):
+            self._migrate()
+        self.assertEqual(Payer.objects.count(), 2)
+
+    def test_dry_run_changes_nothing(self):
+        output = io.StringIO()
+        call_command("merge_duplicate_payers", "--dry-run", stdout=output)
+        self.assertIn(f"merge payer {self.old.pk}", output.getvalue())
+        self.assertEqual(Payer.objects.count(), 2)
+
+    def test_merge_then_migrate(self):
+        call_command("merge_duplicate_payers", stdout=io.StringIO())
+        self.assertEqual(list(Payer.objects.values_list("pk", flat=True)), [self.new.pk])
+        self.new.refresh_from_db()
+        # Empty columns of the kept payer are filled from the merged one
+        self.assertEqual((self.new.name_ka, self.new.phone_number), ("ახალი", "+995 555 000000"))
+        self.favourite.refresh_from_db()
+        self.assertEqual(self.favourite.payer_id, self.new.pk)
+        self._migrate()
+
+    def test_keep_another_payer(self):
+        call_command("merge_duplicate_payers", "--keep", str(self.old.pk), stdout=io.StringIO())
+        self.assertEqual(list(Payer.objects.values_list("pk", flat=True)), [self.old.pk])
+
+
+@override_settings(INVOICE_NUMBER_GAP_POLICY="gapless")
+class InvoiceNumberSeedMigrationTests(TransactionTestCase):
+    """
+    Number series start after the numbers already issued to a receiver.
+    """
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate([("api", "0013_favouritepdf_source_version")])
+        self.user = create_user("seed")
+        self.other = create_user("seed-other")
+        payer = Payer.objects.create(owner=self.user, identification_code="123456789",
+                                     name_ka="გადამხდელი")
+        # Issued with the user id format, and before the series existed
+        Invoice.objects.create(receiver=self.user, payer=payer, name="Monthly", currency="GEL",
+                               invoice_number=f"{self.user.pk}-000041")
+        Invoice.objects.create(receiver=self.user, payer=payer, name="Old", currency="GEL",
+                               invoice_number="20251703120000")
+        GeneratedInvoice.objects.create(owner=self.user, payer=payer, payer_name="გადამხდელი",
+                                        invoice_number=f"{self.user.pk}-000057", currency="GEL",
+                                        total_amount=Decimal("1.00"), vat_total=Decimal("0.00"),
+                                        language="ka", template="template1",
+                                        sha256="0" * 64, size=1)
+        InvoiceNumberSeries.objects.create(receiver=self.other, next_number=9)
+        Invoice.objects.create(receiver=self.other, payer=payer, name="Other", currency="GEL",
+                               invoice_number=f"{self.other.pk}-000003")
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes("api"))
+
+    def test_series_start_after_issued_numbers(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([("api", "0014_seed_invoice_number_series")])
+
+        self.assertEqual(InvoiceNumberSeries.objects.get(receiver=self.user).next_number, 58)
+        self.assertEqual(InvoiceNumberSeries.objects.get(receiver=self.other).next_number, 9)
+        self.assertEqual(InvoiceNumbers.next(self.user), f"{self.user.identification_code}-000058")
+
+    def test_parse_skips_other_formats(self):
+        self.assertEqual(InvoiceNumbers.parse("receiver-seed-000012"), 12)
+        self.assertIsNone(InvoiceNumbers.parse("20251703120000"))
+
+
+@override_settings(INVOICE_RENDER_POOL_ENABLED=False, INVOICE_PDF_CACHE_ENABLED=False,
+                   INVOICE_LARGE_INVOICE_LINES=500, INVOICE_LARGE_CHUNK_LINES=200)
+class LargeInvoiceRenderTests(TestCase):
+    """
+    Large invoices are written a chunk at a time and concatenated.
+    """
+
+    # Allowed peak RSS growth from 1 000 to 20 000 lines; laying the
+    # invoice out as one document grows by gigabytes
+    RSS_GROWTH_MB = 128
+
+    def _user(self):
+        return User(receiver_name_ka="მიმღები", identification_code="400000000",
+                    bank_account_number="GE00TB0000000000000000", bank_name_ka="ბანკი",
+                    bank_code="TBCBGE22")
+
+    def _invoice_data(self, lines):
+        payer = Payer(identification_code="405000000", name_ka="გადამხდელი")
+        return {**invoice_data(payer, invoice_number="00000000000001"), "purposes": [
+            {"description": f"Line {number}", "amount": Decimal("10.00"),
+             "has_vat": number % 2 == 0}
+            for number in range(lines)
+        ]}
+
+    def test_chunks_concatenated(self):
+        pdf = InvoiceGenerator(self._invoice_data(1001), self._user()).generate_invoice()
+        # Every chunk starts on a new page
+        self.assertGreaterEqual(len(PdfReader(io.BytesIO(pdf)).pages), 6)
+
+    def test_peak_rss_bounded(self):
+        context = multiprocessing.get_context("spawn")
+        peaks = []
+        for lines in (1000, 20000):
+            # A fresh process per case, as peak RSS never goes down
+            with ProcessPoolExecutor(max_workers=1, mp_context=context,
+                                     initializer=django.setup) as executor:
+                result = executor.submit(_run_case, "template1", "en", lines, 1,
+                                         RenderProfiles.default().value).result()
+            peaks.append(result["peak_rss_mb"])
+        self.assertLess(peaks[1] - peaks[0], self.RSS_GROWTH_MB, peaks)
+
+    @override_settings(INVOICE_RENDER_POOL_ENABLED=True, INVOICE_LARGE_RENDER_TIMEOUT=0.01)
+    def test_large_timeout_removes_files(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(tempfile, "tempdir", directory), \
+                mock.patch.object(RenderPool, "_run_isolated",
+                                  side_effect=InvoiceGenerationError("timed out")):
+            with self.assertRaises(InvoiceGenerationError):
+                RenderPool.render_large({"purposes": []}, "template1.html")
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_large_timeout_stops_only_its_process(self):
+        with mock.patch.object(RenderPool, "start") as start:
+            began = time.perf_counter()
+            with self.assertRaises(InvoiceGenerationError):
+                RenderPool._run_isolated(time.sleep, 60, timeout=5)
+        self.assertLess(time.perf_counter() - began, 30)
+        # The job's process is gone and the shared pool was never touched
+        self.assertEqual(multiprocessing.active_children(), [])
+        start.assert_not_called()
+
+    @override_settings(INVOICE_RENDER_POOL_ENABLED=True, INVOICE_RENDER_TIMEOUT=0.01)
+    def test_pool_timeout_keeps_workers(self):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        worker = mock.Mock()
+        executor = mock.Mock(_processes={worker.pid: worker})
+        executor.submit.return_value = future
+        with mock.patch.object(RenderPool, "start", return_value=executor), \
+                mock.patch.object(RenderPool, "restart") as restart:
+            with self.assertRaises(InvoiceGenerationError):
+                RenderPool.render("<html></html>", "template1.html")
+        # Other requests' jobs on the pool keep running
+        restart.assert_not_called()
+        worker.kill.assert_not_called()
+
+
+@override_settings(INVOICE_RENDER_POOL_ENABLED=False, INVOICE_PDF_CACHE_ENABLED=False,
+                   INVOICE_STAMPED_RENDER_ENABLED=True)
+class StampedRenderTests(TestCase):
+    """
+    Stamped invoices look like their full render, and invoices that
+    cannot be stamped are rendered in full.
+    """
+
+    # Pixels, of the pages rasterized at 144 dpi, allowed to differ after a
+    # blur that evens out kerning: well below one missing or misplaced word
+    DIFFERING_PIXELS = 0.0002
+
+    def setUp(self):
+        StampedRenderer.clear()
+        self.user = User(receiver_name_ka="შპს მიმღები", receiver_name_en="Receiver LLC",
+                         identification_code="400000000", phone_number="+995 555 111 111",
+                         bank_account_number="GE00TB0000000000000000", bank_name_ka="ბანკი",
+                         bank_name_en="Bank", bank_code="TBCBGE22")
+
+    def _invoice_data(self, template, language, name="Payer Company", amount="100.50"):
+        payer = Payer(identification_code="405000000", name_ka="გადამხდელი", name_en=name,
+                      phone_number="+995 599 000 000")
+        return {**invoice_data(payer, invoice_number="INV-000123", currency="USD",
+                               template=template, language=language), "purposes": [
+            {"description": f"Design work {number}", "amount": Decimal(amount),
+             "has_vat": number % 2 == 0}
+            for number in range(3)
+        ], "render_profile": "fast"}
+
+    def _render(self, data):
+        """
+        Render invoice data in full and stamped.
+        """
+        generator = InvoiceGenerator(data, self.user)
+        template = generator._select_template()
+        context = generator._prepare_context()
+        template_name = template.origin.template_name
+        full = RenderPool.render(template.render(context), template_name, "fast")
+        return full, StampedRenderer.render(context, template_name, "fast")
+
+    def _differing(self, pdf, other):
+        """
+        Fraction of pixels that differ between the pages of two PDFs.
+        """
+        pages = [
+            [page.render(scale=2).to_pil().convert("L").filter(ImageFilter.GaussianBlur(1))
+             for page in pypdfium2.PdfDocument(document)]
+            for document in (pdf, other)
+        ]
+        self.assertEqual(len(pages[0]), len(pages[1]))
+        differing = total = 0
+        for image, other_image in zip(*pages):
+            histogram = ImageChops.difference(image, other_image).histogram()
+            differing += sum(histogram[64:])
+            total += image.width * image.height
+        return differing / total
+
+    def test_matches_full_render(self):
+        stamped_templates = []
+        for template in ("template1", "template2", "template3", "template4"):
+            for language in ("en", "ka"):
+                with self.subTest(template=template, language=language):
+                    self._render(self._invoice_data(template, language))
+                    full, stamped = self._render(self._invoice_data(
+                        template, language, name="Other Payer Company", amount="12345.67",
+                    ))
+                    if stamped is None:
+                        continue
+                    stamped_templates.append(template)
+                    self.assertLessEqual(self._differing(full, stamped), self.DIFFERING_PIXELS)
+                    # The comparison sees a value that is not where it should be
+                    other, _ = self._render(self._invoice_data(template, language))
+                    self.assertGreater(self._differing(other, stamped), self.DIFFERING_PIXELS)
+        self.assertTrue(stamped_templates)
+
+    def test_skeleton_reused(self):
+        template = next(
+            template for template in ("template2", "template3", "template4", "template1")
+            if self._render(self._invoice_data(template, "en"))[1] is not None
+        )
+        with mock.patch.object(RenderPool, "render", wraps=RenderPool.render) as render:
+            pdf = InvoiceGenerator(self._invoice_data(template, "en", name="Third Payer"),
+                                   self.user).generate_invoice()
+        render.assert_not_called()
+        reader = PdfReader(io.BytesIO(pdf))
+        self.assertIn("Third Payer", reader.pages[0].extract_text())
+        self.assertIn("INV-000123", reader.metadata.title)
+
+    def test_falls_back_to_full_render(self):
+        data = self._invoice_data("template2", "en")
+        data["purposes"][0]["description"] = "Design work " * 40
+        with mock.patch.object(RenderPool, "render", wraps=RenderPool.render) as render:
+            InvoiceGenerator(data, self.user).generate_invoice()
+        self.assertTrue(render.called)
+
+        generator = InvoiceGenerator(self._invoice_data("template2", "en"), self.user)
+        context = generator._prepare_context()
+        self.assertIsNone(StampedRenderer.render(context, "invoice_template_2_en.html", "compact"))
+        with override_settings(INVOICE_STAMPED_RENDER_ENABLED=False):
+            self.assertIsNone(StampedRenderer.render(context, "invoice_template_2_en.html", "fast"))
@@ -1,6 +1,10 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
-from api.views import PayerViewSet, FavouritesViewSet, GenerateInvoiceAPIView
+from api.views import (PayerViewSet, FavouritesViewSet, GeneratedInvoiceViewSet,
+                       GenerateInvoiceAPIView,
+                       BatchGenerateInvoiceAPIView, MergedInvoiceAPIView,
+                       InvoiceJobAPIView, PreviewInvoiceAPIView,
+                       RenderTimingsAPIView, RenderWorkersAPIView)
 
 app_name = 'api'
 
@@ -8,9 +12,21 @@ router = DefaultRouter()
 
 router.register(r'payers', PayerViewSet, basename='payer')
 router.register(r'favourites', FavouritesViewSet, basename='favourite')
+router.register(r'history', GeneratedInvoiceViewSet, basename='generated_invoice')
 
 urlpatterns = router.urls
 
 urlpatterns += [
     path('generate_invoice/', GenerateInvoiceAPIView.as_view(), name='generate_invoice'),
+    path('generate_invoice/preview/', PreviewInvoiceAPIView.as_view(),
+         name='generate_invoice_preview'),
+    path('generate_invoices/batch/', BatchGenerateInvoiceAPIView.as_view(),
+         name='generate_invoices_batch'),
+    path('generate_invoices/merged/', MergedInvoiceAPIView.as_view(),
+         name='generate_invoices_merged'),
+    path('jobs/<uuid:job_id>/', InvoiceJobAPIView.as_view(), name='invoice_job'),
+    path('metrics/render_timings/', RenderTimingsAPIView.as_view(),
+         name='render_timings'),
+    path('metrics/render_workers/', RenderWorkersAPIView.as_view(),
+         name='render_workers'),
 ]
\ No newline at end of file
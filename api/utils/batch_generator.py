@@ -0,0 +1,120 @@
+import io
+import json
+import logging
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Tuple
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from api.utils.invoice_generator import InvoiceGenerator
+from api.utils.invoice_history import InvoiceHistory
+from api.utils.render_pool import RenderPool
+from user.models import User
+
+
+logger = logging.getLogger(__name__)
+
+
+class _StreamBuffer(io.RawIOBase):
+    """
+    Write-only, unseekable buffer that hands out what was written so far.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class BatchInvoiceGenerator:
+    """
+    Generates many invoices in parallel and streams them as a ZIP archive.
+
+    Only ``concurrency`` invoices are rendered at a time and every PDF is
+    written to the archive and flushed to the client as soon as it
+    completes, so memory stays flat regardless of batch size.
+
+    :param invoices: Validated data of each invoice
+    :param user: User object associated with the invoices
+    """
+
+    def __init__(self, invoices: List[Dict[str, Any]], user: User) -> None:
+        self.invoices = invoices
+        self.user = user
+        self.concurrency = (getattr(settings, "INVOICE_BATCH_CONCURRENCY", 0)
+                            or RenderPool.size())
+
+    def stream_zip(self) -> Iterator[bytes]:
+        """
+        Render every invoice and yield the ZIP archive chunk by chunk.
+
+        Entries are named after the position of the invoice in the
+        request and written in completion order. Failed invoices are
+        listed in an ``errors.json`` entry at the end of the archive.
+
+        :return: Iterator over ZIP archive bytes
+        """
+        buffer = _StreamBuffer()
+        errors = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+                queue = iter(enumerate(self.invoices, start=1))
+                pending = set()
+                for position, invoice_data in queue:
+                    pending.add(executor.submit(self._render, position, invoice_data))
+                    if len(pending) >= self.concurrency:
+                        break
+
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        position, pdf, error = future.result()
+                        if error is None:
+                            archive.writestr(f"invoice_{position:04d}.pdf", pdf)
+                            yield buffer.drain()
+                        else:
+                            errors[position] = error
+                        next_item = next(queue, None)
+                        if next_item is not None:
+                            pending.add(executor.submit(self._render, *next_item))
+
+                if errors:
+                    archive.writestr("errors.json", json.dumps(errors, indent=2))
+        yield buffer.drain()
+        logger.info(f"Batch of {len(self.invoices)} invoices generated "
+                    f"with {len(errors)} failures")
+
+    def _render(self, position: int, invoice_data: Dict[str, Any]) -> Tuple[int, bytes, Any]:
+        """
+        Render one invoice of the batch.
+
+        :param position: 1-based position of the invoice in the batch
+        :param invoice_data: Validated invoice data
+
+        :return: (position, PDF bytes, error message or None)
+        """
+        try:
+            invoice_generator = InvoiceGenerator(invoice_data, self.user)
+            with transaction.atomic():
+                pdf = invoice_generator.generate_invoice()
+                InvoiceHistory.record(invoice_generator.invoice_data, self.user, pdf)
+            return position, pdf, None
+        except Exception as e:
+            logger.exception(f"Batch invoice {position} failed")
+            return position, b"", str(e)
+        finally:
+            # Renders run on executor threads with their own connections
+            connections.close_all()
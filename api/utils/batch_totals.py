@@ -0,0 +1,154 @@
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from django.db.models import BigIntegerField, F
+from django.db.models.functions import Cast, Round
+
+from api.utils.invoice_generator import VATCalculator
+from api.utils.money import Money
+
+
+class BatchTotals:
+    """
+    Totals of many invoices at once from columnar purposes.
+
+    Every purpose is one row of three parallel arrays: invoice id,
+    amount in minor units and VAT flag. Line VAT, line totals and the
+    per-invoice totals are computed with array operations in integer
+    1/denominator minor units (see ``VATMultiplier``) and rounded half to
+    even, so every value is identical to ``InvoiceService.calculate_totals``.
+
+    Arrays are int64 while the totals fit, and Python integers otherwise.
+
+    :param invoice_ids: Invoice id of every purpose
+    :param amounts: Amount of every purpose in minor units
+    :param has_vat: VAT flag of every purpose
+    """
+
+    def __init__(self, invoice_ids: Iterable[int], amounts: Iterable[int],
+                 has_vat: Iterable[bool]) -> None:
+        multiplier = VATCalculator.MULTIPLIER
+        self.invoice_ids = np.asarray(invoice_ids, dtype=np.int64)
+        self.amounts = self._amounts(amounts, multiplier.gross_numerator)
+        self.has_vat = np.asarray(has_vat, dtype=bool)
+        dtype = self.amounts.dtype
+        if not len(self.invoice_ids) == len(self.amounts) == len(self.has_vat):
+            raise ValueError("Purpose columns must have the same length")
+
+        denominator = multiplier.denominator
+        # Exact line amounts in 1/denominator minor units
+        vat = np.where(self.has_vat, self.amounts * multiplier.numerator, 0).astype(dtype)
+        gross = self.amounts * denominator + vat
+        self.line_vat = self._round(vat)
+        self.line_totals = self._round(gross)
+
+        # Sum every invoice's exact amounts, then round once
+        self.ids, inverse = np.unique(self.invoice_ids, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        starts = np.searchsorted(inverse[order], np.arange(len(self.ids)))
+        if len(order):
+            self.total_amounts = self._round(np.add.reduceat(gross[order], starts))
+            self.vat_totals = self._round(np.add.reduceat(vat[order], starts))
+        else:
+            self.total_amounts = self.vat_totals = np.zeros(0, dtype=dtype)
+        self.net_totals = self.total_amounts - self.vat_totals
+
+    @classmethod
+    def from_purposes(cls, purposes: Iterable[Tuple[int, Any, bool]]) -> "BatchTotals":
+        """
+        Build the columns from (invoice id, amount, has_vat) rows, e.g. a
+        ``values_list`` of purposes.
+
+        :param purposes: Rows with Decimal, string or int amounts in major units
+
+        :return: BatchTotals
+        """
+        invoice_ids, amounts, has_vat = [], [], []
+        for invoice_id, amount, vat_flag in purposes:
+            invoice_ids.append(invoice_id)
+            amounts.append(Money.minor_units(amount))
+            has_vat.append(bool(vat_flag))
+        return cls(invoice_ids, amounts, has_vat)
+
+    @classmethod
+    def for_invoices(cls, invoices: Any) -> Dict[int, Tuple[Money, Money, Money]]:
+        """
+        Total invoices of a queryset with two queries, converting amounts
+        to minor units in the database.
+
+        Invoices without purposes total zero, like ``calculate_totals``.
+
+        :param invoices: Invoice queryset
+
+        :return: Invoice id to (total amount, VAT total, total without VAT)
+        """
+        from api.models import Purpose
+
+        currencies = dict(invoices.values_list("id", "currency"))
+        rows = Purpose.objects.filter(invoice__in=invoices).values_list(
+            "invoice_id",
+            # Minor units from the database, rounded before the cast
+            # because SQLite stores decimals as floating point
+            Cast(Round(F("amount") * Money.SCALE), BigIntegerField()),
+            "has_vat",
+        )
+        invoice_ids, amounts, has_vat = zip(*rows) if rows else ((), (), ())
+        totals = cls(invoice_ids, amounts, has_vat).as_dict(currencies)
+        for invoice_id, currency in currencies.items():
+            totals.setdefault(invoice_id, (Money(0, currency),) * 3)
+        return totals
+
+    def as_dict(self, currencies: Optional[Dict[int, str]] = None
+                ) -> Dict[int, Tuple[Money, Money, Money]]:
+        """
+        Per-invoice totals as Money.
+
+        :param currencies: Invoice id to currency code
+
+        :return: Invoice id to (total amount, VAT total, total without VAT)
+        """
+        currencies = currencies or {}
+        totals = {}
+        for invoice_id, total, vat, net in zip(self.ids.tolist(), self.total_amounts.tolist(),
+                                               self.vat_totals.tolist(), self.net_totals.tolist()):
+            currency = currencies.get(invoice_id, "")
+            totals[invoice_id] = (Money(total, currency), Money(vat, currency),
+                                  Money(net, currency))
+        return totals
+
+    @staticmethod
+    def _amounts(amounts: Iterable[int], gross_numerator: int) -> np.ndarray:
+        """
+        Amounts as int64 if no exact sum can overflow it, else as Python integers.
+
+        :param amounts: Amounts in minor units
+        :param gross_numerator: Largest multiplier applied to an amount
+
+        :return: Amounts array
+        """
+        if not isinstance(amounts, np.ndarray):
+            amounts = list(amounts)
+        try:
+            array = np.asarray(amounts, dtype=np.int64)
+        except OverflowError:
+            return np.asarray(amounts, dtype=object)
+        if len(array) and int(np.abs(array).max()) * len(array) * gross_numerator >= 2 ** 63:
+            return np.asarray(amounts, dtype=object)
+        return array
+
+    @staticmethod
+    def _round(numerators: np.ndarray) -> np.ndarray:
+        """
+        Round exact amounts to minor units, half to even.
+
+        :param numerators: Amounts in 1/denominator minor units
+
+        :return: Amounts in minor units
+        """
+        denominator = VATCalculator.MULTIPLIER.denominator
+        # Floor division and modulo rather than np.divmod, which has no object loop
+        quotients = numerators // denominator
+        remainders = numerators % denominator
+        twice = remainders * 2
+        round_up = (twice > denominator) | ((twice == denominator) & (quotients % 2 == 1))
+        return quotients + round_up.astype(quotients.dtype)
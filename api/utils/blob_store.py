@@ -0,0 +1,116 @@
+import hashlib
+import logging
+import os
+import pathlib
+import tempfile
+from typing import BinaryIO, Tuple, Union
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+    """
+    Content-addressed store of PDFs on the local disk.
+
+    A blob is stored once under the hex SHA-256 of its bytes, in two
+    levels of directories named after the first hash characters
+    (``ab/cd/abcd...pdf``) so no directory grows too large. Identical
+    PDFs share one file. Blobs are written to a temporary file in the
+    target directory and renamed into place, so readers never see a
+    partial blob and concurrent writers of the same content are safe.
+
+    :param root: Store directory, ``INVOICE_BLOB_STORE_DIR`` by default
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+    EXTENSION = ".pdf"
+
+    def __init__(self, root: Union[str, os.PathLike, None] = None) -> None:
+        self.root = pathlib.Path(root or settings.INVOICE_BLOB_STORE_DIR)
+
+    def relative_path(self, digest: str) -> str:
+        """
+        Path of a blob relative to the store root.
+
+        :param digest: Hex SHA-256 of the blob
+
+        :return: e.g. "ab/cd/abcd....pdf"
+
+        :raises: ValueError: If the digest is not a hex SHA-256
+        """
+        if len(digest) != 64 or any(char not in "0123456789abcdef" for char in digest):
+            raise ValueError(f"Invalid blob digest {digest!r}")
+        return f"{digest[:2]}/{digest[2:4]}/{digest}{self.EXTENSION}"
+
+    def path(self, digest: str) -> pathlib.Path:
+        """
+        Absolute path of a blob.
+
+        :param digest: Hex SHA-256 of the blob
+
+        :return: Path, which exists once the blob is stored
+        """
+        return self.root / self.relative_path(digest)
+
+    def put(self, content: Union[bytes, BinaryIO]) -> Tuple[str, int]:
+        """
+        Store a blob unless the same content is already stored.
+
+        File objects are read in chunks from their current position and
+        rewound to it afterwards, so they can still be sent.
+
+        :param content: PDF bytes or a binary file object
+
+        :return: (hex SHA-256, size in bytes)
+        """
+        if isinstance(content, bytes):
+            digest = hashlib.sha256(content).hexdigest()
+            if not self.path(digest).exists():
+                self._write(digest, lambda file: file.write(content))
+            return digest, len(content)
+
+        start = content.tell()
+        sha256 = hashlib.sha256()
+        size = 0
+        for chunk in iter(lambda: content.read(self.CHUNK_SIZE), b""):
+            sha256.update(chunk)
+            size += len(chunk)
+        digest = sha256.hexdigest()
+        if not self.path(digest).exists():
+            content.seek(start)
+            self._write(digest, lambda file: self._copy(content, file))
+        content.seek(start)
+        return digest, size
+
+    def open(self, digest: str) -> BinaryIO:
+        """
+        Open a stored blob for reading.
+
+        :param digest: Hex SHA-256 of the blob
+
+        :return: Binary file object
+
+        :raises: FileNotFoundError: If the blob is not stored
+        """
+        return open(self.path(digest), "rb")
+
+    def _write(self, digest: str, write) -> None:
+        target = self.path(digest)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=target.parent, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                write(file)
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, target)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        logger.info(f"Stored blob {digest}")
+
+    def _copy(self, source: BinaryIO, target: BinaryIO) -> None:
+        for chunk in iter(lambda: source.read(self.CHUNK_SIZE), b""):
+            target.write(chunk)
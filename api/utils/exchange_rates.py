@@ -0,0 +1,110 @@
+import bisect
+import datetime
+import logging
+import threading
+import time
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from api.utils.money import Money
+
+
+logger = logging.getLogger(__name__)
+
+
+class ExchangeRates:
+    """
+    Per-process cache of the GEL exchange rates, indexed by date.
+
+    All rates are loaded with one query on the first lookup and kept as
+    a sorted list of date ordinals and a parallel list of rates per
+    currency, so "the rate on or before a date" is a binary search with
+    no database query. The cache is reloaded after
+    ``INVOICE_EXCHANGE_RATE_CACHE_TTL`` seconds to pick up rates
+    imported by other processes, and cleared when a rate is saved or
+    deleted in this one.
+    """
+
+    BASE_CURRENCY = "GEL"
+
+    _dates: Dict[str, List[int]] = {}
+    _rates: Dict[str, List[Decimal]] = {}
+    _loaded_at: Optional[float] = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def load(cls) -> None:
+        """
+        Load every exchange rate into the cache.
+        """
+        from api.models import ExchangeRate
+
+        dates: Dict[str, List[int]] = {}
+        rates: Dict[str, List[Decimal]] = {}
+        rows = (ExchangeRate.objects.order_by("currency", "date")
+                .values_list("currency", "date", "rate"))
+        for currency, date, rate in rows.iterator():
+            dates.setdefault(currency, []).append(date.toordinal())
+            rates.setdefault(currency, []).append(rate)
+
+        with cls._lock:
+            cls._dates, cls._rates = dates, rates
+            cls._loaded_at = time.monotonic()
+        logger.info(f"Loaded exchange rates of {len(dates)} currencies")
+
+    @classmethod
+    def clear(cls) -> None:
+        """
+        Drop the cached rates; the next lookup reloads them.
+        """
+        with cls._lock:
+            cls._loaded_at = None
+
+    @classmethod
+    def rate_on(cls, currency: str, date: datetime.date) -> Optional[Tuple[Decimal, datetime.date]]:
+        """
+        Get the latest rate published on or before a date.
+
+        :param currency: ISO 4217 currency code
+        :param date: Date of the conversion
+
+        :return: (GEL per unit, date of the rate) or None if there is no such rate
+        """
+        cls._ensure_loaded()
+        dates = cls._dates.get(currency)
+        if not dates:
+            return None
+        index = bisect.bisect_right(dates, date.toordinal()) - 1
+        if index < 0:
+            return None
+        return cls._rates[currency][index], datetime.date.fromordinal(dates[index])
+
+    @classmethod
+    def to_gel(cls, amount: Money, date: datetime.date) -> Optional[Tuple[Money, Decimal, datetime.date]]:
+        """
+        Convert an amount to GEL at the rate on or before a date.
+
+        The converted amount is rounded half to even to the tetri, like
+        every other amount (see ``Money``).
+
+        :param amount: Amount in its currency
+        :param date: Date of the conversion
+
+        :return: (amount in GEL, rate, date of the rate) or None if there is no rate
+        """
+        found = cls.rate_on(amount.currency, date)
+        if found is None:
+            return None
+        rate, rate_date = found
+        numerator, denominator = rate.as_integer_ratio()
+        gel = Money.from_ratio(amount.minor * numerator, denominator, cls.BASE_CURRENCY)
+        return gel, rate, rate_date
+
+    @classmethod
+    def _ensure_loaded(cls) -> None:
+        loaded_at = cls._loaded_at
+        ttl = getattr(settings, "INVOICE_EXCHANGE_RATE_CACHE_TTL", 3600)
+        if loaded_at is None or time.monotonic() - loaded_at > ttl:
+            cls.load()
@@ -0,0 +1,265 @@
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from api.exceptions import InvoiceGenerationError, LanguageNotSupportedError
+from api.models import FavouritePDF, Invoice
+from api.utils.invoice_generator import InvoiceGenerator, InvoiceService, TemplateSelector
+from api.utils.template_registry import TemplateRegistry
+
+
+logger = logging.getLogger(__name__)
+
+
+class FavouritePDFs:
+    """
+    Pre-rendered PDFs of favourite invoices.
+
+    An artifact is built in the background whenever a favourite, its
+    payer or its owner's profile changes, and is fresh while its source
+    version (see ``source_version``) and template source are current and
+    it was built on the current day (the PDF carries the issue date).
+    Stale or missing artifacts are rebuilt on request. Artifacts of an
+    outdated template are deleted, and rebuilt, when the templates are
+    reloaded.
+
+    Builds are single-flight per process: concurrent requests and
+    background builds of the same favourite share one render.
+    """
+
+    # Payer and receiver fields printed on invoices
+    PAYER_FIELDS = ("identification_code", "name_ka", "name_en", "phone_number")
+    RECEIVER_FIELDS = (
+        "receiver_name_ka", "receiver_name_en", "identification_code", "phone_number",
+        "bank_account_number", "bank_name_en", "bank_name_ka", "bank_code", "render_profile",
+    )
+
+    _executor: Optional[ThreadPoolExecutor] = None
+    _inflight: Dict[int, Future] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def enabled() -> bool:
+        """
+        Check whether artifacts are built in the background after changes.
+
+        :return: True if background builds are enabled in settings
+        """
+        return getattr(settings, "INVOICE_FAVOURITE_PDF_ENABLED", False)
+
+    @classmethod
+    def schedule(cls, invoice_id: int) -> Future:
+        """
+        Build the artifact of a favourite in the background.
+
+        :param invoice_id: Favourite invoice id
+
+        :return: Future resolving to the PDF bytes
+        """
+        with cls._lock:
+            future = cls._inflight.get(invoice_id)
+            if future is None:
+                future = cls._get_executor().submit(cls._build, invoice_id)
+                cls._inflight[invoice_id] = future
+                future.add_done_callback(lambda done: cls._forget(invoice_id, done))
+            return future
+
+    @classmethod
+    def get(cls, invoice: Invoice) -> bytes:
+        """
+        Get the PDF of a favourite, rebuilding it first if it is stale.
+
+        :param invoice: Favourite invoice
+
+        :return: PDF bytes
+
+        :raises:
+            InvoiceGenerationError: If PDF generation fails
+            LanguageNotSupportedError: If the language is not supported
+        """
+        artifact = FavouritePDF.objects.filter(invoice=invoice).first()
+        if artifact is not None and cls.is_fresh(artifact, invoice):
+            return bytes(artifact.pdf)
+
+        logger.info(f"Favourite {invoice.id} PDF is stale, rebuilding")
+        timeout = getattr(settings, "INVOICE_RENDER_TIMEOUT", 60)
+        try:
+            return cls.schedule(invoice.id).result(timeout=timeout)
+        except (InvoiceGenerationError, LanguageNotSupportedError):
+            raise
+        except FutureTimeoutError:
+            # The build goes on and stores the artifact for the next request
+            raise InvoiceGenerationError(f"Favourite PDF rebuild timed out after {timeout}s")
+        except Exception as e:
+            raise InvoiceGenerationError(f"Failed to generate PDF: {str(e)}")
+
+    @classmethod
+    def is_fresh(cls, artifact: FavouritePDF, invoice: Invoice) -> bool:
+        """
+        Check whether an artifact matches the favourite's current state,
+        template and date.
+
+        :param artifact: Stored artifact
+        :param invoice: Favourite invoice
+
+        :return: True if the artifact can be served
+        """
+        return (artifact.source_version == cls.source_version(invoice)
+                and artifact.template_fingerprint == cls.template_fingerprint(invoice)
+                and timezone.localdate(artifact.built_at) == timezone.localdate())
+
+    @classmethod
+    def source_version(cls, invoice: Invoice) -> str:
+        """
+        Hash of what a favourite's PDF is rendered from: the favourite's
+        last change and the payer and receiver fields printed on it.
+
+        :param invoice: Favourite invoice with its payer and receiver
+
+        :return: Hex SHA-256 digest
+        """
+        source = [invoice.updated_at.isoformat()]
+        source += [getattr(invoice.payer, field) for field in cls.PAYER_FIELDS]
+        source += [getattr(invoice.receiver, field) for field in cls.RECEIVER_FIELDS]
+        payload = json.dumps(source, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def template_fingerprint(invoice: Invoice) -> str:
+        """
+        Fingerprint of the template source a favourite is rendered with.
+
+        :param invoice: Favourite invoice
+
+        :return: Hex SHA-256 digest, empty if the favourite has no valid template
+        """
+        try:
+            template = TemplateSelector.get_template(invoice.language, invoice.template)
+        except Exception:
+            return ""
+        if template is None:
+            return ""
+        return TemplateRegistry.fingerprint(template.origin.template_name)
+
+    @classmethod
+    def templates_changed(cls) -> Future:
+        """
+        Drop the artifacts rendered from templates that are no longer
+        loaded, in the background.
+
+        :return: Future resolving to the number of dropped artifacts
+        """
+        with cls._lock:
+            return cls._get_executor().submit(cls._drop_outdated)
+
+    @classmethod
+    def invalidate(cls, **filters) -> None:
+        """
+        Rebuild the artifacts of changed favourites in the background.
+
+        The favourites themselves are not touched: a change of their payer
+        or receiver changes their source version, which already makes the
+        artifacts stale. Favourites whose artifacts are still fresh, e.g.
+        after a save that changed nothing printed on them, are skipped.
+
+        :param filters: Invoice queryset filters, e.g. payer=payer
+        """
+        if not cls.enabled():
+            return
+        invoices = (Invoice.objects.filter(**filters)
+                    .select_related("payer", "receiver", "pdf_artifact"))
+        for invoice in invoices:
+            artifact = getattr(invoice, "pdf_artifact", None)
+            if artifact is not None and cls.is_fresh(artifact, invoice):
+                continue
+            cls.schedule(invoice.id)
+
+    @classmethod
+    def _build(cls, invoice_id: int) -> bytes:
+        """
+        Render a favourite and store the artifact, unless the stored one
+        is already fresh (another process may have rebuilt it meanwhile).
+
+        :param invoice_id: Favourite invoice id
+
+        :return: PDF bytes
+        """
+        try:
+            invoice = (Invoice.objects
+                       .select_related("payer", "receiver", "pdf_artifact")
+                       .prefetch_related("purposes")
+                       .get(pk=invoice_id))
+            artifact = getattr(invoice, "pdf_artifact", None)
+            if artifact is not None and cls.is_fresh(artifact, invoice):
+                return bytes(artifact.pdf)
+            invoice_data = InvoiceService.invoice_data_from_favourite(invoice)
+            source_version = cls.source_version(invoice)
+            fingerprint = cls.template_fingerprint(invoice)
+            pdf = InvoiceGenerator(invoice_data, invoice.receiver).generate_invoice()
+            FavouritePDF.objects.update_or_create(
+                invoice=invoice,
+                defaults={"pdf": pdf, "source_version": source_version,
+                          "template_fingerprint": fingerprint},
+            )
+            logger.info(f"Favourite {invoice_id} PDF built")
+            return pdf
+        except Exception:
+            logger.exception(f"Favourite {invoice_id} PDF build failed")
+            raise
+        finally:
+            # Builds run on executor threads with their own connections
+            connections.close_all()
+
+    @classmethod
+    def _drop_outdated(cls) -> int:
+        """
+        Delete the artifacts of outdated templates and rebuild them if
+        background builds are enabled.
+
+        Every process reloading the templates runs this; artifacts
+        rebuilt by another process meanwhile carry a current fingerprint
+        and are kept.
+
+        :return: Number of deleted artifacts
+        """
+        try:
+            current = {TemplateRegistry.fingerprint(template_name)
+                       for mapping in TemplateSelector.TEMPLATE_MAPPING.values()
+                       for template_name in mapping.values()}
+            artifacts = FavouritePDF.objects.exclude(template_fingerprint__in=current)
+            outdated = list(artifacts.values_list("invoice_id", flat=True))
+            artifacts.filter(invoice_id__in=outdated).delete()
+            logger.info(f"Dropped {len(outdated)} favourite PDFs of outdated templates")
+        except Exception:
+            logger.exception("Dropping favourite PDFs of outdated templates failed")
+            raise
+        finally:
+            connections.close_all()
+
+        if cls.enabled():
+            for invoice_id in outdated:
+                cls.schedule(invoice_id)
+        return len(outdated)
+
+    @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        # Called with cls._lock held
+        if cls._executor is None:
+            cls._executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "INVOICE_FAVOURITE_PDF_CONCURRENCY", 1),
+                thread_name_prefix="favourite-pdf",
+            )
+        return cls._executor
+
+    @classmethod
+    def _forget(cls, invoice_id: int, future: Future) -> None:
+        with cls._lock:
+            if cls._inflight.get(invoice_id) is future:
+                del cls._inflight[invoice_id]
@@ -1,13 +1,23 @@
 import datetime
+import io
 import logging
 from decimal import Decimal
 from enum import Enum
-from typing import Union, Any, Dict, Tuple, Optional
-from django.template.loader import get_template
+from typing import Union, Any, BinaryIO, Dict, Iterable, Iterator, List, Tuple, Optional
+from django.conf import settings
+from django.db import transaction
 from dotenv import load_dotenv
-from weasyprint import HTML
 from api.exceptions import InvoiceGenerationError, LanguageNotSupportedError
+from api.utils.exchange_rates import ExchangeRates
+from api.utils.invoice_numbers import InvoiceNumbers
+from api.utils.money import Money, VATMultiplier
 from api.utils.months import MONTHS_IN_GEORGIAN, MONTHS_IN_ENGLISH
+from api.utils.pdf_cache import PDFCache
+from api.utils.render_pool import RenderPool
+from api.utils.render_profiles import RenderProfiles
+from api.utils.stamped_renderer import StampedRenderer
+from api.utils.template_registry import TemplateRegistry
+from api.utils.timing import stage
 from user.models import User
 
 
@@ -39,6 +49,7 @@ class VATCalculator:
     """
 
     VAT_RATE = Decimal("0.18")
+    MULTIPLIER = VATMultiplier(VAT_RATE)
 
     @classmethod
     def calculate_vat_amount(cls, amount: Decimal, has_vat: bool) -> Decimal:
@@ -53,21 +64,6 @@ class VATCalculator:
         return amount * cls.VAT_RATE if has_vat else Decimal("0.00")
 
 
-class InvoiceNumberGenerator:
-    """
-    Responsible for generating unique invoice numbers.
-    """
-    
-    @staticmethod
-    def generate() -> str:
-        """
-        Generate a unique invoice number based on current timestamp.
-
-        :return: str: Formatted invoice number (YYYYDDMMHHMMSS)
-        """
-        return datetime.datetime.now().strftime("%Y%d%m%H%M%S")
-
-
 class InvoiceService:
     """
     Service class for invoice generation helper methods
@@ -76,32 +72,109 @@ class InvoiceService:
     """
 
     @staticmethod
-    def calculate_totals(data: Dict[str, Any]) -> Tuple[Decimal, Decimal]:
+    def line_totals(purpose: Dict[str, Any], currency: str = "") -> Tuple[Money, Money]:
+        """
+        Calculate the rounded VAT amount and total of one purpose line.
+
+        :param: purpose: Purpose with amount and has_vat
+        :param: currency: Currency code of the invoice
+
+        :return: Tuple[Money, Money]: (vat_amount, total)
+        """
+        multiplier = VATCalculator.MULTIPLIER
+        vat, gross = multiplier.line(Money.minor_units(purpose["amount"]),
+                                     bool(purpose["has_vat"]))
+        return (Money(multiplier.round(vat), currency),
+                Money(multiplier.round(gross), currency))
+
+    @classmethod
+    def calculate_totals(cls, data: Dict[str, Any],
+                         annotate: bool = True) -> Tuple[Money, Money]:
         """
         Calculate the total amount and total VAT of the invoice.
 
+        Line amounts are summed as exact integer fractions of minor units
+        and rounded once at the end (see ``Money``), which gives the same
+        result as summing the unrounded ``Decimal`` line amounts.
+
         :param: data: Invoice data containing purposes
+        :param: annotate: Store vat_amount and total on every purpose
 
-        :return: Tuple[Decimal, Decimal]: (total_amount, vat_total)
+        :return: Tuple[Money, Money]: (total_amount, vat_total)
         """
+        currency = (data or {}).get("currency", "")
         if not data or "purposes" not in data:
-            return Decimal("0.00"), Decimal("0.00")
+            return Money(0, currency), Money(0, currency)
 
-        total_amount = Decimal("0.00")
-        vat_total = Decimal("0.00")
+        multiplier = VATCalculator.MULTIPLIER
+        numerator = multiplier.numerator
+        gross_numerator = multiplier.gross_numerator
+        denominator = multiplier.denominator
+        total_amount = 0
+        vat_total = 0
 
+        # Hot loop for invoices with many lines: VATMultiplier.line inlined
         for purpose in data["purposes"]:
-            amount = Decimal(str(purpose["amount"]))
-            has_vat = bool(purpose["has_vat"])
-            vat_amount = VATCalculator.calculate_vat_amount(amount, has_vat)
+            minor = Money.minor_units(purpose["amount"])
+            if purpose["has_vat"]:
+                vat, gross = minor * numerator, minor * gross_numerator
+            else:
+                vat, gross = 0, minor * denominator
 
-            purpose['vat_amount'] = round(vat_amount, 2)
-            purpose['total'] = round(amount + vat_amount, 2)
+            if annotate:
+                purpose['vat_amount'] = Money(multiplier.round(vat), currency)
+                purpose['total'] = Money(multiplier.round(gross), currency)
 
-            total_amount += (amount + vat_amount)
-            vat_total += vat_amount
+            total_amount += gross
+            vat_total += vat
 
-        return round(total_amount, 2), round(vat_total, 2)
+        return (Money(multiplier.round(total_amount), currency),
+                Money(multiplier.round(vat_total), currency))
+
+    @classmethod
+    def annotate_purposes(cls, purposes: List[Dict[str, Any]],
+                          currency: str = "") -> List[Dict[str, Any]]:
+        """
+        Copy purposes with their VAT amount and total, leaving the originals untouched.
+
+        :param: purposes: Purposes to render
+        :param: currency: Currency code of the invoice
+
+        :return: List[Dict[str, Any]]: Purposes with vat_amount and total
+        """
+        annotated = []
+        for purpose in purposes:
+            vat_amount, total = cls.line_totals(purpose, currency)
+            annotated.append({**purpose, "vat_amount": vat_amount, "total": total})
+        return annotated
+
+    @staticmethod
+    def invoice_data_from_favourite(invoice: Any) -> Dict[str, Any]:
+        """
+        Build invoice generation data from a saved favourite invoice.
+
+        The favourite's own invoice number is kept, so no new number is
+        allocated when it is rendered.
+
+        :param: invoice: Invoice instance with payer and purposes
+
+        :return: Dict[str, Any]: Data in the shape of validated generation data
+        """
+        return {
+            "invoice_number": invoice.invoice_number,
+            "payer": invoice.payer,
+            "currency": invoice.currency,
+            "language": invoice.language,
+            "template": invoice.template,
+            "should_use_invoice_date_currency_rate":
+                invoice.should_use_invoice_date_currency_rate,
+            "purposes": [
+                {"description": purpose.description,
+                 "amount": purpose.amount,
+                 "has_vat": purpose.has_vat}
+                for purpose in invoice.purposes.all()
+            ],
+        }
 
 
 class TemplateSelector:
@@ -153,7 +226,7 @@ class TemplateSelector:
             logger.error(f"Template not found for {lang}:{template_choice}")
             return None
 
-        return get_template(template_path)
+        return TemplateRegistry.get(template_path)
 
 
 class InvoiceGenerator:
@@ -161,14 +234,23 @@ class InvoiceGenerator:
     Invoice generator class to generate
     invoice based on the given invoice data.
 
+    The PDF output options come from the render profile of the invoice
+    data, else the user's default profile, else ``INVOICE_RENDER_PROFILE``.
+
     :param invoice_data: Invoice data
     :param user: User object associated with the invoice
     """
 
+    PREVIEW_INVOICE_NUMBER = "PREVIEW"
+
     def __init__(self, invoice_data: Dict[str, Any], user: User) -> None:
         self.invoice_data = invoice_data
         self.user = user
         self.invoice_service = InvoiceService()
+        self.render_profile = RenderProfiles.resolve(
+            invoice_data.pop("render_profile", None),
+            getattr(user, "render_profile", None),
+        )
 
     def generate_invoice(self) -> bytes:
         """
@@ -181,16 +263,97 @@ class InvoiceGenerator:
             InvoiceGenerationError: If PDF generation fails
             LanguageNotSupportedError: If the language is not supported
         """
+        if self.is_large():
+            with self._create_large_invoice() as pdf_file:
+                return pdf_file.read()
         return self._create_invoice()
 
-    def _prepare_context(self) -> Dict[str, Any]:
+    def generate_invoice_file(self) -> BinaryIO:
+        """
+        Generate the invoice as a file object positioned at its start.
+
+        Large invoices are written to a spooled temporary file, so the
+        PDF does not have to be held in memory to be sent.
+
+        :return: PDF file object of the invoice
+
+        :raises:
+            InvoiceGenerationError: If PDF generation fails
+            LanguageNotSupportedError: If the language is not supported
+        """
+        if self.is_large():
+            return self._create_large_invoice()
+        return io.BytesIO(self._create_invoice())
+
+    def generate_preview(self, if_none_match: Iterable[str] = ()) -> Tuple[Optional[str], str]:
+        """
+        Render the invoice HTML for previewing, without a PDF.
+
+        No invoice number is generated for previews. The ETag is a hash of
+        the prepared context and the template source, so the HTML is only
+        rendered when the client does not already have it.
+
+        :param if_none_match: ETags of the previews the client already has
+
+        :return: (HTML or None if the client's copy is current, strong ETag)
+
+        :raises:
+            InvoiceGenerationError: If the template is not found
+            LanguageNotSupportedError: If the language is not supported
+        """
+        template = self._select_template()
+        with stage("prepare_context"):
+            context = self._prepare_context(invoice_number=self.PREVIEW_INVOICE_NUMBER)
+
+        template_name = template.origin.template_name
+        key = PDFCache.make_key(context, TemplateRegistry.fingerprint(template_name))
+        etag = f'"{key}"'
+        if etag in if_none_match or "*" in if_none_match:
+            return None, etag
+
+        with stage("template_render"):
+            return template.render(context), etag
+
+    def generate_structured(self, output_format: str) -> Iterator[bytes]:
+        """
+        Generate the invoice as a structured document instead of a PDF.
+
+        :param output_format: "xml" for a UBL 2.1 style document or "json"
+
+        :return: Iterator over the document bytes
+        """
+        from api.utils.structured_invoice import StructuredInvoiceWriter
+
+        with stage("prepare_context"):
+            context = self._prepare_context(annotate=False)
+        self._assign_invoice_number()
+        writer = StructuredInvoiceWriter(context)
+        return writer.iter_xml() if output_format == "xml" else writer.iter_json()
+
+    def is_large(self) -> bool:
+        """
+        Check whether the invoice has enough purposes to be rendered in chunks.
+
+        :return: True if large-invoice mode applies
+        """
+        threshold = getattr(settings, "INVOICE_LARGE_INVOICE_LINES", 0)
+        return bool(threshold) and len(self.invoice_data.get("purposes", [])) >= threshold
+
+    def _prepare_context(self, annotate: bool = True,
+                         invoice_number: Optional[str] = None) -> Dict[str, Any]:
         """
         Prepare context for the invoice template.
 
+        No invoice number is allocated here, see ``_assign_invoice_number``.
+
+        :param annotate: Store vat_amount and total on every purpose
+        :param invoice_number: Invoice number to use instead of the one in the
+            invoice data
+
         :return: Context for the invoice template
         """
         total_amount, vat_total = (
-            self.invoice_service.calculate_totals(self.invoice_data)
+            self.invoice_service.calculate_totals(self.invoice_data, annotate)
         )
 
         current_date_numeral = datetime.datetime.now()
@@ -204,15 +367,16 @@ class InvoiceGenerator:
 
         self.invoice_data.update(
             {
-                "invoice_number": InvoiceNumberGenerator.generate(),
-                "total_amount": round(total_amount, 2),
-                "vat_total": round(vat_total, 2),
-                "total_without_vat": round(total_amount - vat_total, 2),
+                "invoice_number": invoice_number or self.invoice_data.get("invoice_number"),
+                "total_amount": total_amount,
+                "vat_total": vat_total,
+                "total_without_vat": total_amount - vat_total,
                 "receiver_ka": self.user.receiver_name_ka,
                 "receiver_en": self.user.receiver_name_en,
                 "receiver_id": self.user.identification_code,
                 "date_now": current_date_ge,
                 "date_now_en": current_date_en,
+                "issue_date": current_date_numeral.date().isoformat(),
                 "payer_ka": self.invoice_data["payer"].name_ka,
                 "payer_en": self.invoice_data["payer"].name_en,
                 "payer_id": self.invoice_data["payer"].identification_code,
@@ -221,36 +385,207 @@ class InvoiceGenerator:
                 "bank_name_en": self.user.bank_name_en,
                 "bank_acc_num": self.user.bank_account_number,
                 "bank_code": self.user.bank_code,
-                "receiver_phone": self.user.phone_number or ""
+                "receiver_phone": self.user.phone_number or "",
+                "row_offset": 0,
              }
         )
+        self.invoice_data.update(
+            self._exchange_rate_context(total_amount, current_date_numeral.date())
+        )
         return self.invoice_data
 
-    def _create_invoice(self) -> Union[bytes, str]:
+    def _exchange_rate_context(self, total_amount: Money,
+                               issue_date: datetime.date) -> Dict[str, Any]:
         """
-        Create invoice method which generates the invoice
-        based on the given invoice data and returns the PDF file.
+        GEL equivalent of the total at the rate of the issue date, for
+        foreign currency invoices that use the invoice date rate.
 
-        :return: PDF file of the invoice or error message
+        :param total_amount: Invoice total in the invoice currency
+        :param issue_date: Issue date of the invoice
+
+        :return: exchange_rate, exchange_rate_date and total_amount_gel, or
+            nothing if they do not apply or no rate is known
+        """
+        if (not self.invoice_data.get("should_use_invoice_date_currency_rate")
+                or total_amount.currency in ("", ExchangeRates.BASE_CURRENCY)):
+            return {}
+        converted = ExchangeRates.to_gel(total_amount, issue_date)
+        if converted is None:
+            logger.warning(f"No {total_amount.currency} exchange rate on or before "
+                           f"{issue_date}, rendering without the GEL equivalent")
+            return {}
+        total_amount_gel, rate, rate_date = converted
+        return {"exchange_rate": rate, "exchange_rate_date": rate_date,
+                "total_amount_gel": total_amount_gel}
+
+    def _assign_invoice_number(self) -> str:
+        """
+        Allocate the next invoice number of the user, unless the invoice
+        data already has one.
+
+        Call this right before rendering and, for the gapless policy,
+        inside the transaction that renders and records the invoice, so a
+        failed render gives the number back.
+
+        :return: Invoice number of the invoice
+        """
+        if not self.invoice_data.get("invoice_number"):
+            self.invoice_data["invoice_number"] = InvoiceNumbers.next(self.user)
+        return self.invoice_data["invoice_number"]
+
+    @classmethod
+    def generate_merged(cls, invoices: List[Dict[str, Any]], user: User) -> bytes:
+        """
+        Generate a single PDF containing several invoices.
+
+        All invoices are laid out by one WeasyPrint document per run of
+        consecutive invoices sharing a template, with a page break
+        between invoices, so fonts, stylesheets and the layout engine
+        are set up once instead of once per invoice. The PDF is written
+        with the render profile of the first invoice.
+
+        :param invoices: Invoice data of each invoice, in page order
+        :param user: User object associated with the invoices
+
+        :return: PDF file with all invoices
 
         :raises:
             InvoiceGenerationError: If PDF generation fails
             LanguageNotSupportedError: If the language is not supported
         """
+        parts = []
+        profile = None
+        try:
+            # Favourites keep their numbers; the numbers allocated for the
+            # other invoices are given back if the PDF fails
+            with transaction.atomic():
+                for invoice_data in invoices:
+                    generator = cls(invoice_data, user)
+                    profile = profile or generator.render_profile
+                    template = generator._select_template()
+                    with stage("prepare_context"):
+                        context = generator._prepare_context()
+                    generator._assign_invoice_number()
+                    with stage("template_render"):
+                        parts.append((template.render(context), template.origin.template_name))
+
+                pdf = RenderPool.render_merged(parts, profile)
+            logger.info(f"Merged PDF of {len(parts)} invoices generated")
+            return pdf
+        except (InvoiceGenerationError, LanguageNotSupportedError):
+            raise
+        except Exception as e:
+            logger.error(f"Merged PDF generation failed: {e}")
+            raise InvoiceGenerationError(f"Failed to generate PDF: {e}")
+
+    def _select_template(self) -> Any:
+        """
+        Select the template for the invoice language and template type.
+
+        :return: Template object
+
+        :raises:
+            InvoiceGenerationError: If the template is not found
+            LanguageNotSupportedError: If the language is not supported
+        """
         language = self.invoice_data.get("language", "en")
         template_choice = self.invoice_data.get("template", "template1")
         template = TemplateSelector.get_template(language, template_choice)
 
         if not template:
             raise InvoiceGenerationError(f"Template not found for {language}:{template_choice}")
+        return template
+
+    def _create_invoice(self) -> Union[bytes, str]:
+        """
+        Create invoice method which generates the invoice
+        based on the given invoice data and returns the PDF file.
 
-        context = self._prepare_context()
-        output_html = template.render(context)
+        The invoice number is not part of a cached PDF's identity: an
+        invoice identical to one rendered within the cache TTL is served
+        that PDF and takes over its number, and no new number is
+        allocated. Invoice data that brings its own number (e.g. a
+        favourite) is rendered every time and never cached.
+
+        With ``INVOICE_STAMPED_RENDER_ENABLED``, small invoices of the fast
+        profile are stamped on a cached layout of their template (see
+        ``StampedRenderer``) and only laid out in full if they cannot be.
+
+        :return: PDF file of the invoice or error message
+
+        :raises:
+            InvoiceGenerationError: If PDF generation fails
+            LanguageNotSupportedError: If the language is not supported
+        """
+        template = self._select_template()
+        # PDFs with a number given by the caller are not cached
+        cache = None if self.invoice_data.get("invoice_number") else PDFCache.instance()
+        with stage("prepare_context"):
+            context = self._prepare_context()
+
+        template_name = template.origin.template_name
+        cache_key = None
+        if cache is not None:
+            with stage("cache_lookup"):
+                cache_key = PDFCache.make_key(
+                    {**context, "render_profile": self.render_profile.value},
+                    TemplateRegistry.fingerprint(template_name)
+                )
+                cached = cache.get(cache_key)
+            if cached is not None:
+                # The same document as before, with the number printed on it
+                pdf, context["invoice_number"] = cached
+                logger.info("PDF served from cache")
+                return pdf
 
         try:
-            pdf = HTML(string=output_html).write_pdf()
+            # A number is only allocated for a PDF that is rendered, and
+            # given back (gapless policy) if rendering fails
+            with transaction.atomic():
+                self._assign_invoice_number()
+                with stage("pdf_stamp"):
+                    pdf = StampedRenderer.render(context, template_name, self.render_profile)
+                if pdf is None:
+                    with stage("template_render"):
+                        output_html = template.render(context)
+                    pdf = RenderPool.render(output_html, template_name, self.render_profile)
             logger.info("PDF generation successful")
+            if cache is not None:
+                cache.set(cache_key, pdf, context["invoice_number"])
             return pdf
+        except InvoiceGenerationError:
+            raise
+        except Exception as e:
+            logger.error(f"PDF generation failed: {e}")
+            raise InvoiceGenerationError(f"Failed to generate PDF: {e}")
+
+    def _create_large_invoice(self) -> BinaryIO:
+        """
+        Create a large invoice in chunks of purposes.
+
+        The purposes are annotated, rendered and laid out a chunk at a
+        time in the render worker and the PDF is written to a temporary
+        file. Large invoices are not cached.
+
+        :return: PDF file object of the invoice
+
+        :raises:
+            InvoiceGenerationError: If PDF generation fails
+            LanguageNotSupportedError: If the language is not supported
+        """
+        template = self._select_template()
+        with stage("prepare_context"):
+            context = self._prepare_context(annotate=False)
+
+        try:
+            with transaction.atomic():
+                self._assign_invoice_number()
+                pdf_file = RenderPool.render_large(context, template.origin.template_name,
+                                                   self.render_profile)
+            logger.info(f"Large PDF with {len(context['purposes'])} lines generated")
+            return pdf_file
+        except InvoiceGenerationError:
+            raise
         except Exception as e:
             logger.error(f"PDF generation failed: {e}")
             raise InvoiceGenerationError(f"Failed to generate PDF: {e}")
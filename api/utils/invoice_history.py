@@ -0,0 +1,86 @@
+import logging
+from typing import Any, BinaryIO, Optional, Union
+
+from django.conf import settings
+from django.db import transaction
+
+from api.utils.blob_store import BlobStore
+from api.utils.money import Money
+
+
+logger = logging.getLogger(__name__)
+
+
+class InvoiceHistory:
+    """
+    Record of the invoices a user generated, with their PDFs kept in the
+    blob store so they can be downloaded again without rendering.
+    """
+
+    @staticmethod
+    def enabled() -> bool:
+        """
+        Check whether generated invoices are recorded.
+
+        :return: True if history is enabled in settings
+        """
+        return getattr(settings, "INVOICE_HISTORY_ENABLED", False)
+
+    @classmethod
+    def record(cls, invoice_data: dict, user: Any,
+               pdf: Union[bytes, BinaryIO]) -> Optional[Any]:
+        """
+        Store the PDF of a generated invoice and record the generation.
+
+        Call this in the transaction the invoice number was allocated
+        in. Failures are logged and do not fail the generation.
+
+        An invoice number is recorded once per owner: a PDF served from the
+        cache carries the number of its first generation, which returns
+        that record instead of adding a duplicate.
+
+        :param invoice_data: Prepared invoice context
+        :param user: Receiver who generated the invoice
+        :param pdf: PDF bytes or a file object, rewound after reading
+
+        :return: GeneratedInvoice or None if history is disabled or failed
+        """
+        if not cls.enabled():
+            return None
+        from api.models import GeneratedInvoice
+
+        start = None if isinstance(pdf, bytes) else pdf.tell()
+        try:
+            recorded = (GeneratedInvoice.objects
+                        .filter(owner=user, invoice_number=invoice_data["invoice_number"])
+                        .first())
+            if recorded is not None:
+                return recorded
+            digest, size = BlobStore().put(pdf)
+            payer = invoice_data["payer"]
+            # A failed insert must not break the caller's transaction
+            with transaction.atomic():
+                return GeneratedInvoice.objects.create(
+                    owner=user,
+                    payer=payer,
+                    payer_name=payer.name_en if invoice_data.get("language") == "en" and payer.name_en
+                    else payer.name_ka,
+                    invoice_number=invoice_data["invoice_number"],
+                    currency=invoice_data["currency"],
+                    total_amount=cls._decimal(invoice_data["total_amount"]),
+                    vat_total=cls._decimal(invoice_data["vat_total"]),
+                    language=invoice_data.get("language", "ka"),
+                    template=invoice_data.get("template", "template1"),
+                    sha256=digest,
+                    size=size,
+                )
+        except Exception:
+            logger.exception("Recording the generated invoice failed")
+            if start is not None:
+                # The PDF is still sent from the start
+                pdf.seek(start)
+            return None
+
+    @staticmethod
+    def _decimal(amount: Any) -> Any:
+        return amount.to_decimal() if isinstance(amount, Money) else amount
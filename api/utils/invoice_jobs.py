@@ -0,0 +1,92 @@
+import datetime
+import logging
+from typing import Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import InvoiceJob
+from api.serializers import InvoiceGenerationSerializer
+from api.utils.invoice_generator import InvoiceGenerator
+from api.utils.invoice_history import InvoiceHistory
+from api.utils.timing import StageTimer, stage
+
+
+logger = logging.getLogger(__name__)
+
+
+class InvoiceJobRunner:
+    """
+    Claims pending invoice generation jobs and renders them.
+
+    Jobs are claimed with a conditional UPDATE on their status, so any
+    number of worker threads or processes can drain the table without
+    an external broker or database-specific row locking.
+    """
+
+    CLAIM_BATCH = 10
+
+    @classmethod
+    def claim_next(cls) -> Optional[InvoiceJob]:
+        """
+        Claim the oldest pending job.
+
+        :return: Claimed job or None if the queue is empty
+        """
+        candidates = (InvoiceJob.objects
+                      .filter(status="pending")
+                      .order_by("created_at")
+                      .values_list("id", flat=True)[:cls.CLAIM_BATCH])
+        for job_id in candidates:
+            claimed = (InvoiceJob.objects
+                       .filter(pk=job_id, status="pending")
+                       .update(status="running", started_at=timezone.now()))
+            if claimed:
+                return InvoiceJob.objects.select_related("owner").get(pk=job_id)
+        return None
+
+    @staticmethod
+    def requeue_stale(timeout: int) -> int:
+        """
+        Return jobs stuck in running state (e.g. after a worker crash) to the queue.
+
+        :param timeout: Seconds after which a running job is considered stale
+
+        :return: Number of requeued jobs
+        """
+        cutoff = timezone.now() - datetime.timedelta(seconds=timeout)
+        return (InvoiceJob.objects
+                .filter(status="running", started_at__lt=cutoff)
+                .update(status="pending", started_at=None))
+
+    @staticmethod
+    def process(job: InvoiceJob) -> None:
+        """
+        Validate the job payload, render the invoice and store the result.
+
+        :param job: Claimed job
+        """
+        # Payers are looked up among the job owner's, as for the request
+        serializer = InvoiceGenerationSerializer(data=job.payload,
+                                                 context={"owner": job.owner})
+        timer = StageTimer()
+        try:
+            with timer.activate():
+                if not serializer.is_valid():
+                    raise ValueError(f"Invalid invoice data: {serializer.errors}")
+                invoice_generator = InvoiceGenerator(serializer.validated_data, job.owner)
+                with transaction.atomic():
+                    job.pdf = invoice_generator.generate_invoice()
+                    with stage("history"):
+                        InvoiceHistory.record(invoice_generator.invoice_data,
+                                              job.owner, job.pdf)
+            job.status = "done"
+            logger.info(f"Invoice job {job.id} done",
+                        extra={"stage_timings": timer.finish()})
+        except Exception as e:
+            logger.exception(f"Invoice job {job.id} failed")
+            job.status = "failed"
+            job.error = str(e)
+
+        job.finished_at = timezone.now()
+        job.save(update_fields=["pdf", "status", "error", "finished_at"])
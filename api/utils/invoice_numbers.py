@@ -0,0 +1,238 @@
+import logging
+import os
+import re
+import string
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import F
+
+
+logger = logging.getLogger(__name__)
+
+
+class InvoiceNumbers:
+    """
+    Per-receiver invoice number series.
+
+    Every receiver has its own counter in ``InvoiceNumberSeries``.
+    Numbers are formatted with ``INVOICE_NUMBER_FORMAT``, which includes
+    the receiver's identification code (``{receiver}``, printed on the
+    invoice anyway) so the numbers of different receivers never collide
+    on ``Invoice.invoice_number``. ``{receiver_id}`` is the user id,
+    which exposes how many users there are.
+
+    ``INVOICE_NUMBER_GAP_POLICY`` picks how numbers are handed out:
+
+    - ``"blocks"`` (hi/lo): a process reserves ``INVOICE_NUMBER_BLOCK_SIZE``
+      numbers with one committed update and hands them out from memory.
+      Numbers are unique, but the rest of a block is skipped when the
+      process exits, and processes issue numbers out of order.
+    - ``"gapless"``: every number is reserved in the caller's transaction,
+      so a rolled back invoice gives its number back. Invoices of a
+      receiver are created one at a time, as the series row stays locked
+      until the transaction commits.
+    """
+
+    GAP_POLICIES = ("blocks", "gapless")
+
+    # Receiver id to the [next, end) range of its reserved block
+    _blocks: Dict[int, List[int]] = {}
+    _refill_locks: Dict[int, threading.Lock] = {}
+    _executor: Optional[ThreadPoolExecutor] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def gap_policy() -> str:
+        """
+        Configured gap policy.
+
+        :return: "blocks" or "gapless"
+
+        :raises: ValueError: If the setting is not a known policy
+        """
+        policy = getattr(settings, "INVOICE_NUMBER_GAP_POLICY", "blocks")
+        if policy not in InvoiceNumbers.GAP_POLICIES:
+            raise ValueError(f"INVOICE_NUMBER_GAP_POLICY must be one of "
+                             f"{InvoiceNumbers.GAP_POLICIES}, not {policy!r}")
+        return policy
+
+    @staticmethod
+    def number_format() -> str:
+        """
+        Configured invoice number format.
+
+        :return: Format string with {receiver} or {receiver_id} and {number}
+        """
+        return getattr(settings, "INVOICE_NUMBER_FORMAT", "{receiver}-{number:06d}")
+
+    @classmethod
+    def format(cls, receiver: Any, number: int) -> str:
+        """
+        Format an invoice number.
+
+        :param receiver: Receiver user
+        :param number: Number in the receiver's series
+
+        :return: Invoice number, e.g. "205123456-000345"
+        """
+        return cls.number_format().format(receiver=receiver.identification_code,
+                                          receiver_id=receiver.pk, number=number)
+
+    @classmethod
+    def parse(cls, invoice_number: str) -> Optional[int]:
+        """
+        Read the series number of an invoice number in the configured
+        format, whatever receiver it names.
+
+        :param invoice_number: Invoice number
+
+        :return: Number in the series, or None if the format does not match
+        """
+        pattern = ""
+        for literal, field, _, _ in string.Formatter().parse(cls.number_format()):
+            pattern += re.escape(literal)
+            if field == "number":
+                pattern += r"(?P<number>\d+)"
+            elif field is not None:
+                pattern += ".+?"
+        match = re.fullmatch(pattern, invoice_number)
+        if match is None or "number" not in match.groupdict():
+            return None
+        return int(match.group("number"))
+
+    @classmethod
+    def next(cls, receiver: Any) -> str:
+        """
+        Allocate the next invoice number of a receiver.
+
+        With the gapless policy, call this in the transaction that saves
+        the invoice.
+
+        :param receiver: Saved receiver user
+
+        :return: Invoice number
+
+        :raises: ValueError: If the receiver is not saved
+        """
+        if receiver.pk is None:
+            raise ValueError("Invoice numbers are allocated to saved receivers only")
+        if cls.gap_policy() == "gapless":
+            return cls.format(receiver, cls.reserve(receiver.pk, 1))
+        return cls.format(receiver, cls._from_block(receiver.pk))
+
+    @classmethod
+    def reserve(cls, receiver_id: int, count: int) -> int:
+        """
+        Reserve a range of numbers in the current transaction.
+
+        :param receiver_id: Receiver user id
+        :param count: Numbers to reserve
+
+        :return: First reserved number; the range ends before first + count
+        """
+        from api.models import InvoiceNumberSeries
+
+        series = InvoiceNumberSeries.objects.filter(receiver_id=receiver_id)
+        with transaction.atomic():
+            # Update first, so the row is locked before it is read
+            if not series.update(next_number=F("next_number") + count):
+                try:
+                    with transaction.atomic():
+                        InvoiceNumberSeries.objects.create(receiver_id=receiver_id,
+                                                           next_number=1 + count)
+                    return 1
+                except IntegrityError:
+                    # Created by a concurrent first reservation
+                    series.update(next_number=F("next_number") + count)
+            return series.values_list("next_number", flat=True).get() - count
+
+    @classmethod
+    def reset(cls) -> None:
+        """
+        Forget the blocks of this process; their remaining numbers are skipped.
+        """
+        with cls._lock:
+            cls._blocks = {}
+
+    @classmethod
+    def _from_block(cls, receiver_id: int) -> int:
+        """
+        Take a number from this process's block, reserving a new block
+        when it runs out.
+
+        :param receiver_id: Receiver user id
+
+        :return: Number in the receiver's series
+        """
+        number = cls._take(receiver_id)
+        if number is not None:
+            return number
+
+        with cls._lock:
+            refill_lock = cls._refill_locks.setdefault(receiver_id, threading.Lock())
+        with refill_lock:
+            # Another thread may have refilled the block meanwhile
+            number = cls._take(receiver_id)
+            while number is None:
+                size = max(1, getattr(settings, "INVOICE_NUMBER_BLOCK_SIZE", 100))
+                first = cls._reserve_committed(receiver_id, size)
+                logger.info(f"Reserved invoice numbers {first}-{first + size - 1} "
+                            f"of receiver {receiver_id}")
+                with cls._lock:
+                    cls._blocks[receiver_id] = [first, first + size]
+                number = cls._take(receiver_id)
+        return number
+
+    @classmethod
+    def _take(cls, receiver_id: int) -> Optional[int]:
+        with cls._lock:
+            block = cls._blocks.get(receiver_id)
+            if block is None or block[0] >= block[1]:
+                return None
+            block[0] += 1
+            return block[0] - 1
+
+    @classmethod
+    def _reserve_committed(cls, receiver_id: int, count: int) -> int:
+        """
+        Reserve a block in a transaction of its own.
+
+        A block handed out from memory must outlive the caller's
+        transaction: if it were rolled back, another process could
+        reserve the same numbers. Inside a transaction the block is
+        therefore reserved on a separate thread with its own connection.
+
+        :param receiver_id: Receiver user id
+        :param count: Numbers to reserve
+
+        :return: First reserved number
+        """
+        if not connection.in_atomic_block:
+            return cls.reserve(receiver_id, count)
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=1,
+                                                   thread_name_prefix="invoice-numbers")
+        return cls._executor.submit(cls._reserve_in_thread, receiver_id, count).result()
+
+    @classmethod
+    def _reserve_in_thread(cls, receiver_id: int, count: int) -> int:
+        try:
+            return cls.reserve(receiver_id, count)
+        finally:
+            connections.close_all()
+
+
+def _forget_blocks_after_fork() -> None:
+    # A forked child must not hand out the numbers of its parent's blocks
+    InvoiceNumbers._blocks = {}
+    InvoiceNumbers._refill_locks = {}
+    InvoiceNumbers._executor = None
+    InvoiceNumbers._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_blocks_after_fork)
@@ -0,0 +1,158 @@
+from decimal import Decimal
+from typing import Any, Tuple
+
+
+class Money:
+    """
+    Fixed-point amount of money: an integer number of minor units
+    (tetri, cents) and a currency code.
+
+    Rounding rule: amounts that are not whole minor units are rounded
+    half to even ("banker's rounding") at the minor unit. This is what
+    ``round(Decimal, 2)`` does in the default decimal context, so
+    totals built from Money match the ``Decimal`` calculation digit for
+    digit. ``str()`` gives the same text as the rounded ``Decimal``,
+    e.g. "218.00", so Money renders unchanged in templates.
+
+    :param minor: Amount in minor units
+    :param currency: ISO 4217 currency code
+    """
+
+    __slots__ = ("minor", "currency")
+
+    EXPONENT = 2
+    SCALE = 10 ** EXPONENT
+
+    def __init__(self, minor: int, currency: str = "") -> None:
+        self.minor = minor
+        self.currency = currency
+
+    @classmethod
+    def minor_units(cls, value: Any) -> int:
+        """
+        Convert a Decimal, string or int amount to minor units.
+
+        :param value: Amount in major units with at most two decimal places
+
+        :return: Amount in minor units
+
+        :raises: ValueError: If the amount has more precision than minor units
+        """
+        if not isinstance(value, Decimal):
+            value = Decimal(str(value))
+        numerator, denominator = value.as_integer_ratio()
+        scale, remainder = divmod(cls.SCALE, denominator)
+        if remainder:
+            raise ValueError(f"Amount {value} has more than {cls.EXPONENT} decimal places")
+        return numerator * scale
+
+    @classmethod
+    def from_value(cls, value: Any, currency: str = "") -> "Money":
+        """
+        Convert a Decimal, string or int amount.
+
+        :param value: Amount in major units with at most two decimal places
+        :param currency: ISO 4217 currency code
+
+        :return: Money
+
+        :raises: ValueError: If the amount has more precision than minor units
+        """
+        return cls(cls.minor_units(value), currency)
+
+    @classmethod
+    def from_ratio(cls, numerator: int, denominator: int, currency: str = "") -> "Money":
+        """
+        Round an exact fraction of minor units to Money, half to even.
+
+        :param numerator: Amount in 1/denominator minor units
+        :param denominator: Positive denominator
+        :param currency: ISO 4217 currency code
+
+        :return: Money
+        """
+        quotient, remainder = divmod(numerator, denominator)
+        twice = 2 * remainder
+        if twice > denominator or (twice == denominator and quotient % 2):
+            quotient += 1
+        return cls(quotient, currency)
+
+    def to_decimal(self) -> Decimal:
+        """
+        Amount in major units with exactly two decimal places.
+
+        :return: Decimal, e.g. Decimal("218.00")
+        """
+        return Decimal(self.minor).scaleb(-self.EXPONENT)
+
+    def __add__(self, other: "Money") -> "Money":
+        return Money(self.minor + other.minor, self.currency)
+
+    def __sub__(self, other: "Money") -> "Money":
+        return Money(self.minor - other.minor, self.currency)
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Money):
+            return NotImplemented
+        return self.minor == other.minor and self.currency == other.currency
+
+    def __hash__(self) -> int:
+        return hash((self.minor, self.currency))
+
+    def __str__(self) -> str:
+        return str(self.to_decimal())
+
+    def __repr__(self) -> str:
+        return f"Money({self.to_decimal()}, {self.currency!r})"
+
+
+class VATMultiplier:
+    """
+    VAT rate precomputed as an exact integer ratio.
+
+    With a rate of numerator/denominator, a line of ``minor`` minor
+    units has an exact VAT of ``minor * numerator`` and gross amount of
+    ``minor * gross_numerator`` in 1/denominator minor units. Sums of
+    exact line amounts stay integers, so only the final values are
+    rounded, exactly like the unrounded ``Decimal`` sums. The half to
+    even decision for every remainder is precomputed as well.
+
+    :param rate: VAT rate, e.g. Decimal("0.18")
+    """
+
+    __slots__ = ("rate", "numerator", "denominator", "gross_numerator",
+                 "_round_up", "_half")
+
+    def __init__(self, rate: Decimal) -> None:
+        self.rate = rate
+        self.numerator, self.denominator = rate.as_integer_ratio()
+        self.gross_numerator = self.denominator + self.numerator
+        self._round_up = tuple(2 * remainder > self.denominator
+                               for remainder in range(self.denominator))
+        self._half = self.denominator // 2 if self.denominator % 2 == 0 else -1
+
+    def line(self, minor: int, has_vat: bool) -> Tuple[int, int]:
+        """
+        Exact VAT and gross amount of one line.
+
+        :param minor: Line amount in minor units
+        :param has_vat: Flag indicating if VAT should be applied
+
+        :return: (VAT, gross amount) in 1/denominator minor units
+        """
+        if has_vat:
+            return minor * self.numerator, minor * self.gross_numerator
+        return 0, minor * self.denominator
+
+    def round(self, numerator: int) -> int:
+        """
+        Round an exact amount to minor units, half to even.
+
+        :param numerator: Amount in 1/denominator minor units
+
+        :return: Amount in minor units
+        """
+        quotient, remainder = divmod(numerator, self.denominator)
+        if self._round_up[remainder] or (remainder == self._half and quotient & 1):
+            quotient += 1
+        return quotient
@@ -0,0 +1,211 @@
+import codecs
+import csv
+import json
+import logging
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.db import transaction
+from rest_framework import serializers
+
+from api.exceptions import PayerImportError
+from api.utils.favourite_pdfs import FavouritePDFs
+
+
+logger = logging.getLogger(__name__)
+
+
+class PayerImport:
+    """
+    Bulk import of a user's payers from CSV or NDJSON.
+
+    The body is read line by line and written in batches of
+    ``BATCH_SIZE`` with one upsert each, keyed on the owner and
+    identification code, so memory stays bounded whatever the row count.
+    An existing payer with the same code is updated; a code repeated in
+    the file keeps its last row. Rows are validated with
+    ``PayerSerializer``; invalid rows are skipped and reported with
+    their line numbers. The import runs in one transaction, so a file
+    that cannot be read imports nothing.
+
+    CSV files need a header with ``identification_code`` and ``name_ka``
+    columns, optionally ``name_en`` and ``phone_number``; empty cells
+    are stored as null. NDJSON files have one JSON object per line with
+    the same keys. An update writes only the optional columns the file
+    has, or the keys the NDJSON row has, so leaving one out keeps the
+    stored value. Rows are batched by the optional keys they have, as
+    one upsert updates the same columns of every row.
+
+    :param request: Request of the importing user
+    :param batch_size: Rows written per query
+    """
+
+    CONTENT_TYPES = {
+        "text/csv": "csv",
+        "application/x-ndjson": "ndjson",
+        "application/jsonl": "ndjson",
+    }
+    REQUIRED_COLUMNS = ("identification_code", "name_ka")
+    OPTIONAL_COLUMNS = ("name_en", "phone_number")
+    # Written over an existing payer with the optional columns of the
+    # row; owner and created_at are kept
+    UPDATE_FIELDS = ["name_ka", "updated_at"]
+    BATCH_SIZE = 1000
+    MAX_REPORTED_ERRORS = 1000
+
+    def __init__(self, request: Any, batch_size: int = BATCH_SIZE) -> None:
+        from api.serializers import PayerSerializer
+
+        self.owner = request.user
+        self.batch_size = batch_size
+        # One serializer validates every row, as ListSerializer does
+        self.serializer = PayerSerializer(context={"request": request, "upsert": True})
+        self.rows = self.created = self.updated = self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+        # Unsaved payers by identification code, per optional columns
+        self._batches: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+        # Optional columns of the batch holding each pending code
+        self._pending: Dict[str, Tuple[str, ...]] = {}
+
+    @classmethod
+    def format_for(cls, content_type: str) -> Optional[str]:
+        """
+        Import format of a request content type.
+
+        :param content_type: Content-Type header, parameters allowed
+
+        :return: "csv", "ndjson" or None if unsupported
+        """
+        return cls.CONTENT_TYPES.get(content_type.split(";")[0].strip().lower())
+
+    def run(self, stream: BinaryIO, import_format: str) -> Dict[str, Any]:
+        """
+        Import the payers of a UTF-8 CSV or NDJSON stream.
+
+        :param stream: Binary stream with a readline method, e.g. the request
+        :param import_format: "csv" or "ndjson"
+
+        :return: Report, see report()
+
+        :raises: PayerImportError: If the stream is not UTF-8 or the CSV
+            header lacks required columns
+        """
+        from api.models import Payer
+
+        lines = codecs.iterdecode(iter(stream.readline, b""), "utf-8-sig")
+        rows = self._csv_rows(lines) if import_format == "csv" else self._ndjson_rows(lines)
+        try:
+            with transaction.atomic():
+                for line, row in rows:
+                    self.rows += 1
+                    attrs = self._validate(line, row)
+                    if attrs is None:
+                        continue
+                    columns = tuple(column for column in self.OPTIONAL_COLUMNS
+                                    if column in attrs)
+                    code = attrs["identification_code"]
+                    # Batches are keyed by code, as one upsert may not
+                    # update the same row twice. A code pending in a
+                    # batch of other columns is written first, so the
+                    # last row still wins.
+                    if self._pending.get(code, columns) != columns:
+                        self._write(self._pending[code])
+                    batch = self._batches.setdefault(columns, {})
+                    batch[code] = Payer(**attrs)
+                    self._pending[code] = columns
+                    if len(batch) >= self.batch_size:
+                        self._write(columns)
+                for columns in list(self._batches):
+                    self._write(columns)
+        except UnicodeDecodeError as e:
+            raise PayerImportError(f"The file is not UTF-8 encoded ({e.reason})")
+        logger.info(f"Imported payers for user {self.owner.pk}: {self.created} created, "
+                    f"{self.updated} updated, {self.failed} failed")
+        return self.report()
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Outcome of the import.
+
+        :return: Counts of rows, created, updated and failed payers, and
+            the errors of the first MAX_REPORTED_ERRORS failed rows as
+            {"line": n, "errors": {...}}
+        """
+        return {
+            "rows": self.rows,
+            "created": self.created,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
+
+    def _csv_rows(self, lines: Iterable[str]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        reader = csv.DictReader(lines)
+        missing = set(self.REQUIRED_COLUMNS) - set(reader.fieldnames or ())
+        if missing:
+            raise PayerImportError(f"Missing columns: {', '.join(sorted(missing))}")
+        columns = [column for column in (*self.REQUIRED_COLUMNS, *self.OPTIONAL_COLUMNS)
+                   if column in reader.fieldnames]
+        for row in reader:
+            yield reader.line_num, {column: row[column] or None for column in columns}
+
+    @staticmethod
+    def _ndjson_rows(lines: Iterable[str]) -> Iterator[Tuple[int, Any]]:
+        for line, text in enumerate(lines, start=1):
+            if not text.strip():
+                continue
+            try:
+                yield line, json.loads(text)
+            except ValueError as e:
+                yield line, e
+
+    def _validate(self, line: int, row: Any) -> Optional[Dict[str, Any]]:
+        """
+        Validate one row with the PayerSerializer rules.
+
+        :param line: Line number for the report
+        :param row: Parsed row, or the error of a line that failed to parse
+
+        :return: Validated attributes or None if the row failed
+        """
+        if isinstance(row, ValueError):
+            return self._fail(line, {"non_field_errors": [f"Invalid JSON: {row}"]})
+        if not isinstance(row, dict):
+            return self._fail(line, {"non_field_errors": ["Expected a JSON object"]})
+        try:
+            return self.serializer.run_validation(row)
+        except serializers.ValidationError as e:
+            return self._fail(line, e.detail)
+
+    def _fail(self, line: int, errors: Any) -> None:
+        self.failed += 1
+        if len(self.errors) < self.MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "errors": errors})
+        return None
+
+    def _write(self, columns: Tuple[str, ...]) -> None:
+        """
+        Upsert the batch of payers with the given optional columns.
+
+        :param columns: Optional columns of the batch, updated with
+            UPDATE_FIELDS on existing payers
+        """
+        from api.models import Payer
+
+        batch = self._batches.pop(columns)
+        for code in batch:
+            del self._pending[code]
+        existing = set(Payer.objects
+                       .filter(owner=self.owner, identification_code__in=list(batch))
+                       .values_list("identification_code", flat=True))
+        Payer.objects.bulk_create(
+            batch.values(), update_conflicts=True,
+            unique_fields=["owner", "identification_code"],
+            update_fields=[*self.UPDATE_FIELDS, *columns],
+        )
+        self.created += len(batch) - len(existing)
+        self.updated += len(existing)
+        if existing:
+            # bulk_create sends no post_save, which refreshes favourite PDFs
+            transaction.on_commit(lambda: FavouritePDFs.invalidate(
+                payer__owner=self.owner, payer__identification_code__in=existing
+            ))
@@ -0,0 +1,134 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db import connections, router
+from django.db.models import Q
+
+
+logger = logging.getLogger(__name__)
+
+
+class PayerSearch:
+    """
+    Autocomplete search over a user's payers by Georgian name, English
+    name and identification code.
+
+    Queries are substring matches answered by a trigram index: GIN
+    ``gin_trgm_ops`` indexes on PostgreSQL and the ``api_payer_fts``
+    FTS5 table on SQLite (see migration ``0009_payer_search``). A
+    trigram index cannot answer fewer than three characters, so shorter
+    queries find nothing.
+
+    At most ``CANDIDATES`` matches are read, in index order, and ranked
+    in Python: exact identification codes, then names or codes starting
+    with the query, then names with a word starting with it, then other
+    substrings, shorter names first. A query contained in most payers
+    therefore costs the same as a rare one, at the price of ranking
+    only the first candidates when there are more.
+    """
+
+    MIN_QUERY_LENGTH = 3
+    DEFAULT_LIMIT = 10
+    MAX_LIMIT = 50
+    CANDIDATES = 200
+    FTS_TABLE = "api_payer_fts"
+    # FTS rowids are owner_id << FTS_OWNER_SHIFT | payer id
+    FTS_OWNER_SHIFT = 32
+
+    # Whether the FTS5 table exists, by SQLite database name
+    _fts_tables: Dict[str, bool] = {}
+
+    @classmethod
+    def search(cls, owner: Any, query: str, limit: int = DEFAULT_LIMIT) -> List[Any]:
+        """
+        Find the owner's payers matching a query.
+
+        :param owner: User whose payers are searched
+        :param query: Part of a name or identification code
+        :param limit: Maximum number of payers, capped at MAX_LIMIT
+
+        :return: Payers, best match first; empty for too short queries
+        """
+        from api.models import Payer
+
+        query = " ".join(query.split())
+        if len(query) < cls.MIN_QUERY_LENGTH:
+            return []
+        limit = min(max(limit, 1), cls.MAX_LIMIT)
+        candidates = cls._candidates(Payer, owner, query, max(cls.CANDIDATES, limit))
+        candidates.sort(key=lambda candidate: cls._rank(candidate, query))
+        ids = [candidate[0] for candidate in candidates[:limit]]
+        payers = Payer.objects.in_bulk(ids)
+        return [payers[pk] for pk in ids if pk in payers]
+
+    @classmethod
+    def _candidates(cls, model: Any, owner: Any, query: str,
+                    count: int) -> List[Tuple[int, str, Optional[str], str]]:
+        """
+        First payers containing the query, found through the trigram index.
+
+        Only the searched columns are read; ranking builds no model
+        instances.
+
+        :param model: Payer model
+        :param owner: User whose payers are searched
+        :param query: Query of at least MIN_QUERY_LENGTH characters
+        :param count: Maximum number of payers
+
+        :return: (id, name_ka, name_en, identification_code) in index order
+        """
+        using = router.db_for_read(model)
+        if cls._has_fts(using):
+            # CROSS JOIN keeps the FTS table as the outer loop, so reading
+            # stops after `count` matches, and the rowid range (see the
+            # migration) skips other owners' matches in the index
+            table = model._meta.db_table
+            # The query is matched as one phrase, whatever it contains
+            phrase = '"' + query.replace('"', '""') + '"'
+            first = owner.pk << cls.FTS_OWNER_SHIFT
+            with connections[using].cursor() as cursor:
+                cursor.execute(
+                    f"SELECT {table}.id, {table}.name_ka, {table}.name_en, "
+                    f"{table}.identification_code "
+                    f"FROM {cls.FTS_TABLE} CROSS JOIN {table} "
+                    f"ON {table}.id = {cls.FTS_TABLE}.rowid - %s "
+                    f"WHERE {cls.FTS_TABLE} MATCH %s "
+                    f"AND {cls.FTS_TABLE}.rowid BETWEEN %s AND %s LIMIT %s",
+                    [first, phrase, first, first + (1 << cls.FTS_OWNER_SHIFT) - 1, count],
+                )
+                return cursor.fetchall()
+        # On PostgreSQL these are the expressions the trigram indexes cover
+        return list(model.objects.using(using).filter(
+            Q(name_ka__icontains=query) | Q(name_en__icontains=query)
+            | Q(identification_code__contains=query),
+            owner=owner,
+        ).values_list("id", "name_ka", "name_en", "identification_code")[:count])
+
+    @classmethod
+    def _has_fts(cls, using: str) -> bool:
+        connection = connections[using]
+        if connection.vendor != "sqlite":
+            return False
+        name = str(connection.settings_dict["NAME"])
+        if name not in cls._fts_tables:
+            with connection.cursor() as cursor:
+                cls._fts_tables[name] = cls.FTS_TABLE in connection.introspection.table_names(cursor)
+            if not cls._fts_tables[name]:
+                logger.warning(f"{cls.FTS_TABLE} is missing, payer search is not indexed")
+        return cls._fts_tables[name]
+
+    @staticmethod
+    def _rank(candidate: Tuple[int, str, Optional[str], str],
+              query: str) -> Tuple[int, int, str, int]:
+        pk, name_ka, name_en, code = candidate
+        query = query.casefold()
+        names = [name_ka.casefold(), (name_en or "").casefold()]
+        if code.casefold() == query:
+            tier = 0
+        elif code.casefold().startswith(query) or any(name.startswith(query) for name in names):
+            tier = 1
+        elif any(word.startswith(query) for name in names for word in name.split()):
+            tier = 2
+        else:
+            tier = 3
+        return tier, len(name_ka), name_ka, pk
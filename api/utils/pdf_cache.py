@@ -0,0 +1,249 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class PDFCache:
+    """
+    Content-addressed cache of rendered invoice PDFs.
+
+    Entries are keyed on a SHA-256 of the prepared invoice context and
+    live in a bounded in-memory LRU tier, backed by an optional on-disk
+    tier with size-based eviction of the least recently used files.
+
+    Volatile fields policy: the invoice number is excluded from the key,
+    so a cached PDF (and the number printed on it) is re-used for
+    identical business content within ``ttl`` seconds. Every entry keeps
+    the number it was rendered with, which a hit returns with the PDF.
+    The issue date is part of the key, so a PDF is never served with a
+    stale date.
+
+    :param memory_bytes: Maximum total size of the in-memory tier
+    :param disk_dir: Directory of the on-disk tier, None disables it
+    :param disk_bytes: Maximum total size of the on-disk tier
+    :param ttl: Seconds an entry may be served after it was rendered
+    """
+
+    VOLATILE_FIELDS = frozenset({"invoice_number", "payer"})
+
+    _instance: Optional["PDFCache"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self,
+                 memory_bytes: int,
+                 disk_dir: Optional[str] = None,
+                 disk_bytes: int = 0,
+                 ttl: int = 86400) -> None:
+        self.memory_bytes = memory_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_bytes = disk_bytes
+        self.ttl = ttl
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, bytes, str]]" = OrderedDict()
+        self._memory_used = 0
+        self._disk_used: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def instance(cls) -> Optional["PDFCache"]:
+        """
+        Get the process-wide cache configured from settings.
+
+        :return: PDFCache or None if caching is disabled
+        """
+        if not getattr(settings, "INVOICE_PDF_CACHE_ENABLED", False):
+            return None
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(
+                    memory_bytes=settings.INVOICE_PDF_CACHE_MEMORY_BYTES,
+                    disk_dir=settings.INVOICE_PDF_CACHE_DIR or None,
+                    disk_bytes=settings.INVOICE_PDF_CACHE_DISK_BYTES,
+                    ttl=settings.INVOICE_PDF_CACHE_TTL,
+                )
+            return cls._instance
+
+    @classmethod
+    def make_key(cls, context: Dict[str, Any], template_name: str) -> str:
+        """
+        Build the content address of a prepared invoice context.
+
+        :param context: Prepared invoice context
+        :param template_name: Fingerprint of the template the context is
+            rendered with, see ``TemplateRegistry.fingerprint``
+
+        :return: Hex SHA-256 digest
+        """
+        content = {key: value for key, value in context.items()
+                   if key not in cls.VOLATILE_FIELDS}
+        content["__template__"] = template_name
+        payload = json.dumps(content, sort_keys=True, default=str,
+                             ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """
+        Look up a PDF, promoting disk hits into memory.
+
+        :param key: Content address
+
+        :return: (PDF bytes, invoice number printed on it) or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, pdf, invoice_number = entry
+                if now - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits["memory"] += 1
+                    return pdf, invoice_number
+                self._drop(key)
+
+        pdf, invoice_number, created = self._read_disk(key, now)
+        with self._lock:
+            if pdf is None:
+                self.misses += 1
+                return None
+            self.hits["disk"] += 1
+            self._remember(key, created, pdf, invoice_number)
+        return pdf, invoice_number
+
+    def set(self, key: str, pdf: bytes, invoice_number: str) -> None:
+        """
+        Store a freshly rendered PDF in both tiers.
+
+        :param key: Content address
+        :param pdf: PDF bytes
+        :param invoice_number: Invoice number printed on the PDF
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, pdf, invoice_number)
+        self._write_disk(key, pdf, invoice_number)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit/miss counters and tier usage.
+
+        :return: Dictionary of counters
+        """
+        with self._lock:
+            return {
+                "hits_memory": self.hits["memory"],
+                "hits_disk": self.hits["disk"],
+                "misses": self.misses,
+                "memory_entries": len(self._entries),
+                "memory_bytes": self._memory_used,
+                "disk_bytes": self._disk_used,
+            }
+
+    def clear(self) -> None:
+        """
+        Drop the in-memory tier and reset counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._memory_used = 0
+            self.hits = {"memory": 0, "disk": 0}
+            self.misses = 0
+
+    def _remember(self, key: str, created: float, pdf: bytes, invoice_number: str) -> None:
+        if len(pdf) > self.memory_bytes:
+            return
+        self._drop(key)
+        self._entries[key] = (created, pdf, invoice_number)
+        self._memory_used += len(pdf)
+        while self._memory_used > self.memory_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._memory_used -= len(entry[1])
+
+    def _path(self, key: str) -> Path:
+        # Shard by the first two hex digits to keep directories small.
+        return self.disk_dir / key[:2] / f"{key}.pdf"
+
+    def _read_disk(self, key: str,
+                   now: float) -> Tuple[Optional[bytes], Optional[str], float]:
+        if self.disk_dir is None:
+            return None, None, now
+        path = self._path(key)
+        try:
+            # mtime records when the PDF was rendered, atime when it was last served.
+            created = path.stat().st_mtime
+            data = path.read_bytes() if now - created <= self.ttl else b""
+            # The invoice number is stored on the first line, before the PDF
+            header, _, pdf = data.partition(b"\n")
+            if not header or header.startswith(b"%PDF"):
+                # Expired, or written without its number
+                path.unlink(missing_ok=True)
+                return None, None, now
+            os.utime(path, (now, created))
+            return pdf, header.decode("utf-8"), created
+        except FileNotFoundError:
+            return None, None, now
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning(f"PDF cache read failed for {key}: {e}")
+            return None, None, now
+
+    def _write_disk(self, key: str, pdf: bytes, invoice_number: str) -> None:
+        if self.disk_dir is None:
+            return
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_bytes(invoice_number.encode("utf-8") + b"\n" + pdf)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"PDF cache write failed for {key}: {e}")
+            return
+
+        with self._lock:
+            if self._disk_used is None:
+                self._disk_used = self._scan_disk_usage()
+            else:
+                self._disk_used += len(pdf)
+            if self._disk_used > self.disk_bytes:
+                self._evict_disk()
+
+    def _scan_disk_usage(self) -> int:
+        return sum(path.stat().st_size for path in self.disk_dir.glob("*/*.pdf"))
+
+    def _evict_disk(self) -> None:
+        """
+        Remove least recently used files until the tier is under 90% of its budget.
+        """
+        files = []
+        for path in self.disk_dir.glob("*/*.pdf"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_atime, stat.st_size, path))
+        files.sort()
+
+        used = sum(size for _, size, _ in files)
+        target = int(self.disk_bytes * 0.9)
+        for _, size, path in files:
+            if used <= target:
+                break
+            path.unlink(missing_ok=True)
+            used -= size
+        self._disk_used = used
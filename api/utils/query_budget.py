@@ -0,0 +1,103 @@
+import logging
+from typing import Any, Callable, List, Optional, Tuple
+
+from django.db import connections
+
+from api.exceptions import QueryBudgetExceeded
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudget:
+    """
+    Count the database queries of a block and fail when they exceed a budget.
+
+    Usable in tests around a client call, like ``assertNumQueries`` but
+    as an upper bound::
+
+        with QueryBudget(3, "favourites list"):
+            client.get("/api/favourites/")
+
+    :param budget: Maximum number of queries
+    :param label: Name of the block for the error message
+    :param using: Database alias to count
+    :param strict: Raise ``QueryBudgetExceeded`` on exit when over budget
+
+    Savepoint statements are not counted: ``transaction.atomic`` issues
+    them only when nested, e.g. inside a test case, so counting them
+    would make the same view cost more under test than when served.
+    """
+
+    # Queries listed in the error message
+    REPORTED_QUERIES = 20
+    UNCOUNTED = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+    def __init__(self, budget: int, label: str = "block", using: str = "default",
+                 strict: bool = True) -> None:
+        self.budget = budget
+        self.label = label
+        self.strict = strict
+        self.queries: List[str] = []
+        self._wrapper = connections[using].execute_wrapper(self._record)
+
+    @staticmethod
+    def for_view(view_func: Callable, method: str) -> Optional[Tuple[str, int]]:
+        """
+        Look up the budget a view declares for a request method.
+
+        Views declare ``query_budgets``, keyed by action name on viewsets
+        (e.g. ``{"list": 3, "retrieve": 3}``) and by lowercase method on
+        other API views (e.g. ``{"get": 2}``).
+
+        :param view_func: View function from ``as_view()``
+        :param method: HTTP method of the request
+
+        :return: (label, budget) or None if the view declares no budget
+        """
+        view_class = getattr(view_func, "cls", None)
+        budgets = getattr(view_class, "query_budgets", None)
+        if not budgets:
+            return None
+        actions = getattr(view_func, "actions", None)
+        name = actions.get(method.lower()) if actions else method.lower()
+        if name not in budgets:
+            return None
+        return f"{view_class.__name__}.{name}", budgets[name]
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def exceeded(self) -> bool:
+        return self.count > self.budget
+
+    def report(self) -> str:
+        """
+        Describe the overrun with the first queries.
+
+        :return: Message
+        """
+        lines = [f"{self.label} ran {self.count} queries, budget {self.budget}"]
+        lines += [f"{number}. {sql}" for number, sql
+                  in enumerate(self.queries[:self.REPORTED_QUERIES], start=1)]
+        if self.count > self.REPORTED_QUERIES:
+            lines.append(f"... {self.count - self.REPORTED_QUERIES} more")
+        return "\n".join(lines)
+
+    def _record(self, execute: Callable, sql: str, params: Any, many: bool,
+                context: Any) -> Any:
+        if not sql.startswith(self.UNCOUNTED):
+            self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __enter__(self) -> "QueryBudget":
+        self.queries = []
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._wrapper.__exit__(exc_type, exc_value, traceback)
+        if self.strict and exc_type is None and self.exceeded:
+            raise QueryBudgetExceeded(self.report())
@@ -0,0 +1,613 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from pypdf import PdfWriter
+from weasyprint import HTML
+
+from api.exceptions import InvoiceGenerationError
+from api.utils.render_profiles import RenderProfiles
+from api.utils.render_watchdog import RenderWatchdog
+from api.utils.stylesheets import StylesheetCache
+from api.utils.template_registry import TemplateRegistry
+from api.utils.timing import record_stages
+
+
+logger = logging.getLogger(__name__)
+
+BODY_RE = re.compile(r"<body[^>]*>(.*)</body>", re.S | re.I)
+
+# Synthetic context used to exercise every template once per worker.
+WARMUP_CONTEXT: Dict[str, Any] = {
+    "invoice_number": "00000000000000",
+    "currency": "GEL",
+    "should_use_invoice_date_currency_rate": False,
+    "purposes": [
+        {"description": "Warm-up", "amount": "100.00", "has_vat": True,
+         "vat_amount": "18.00", "total": "118.00"},
+        {"description": "Warm-up", "amount": "100.00", "has_vat": False,
+         "vat_amount": "0.00", "total": "100.00"},
+    ],
+    "total_amount": "218.00",
+    "vat_total": "18.00",
+    "total_without_vat": "200.00",
+    "receiver_ka": "მიმღები",
+    "receiver_en": "Receiver",
+    "receiver_id": "000000000",
+    "receiver_phone": "",
+    "date_now": "1 იანვარი, 2025წ.",
+    "date_now_en": "1 January, 2025",
+    "payer_ka": "გადამხდელი",
+    "payer_en": "Payer",
+    "payer_id": "000000000",
+    "payer_phone": "",
+    "bank_name_ka": "ბანკი",
+    "bank_name_en": "Bank",
+    "bank_acc_num": "GE00XX0000000000000000",
+    "bank_code": "XXXXGE22",
+    "row_offset": 0,
+}
+
+
+def _initialize_worker() -> None:
+    """
+    Initialize a render worker process.
+
+    Sets up Django, imports WeasyPrint, compiles the template
+    stylesheets and renders every invoice template once so fonts and
+    template parsing are warm before the first real job arrives.
+    """
+    import django
+    django.setup()
+
+    from api.utils.invoice_generator import TemplateSelector
+
+    StylesheetCache.load()
+    for templates in TemplateSelector.TEMPLATE_MAPPING.values():
+        for template_path in templates.values():
+            try:
+                html = TemplateRegistry.get(template_path).render(WARMUP_CONTEXT)
+                _render_job(html, template_path)
+            except Exception as e:
+                logger.warning(f"Warm-up failed for {template_path}: {e}")
+    logger.info(f"Render worker {os.getpid()} ready")
+
+
+def _initialize_job_process() -> None:
+    """
+    Initialize a process that runs a single render job.
+
+    Only sets up Django and the template stylesheets; unlike pool
+    workers it renders no warm-up invoices, which would cost more than
+    the one job it runs.
+    """
+    import django
+    django.setup()
+
+    StylesheetCache.load()
+
+
+def _render_job(html: str, template_name: Optional[str] = None,
+                profile: Optional[str] = None) -> Tuple[bytes, Dict[str, float]]:
+    """
+    Render HTML to PDF with the template's precompiled stylesheet.
+
+    :param html: Rendered invoice HTML
+    :param template_name: Template file the HTML was rendered from
+    :param profile: Render profile of the PDF output options
+
+    :return: (PDF bytes, layout and PDF serialization times in milliseconds)
+    """
+    start = time.perf_counter()
+    html, stylesheets = StylesheetCache.split(html, template_name)
+    document = HTML(string=html).render(
+        stylesheets=stylesheets,
+        font_config=StylesheetCache.font_config(),
+    )
+    laid_out = time.perf_counter()
+    pdf = document.write_pdf(**RenderProfiles.options(profile))
+    timings = {
+        "pdf_layout": (laid_out - start) * 1000,
+        "pdf_write": (time.perf_counter() - laid_out) * 1000,
+    }
+    return pdf, timings
+
+
+def _watched_job(job: Callable[..., Tuple[Any, Dict[str, float]]],
+                 *args: Any) -> Tuple[Any, Dict[str, float], Dict[str, Any]]:
+    """
+    Run a render job and count it on the watchdog of the rendering process.
+
+    :param job: Render job returning (result, timings)
+    :param args: Job arguments
+
+    :return: (result, timings, watchdog counters of the rendering process)
+    """
+    result, timings = job(*args)
+    return result, timings, RenderWatchdog.record()
+
+
+def _merge_html(htmls: List[str]) -> str:
+    """
+    Merge rendered invoices into one HTML document with page breaks.
+
+    The head (and therefore the stylesheet) of the first invoice is kept
+    and the body of every invoice is appended on its own page.
+
+    :param htmls: Rendered invoice HTML documents sharing a template
+
+    :return: Single HTML document
+    """
+    bodies = []
+    for position, html in enumerate(htmls):
+        body = BODY_RE.search(html).group(1)
+        if position:
+            body = f'<div style="break-before: page">{body}</div>'
+        bodies.append(body)
+    first = BODY_RE.search(htmls[0])
+    return htmls[0][:first.start(1)] + "".join(bodies) + htmls[0][first.end(1):]
+
+
+def _render_merged_job(parts: List[Tuple[str, str]],
+                       profile: Optional[str] = None) -> Tuple[bytes, Dict[str, float]]:
+    """
+    Render several invoices into a single PDF.
+
+    Consecutive invoices sharing a template are laid out as one
+    document; the pages of all documents are then written as one PDF.
+
+    :param parts: (rendered HTML, template name) of each invoice, in page order
+    :param profile: Render profile of the PDF output options
+
+    :return: (PDF bytes, layout and PDF serialization times in milliseconds)
+    """
+    start = time.perf_counter()
+    documents = []
+    for template_name, group in itertools.groupby(parts, key=lambda part: part[1]):
+        html = _merge_html([html for html, _ in group])
+        html, stylesheets = StylesheetCache.split(html, template_name)
+        documents.append(HTML(string=html).render(
+            stylesheets=stylesheets,
+            font_config=StylesheetCache.font_config(),
+        ))
+    laid_out = time.perf_counter()
+    pages = [page for document in documents for page in document.pages]
+    pdf = documents[0].copy(pages).write_pdf(**RenderProfiles.options(profile))
+    timings = {
+        "pdf_layout": (laid_out - start) * 1000,
+        "pdf_write": (time.perf_counter() - laid_out) * 1000,
+    }
+    return pdf, timings
+
+
+def _render_large_job(context: Dict[str, Any], template_name: str,
+                      directory: Optional[str] = None,
+                      profile: Optional[str] = None) -> Tuple[Any, Dict[str, float]]:
+    """
+    Render an invoice with many purposes a chunk of purposes at a time.
+
+    Every chunk of ``INVOICE_LARGE_CHUNK_LINES`` purposes is annotated,
+    rendered to HTML, laid out as its own document starting on a new
+    page and written to its own PDF file; the header is only rendered
+    with the first chunk and the totals and bank details only with the
+    last. Only one chunk's HTML, DOM, style cascade and layout are alive
+    at a time. The chunk PDFs are then concatenated, which holds their
+    parsed PDF objects (several times the size of the PDF) but no layout,
+    so peak memory grows with the PDF rather than with the layout of
+    every line at once.
+
+    :param context: Invoice template context with unannotated purposes
+    :param template_name: Template file to render
+    :param directory: Directory for the chunk PDFs and the result,
+        removed by the caller; None to use a temporary directory and
+        return a spooled temporary file
+    :param profile: Render profile of the PDF output options
+
+    :return: (PDF file or its path in directory, render, layout and PDF
+        serialization times in milliseconds)
+    """
+    timings = {"template_render": 0.0, "pdf_layout": 0.0, "pdf_write": 0.0}
+    if directory is not None:
+        paths = _render_chunks(context, template_name, directory, profile, timings)
+        start = time.perf_counter()
+        # Pool workers hand the PDF back as a file path instead of
+        # sending its bytes over IPC.
+        target = os.path.join(directory, "invoice.pdf")
+        with open(target, "wb") as pdf_file:
+            _concatenate_pdfs(paths, pdf_file)
+    else:
+        with tempfile.TemporaryDirectory() as chunk_directory:
+            paths = _render_chunks(context, template_name, chunk_directory, profile, timings)
+            start = time.perf_counter()
+            target = tempfile.SpooledTemporaryFile(
+                max_size=getattr(settings, "INVOICE_PDF_SPOOL_BYTES", 16 * 1024 * 1024))
+            _concatenate_pdfs(paths, target)
+            target.seek(0)
+    timings["pdf_write"] += (time.perf_counter() - start) * 1000
+    return target, timings
+
+
+def _render_chunks(context: Dict[str, Any], template_name: str, directory: str,
+                   profile: Optional[str], timings: Dict[str, float]) -> List[str]:
+    """
+    Lay out and write every chunk of purposes of a large invoice.
+
+    :param context: Invoice template context with unannotated purposes
+    :param template_name: Template file to render
+    :param directory: Directory for the chunk PDFs
+    :param profile: Render profile of the PDF output options
+    :param timings: Render, layout and PDF serialization times, added to
+
+    :return: Paths of the chunk PDFs, in page order
+    """
+    from api.utils.invoice_generator import InvoiceService
+
+    template = TemplateRegistry.get(template_name)
+    chunk_lines = max(1, getattr(settings, "INVOICE_LARGE_CHUNK_LINES", 200))
+    options = RenderProfiles.options(profile)
+    purposes = context["purposes"]
+    paths = []
+    for offset in range(0, max(len(purposes), 1), chunk_lines):
+        start = time.perf_counter()
+        html = template.render({
+            **context,
+            "purposes": InvoiceService.annotate_purposes(purposes[offset:offset + chunk_lines],
+                                                         context.get("currency", "")),
+            "row_offset": offset,
+            "continuation": offset > 0,
+            "has_more": offset + chunk_lines < len(purposes),
+        })
+        rendered = time.perf_counter()
+        html, stylesheets = StylesheetCache.split(html, template_name)
+        document = HTML(string=html).render(
+            stylesheets=stylesheets,
+            font_config=StylesheetCache.font_config(),
+        )
+        laid_out = time.perf_counter()
+        paths.append(os.path.join(directory, f"chunk-{len(paths):05d}.pdf"))
+        with open(paths[-1], "wb") as chunk_file:
+            document.write_pdf(target=chunk_file, **options)
+        timings["template_render"] += (rendered - start) * 1000
+        timings["pdf_layout"] += (laid_out - rendered) * 1000
+        timings["pdf_write"] += (time.perf_counter() - laid_out) * 1000
+    return paths
+
+
+def _concatenate_pdfs(paths: List[str], target: BinaryIO) -> None:
+    """
+    Write the pages of several PDFs as one PDF.
+
+    The first PDF is copied whole, so its metadata and output intents
+    (e.g. of the archival profile) are kept.
+
+    :param paths: PDF files, in page order
+    :param target: Binary file to write to
+    """
+    if len(paths) == 1:
+        with open(paths[0], "rb") as pdf_file:
+            shutil.copyfileobj(pdf_file, target)
+        return
+    writer = PdfWriter(clone_from=paths[0])
+    for path in paths[1:]:
+        writer.append(path)
+    # Every chunk embeds its own copy of the fonts and images it uses
+    writer.compress_identical_objects(remove_duplicates=True, remove_unreferenced=True)
+    writer.write(target)
+
+
+class RenderPool:
+    """
+    Process pool that renders invoice PDFs outside the web worker.
+
+    The pool is started once per process (at WSGI boot, or lazily on
+    the first render) and is sized from the CPU count unless
+    ``INVOICE_RENDER_POOL_SIZE`` is set. Workers report their render
+    count and RSS with every job; once one reaches the
+    ``RenderWatchdog`` limits the pool is restarted, draining the jobs
+    in flight on the old workers.
+    """
+
+    _executor: Optional[ProcessPoolExecutor] = None
+    _workers: Dict[int, Dict[str, Any]] = {}
+    _restarts = 0
+    _isolated: Optional[threading.BoundedSemaphore] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def enabled() -> bool:
+        """
+        Check whether rendering should go through the pool.
+
+        :return: True if the pool is enabled in settings
+        """
+        return getattr(settings, "INVOICE_RENDER_POOL_ENABLED", False)
+
+    @staticmethod
+    def size() -> int:
+        """
+        Number of worker processes for this web worker.
+
+        When several web workers run on one node (``WEB_CONCURRENCY``),
+        the CPUs are split between them.
+
+        :return: Pool size
+        """
+        configured = getattr(settings, "INVOICE_RENDER_POOL_SIZE", 0)
+        if configured:
+            return configured
+        web_workers = int(os.getenv("WEB_CONCURRENCY", "1")) or 1
+        return max(1, (os.cpu_count() or 1) // web_workers)
+
+    @classmethod
+    def start(cls) -> ProcessPoolExecutor:
+        """
+        Start the pool if it is not running yet.
+
+        :return: Running executor
+        """
+        with cls._lock:
+            if cls._executor is None:
+                size = cls.size()
+                cls._executor = ProcessPoolExecutor(
+                    max_workers=size,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_initialize_worker,
+                )
+                # Spawn every worker now so warm-up happens at boot
+                # instead of during the first requests.
+                for _ in range(size):
+                    cls._executor.submit(os.getpid)
+                logger.info(f"Render pool started with {size} workers")
+            return cls._executor
+
+    @classmethod
+    def shutdown(cls, wait: bool = True) -> None:
+        """
+        Stop the pool.
+
+        :param wait: Wait for in-flight jobs to finish
+        """
+        with cls._lock:
+            if cls._executor is not None:
+                cls._executor.shutdown(wait=wait, cancel_futures=not wait)
+                cls._executor = None
+                cls._workers = {}
+
+    @classmethod
+    def restart(cls, expected: Optional[ProcessPoolExecutor] = None) -> None:
+        """
+        Replace a running pool with freshly started workers.
+
+        Jobs already submitted finish on the old workers, which exit
+        afterwards; new jobs go to the new pool.
+
+        :param expected: Only restart if this is still the running pool
+        """
+        with cls._lock:
+            if expected is not None and cls._executor is not expected:
+                return
+            executor, cls._executor = cls._executor, None
+            cls._workers = {}
+            if executor is not None:
+                cls._restarts += 1
+        if executor is None:
+            return
+        cls.start()
+        executor.shutdown(wait=False)
+        logger.info("Render pool restarted")
+
+    @classmethod
+    def render(cls, html: str, template_name: Optional[str] = None,
+               profile: Optional[str] = None) -> bytes:
+        """
+        Render HTML to PDF, in the pool when enabled or inline otherwise.
+
+        :param html: Rendered invoice HTML
+        :param template_name: Template file the HTML was rendered from
+        :param profile: Render profile of the PDF output options
+
+        :return: PDF bytes
+
+        :raises: InvoiceGenerationError: If the pool is broken or the job times out
+        """
+        return cls._run(_render_job, html, template_name, profile)
+
+    @classmethod
+    def render_merged(cls, parts: List[Tuple[str, str]],
+                      profile: Optional[str] = None) -> bytes:
+        """
+        Render several invoices into a single PDF, in the pool when enabled.
+
+        :param parts: (rendered HTML, template name) of each invoice, in page order
+        :param profile: Render profile of the PDF output options
+
+        :return: PDF bytes
+
+        :raises: InvoiceGenerationError: If the pool is broken or the job times out
+        """
+        return cls._run(_render_merged_job, parts, profile)
+
+    @classmethod
+    def render_large(cls, context: Dict[str, Any], template_name: str,
+                     profile: Optional[str] = None) -> BinaryIO:
+        """
+        Render an invoice with many purposes in chunks.
+
+        With the pool enabled, the job runs in a process of its own
+        rather than on a pool worker, so a render that times out can be
+        stopped without failing the jobs of other requests.
+
+        :param context: Invoice template context with unannotated purposes
+        :param template_name: Template file to render
+        :param profile: Render profile of the PDF output options
+
+        :return: PDF file object positioned at its start
+
+        :raises: InvoiceGenerationError: If the pool is broken or the job times out
+        """
+        if not cls.enabled():
+            return cls._run(_render_large_job, context, template_name, None, profile)
+
+        # Made here rather than in the worker, so it is removed even when
+        # the job times out and its process is stopped
+        directory = tempfile.mkdtemp(prefix="invoice-")
+        try:
+            path = cls._run_isolated(_render_large_job, context, template_name, directory, profile,
+                                     timeout=getattr(settings, "INVOICE_LARGE_RENDER_TIMEOUT", 600))
+            return open(path, "rb")
+        finally:
+            # The open file stays readable after unlinking
+            shutil.rmtree(directory, ignore_errors=True)
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """
+        Watchdog counters of the pool workers, as last reported by each.
+
+        :return: Whether the pool is enabled, restart count and worker counters
+        """
+        with cls._lock:
+            return {"enabled": cls.enabled(), "restarts": cls._restarts,
+                    "workers": sorted(cls._workers.values(), key=lambda worker: worker["pid"])}
+
+    @classmethod
+    def _observe(cls, executor: ProcessPoolExecutor, stats: Dict[str, Any]) -> None:
+        """
+        Store a worker's counters and restart the pool if it reached the limits.
+
+        :param executor: Pool the job ran on
+        :param stats: Watchdog counters of the worker
+        """
+        with cls._lock:
+            if cls._executor is not executor:
+                return
+            cls._workers[stats["pid"]] = stats
+        if RenderWatchdog.should_retire(stats):
+            logger.warning(f"Render worker {stats['pid']} reached its limits "
+                           f"({stats['renders']} renders, {stats['rss_mb']} MB), "
+                           f"restarting the render pool")
+            cls.restart(expected=executor)
+
+    @classmethod
+    def _run(cls, job: Callable[..., Tuple[Any, Dict[str, float]]], *args: Any,
+             timeout: Optional[int] = None) -> Any:
+        """
+        Run a render job on the pool when enabled, inline otherwise.
+
+        A job that is still queued when it times out is cancelled; one
+        that is running finishes on its worker, as stopping a pool
+        worker would fail every other job in flight on the pool.
+
+        :param job: Render job returning (result, timings)
+        :param args: Job arguments
+        :param timeout: Seconds to wait for the result, INVOICE_RENDER_TIMEOUT if None
+
+        :return: Result of the job
+
+        :raises: InvoiceGenerationError: If the pool is broken or the job times out
+        """
+        if not cls.enabled():
+            pdf, timings, stats = _watched_job(job, *args)
+            record_stages(timings)
+            if RenderWatchdog.should_retire(stats):
+                RenderWatchdog.retire_web_worker(stats)
+            return pdf
+
+        timeout = timeout or getattr(settings, "INVOICE_RENDER_TIMEOUT", 60)
+        start = time.perf_counter()
+        executor = cls.start()
+        future = executor.submit(_watched_job, job, *args)
+        try:
+            pdf, timings, stats = future.result(timeout=timeout)
+            elapsed = (time.perf_counter() - start) * 1000
+            # Time spent waiting for a free worker and moving data over IPC
+            timings["render_queue"] = max(0.0, elapsed - sum(timings.values()))
+            record_stages(timings)
+            cls._observe(executor, stats)
+            return pdf
+        except FutureTimeoutError:
+            if not future.cancel():
+                logger.error(f"Render job timed out after {timeout}s, its worker finishes it")
+            raise InvoiceGenerationError(f"PDF rendering timed out after {timeout}s")
+        except BrokenProcessPool:
+            logger.error("Render pool is broken, restarting it")
+            cls.restart(expected=executor)
+            raise InvoiceGenerationError("Render worker crashed")
+
+    @classmethod
+    def _run_isolated(cls, job: Callable[..., Tuple[Any, Dict[str, float]]], *args: Any,
+                      timeout: int) -> Any:
+        """
+        Run a render job in a single-use process, killed if the job times out.
+
+        At most ``size()`` such processes run at a time; the wait for one
+        counts as ``render_queue``.
+
+        :param job: Render job returning (result, timings)
+        :param args: Job arguments
+        :param timeout: Seconds to wait for the result, process start included
+
+        :return: Result of the job
+
+        :raises: InvoiceGenerationError: If the process crashes or the job times out
+        """
+        start = time.perf_counter()
+        with cls._isolated_slots():
+            executor = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_initialize_job_process,
+            )
+            try:
+                future = executor.submit(_watched_job, job, *args)
+                result, timings, _ = future.result(timeout=timeout)
+            except FutureTimeoutError:
+                logger.error(f"Render job timed out after {timeout}s, stopping its process")
+                cls._kill(executor)
+                raise InvoiceGenerationError(f"PDF rendering timed out after {timeout}s")
+            except BrokenProcessPool:
+                logger.error("Render process crashed")
+                raise InvoiceGenerationError("Render worker crashed")
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+        elapsed = (time.perf_counter() - start) * 1000
+        # Waiting for a slot, starting the process and moving data over IPC
+        timings["render_queue"] = max(0.0, elapsed - sum(timings.values()))
+        record_stages(timings)
+        return result
+
+    @classmethod
+    def _isolated_slots(cls) -> threading.BoundedSemaphore:
+        """
+        Semaphore limiting the single-use render processes to the pool size.
+        """
+        with cls._lock:
+            if cls._isolated is None:
+                cls._isolated = threading.BoundedSemaphore(cls.size())
+            return cls._isolated
+
+    @staticmethod
+    def _kill(executor: ProcessPoolExecutor) -> None:
+        """
+        Kill the processes of an executor, stopping the jobs they run.
+
+        :param executor: Executor to stop
+        """
+        # ProcessPoolExecutor has no public way to stop running jobs
+        # before Python 3.14
+        processes = list((executor._processes or {}).values())
+        for process in processes:
+            process.kill()
+        for process in processes:
+            process.join(timeout=5)
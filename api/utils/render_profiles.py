@@ -0,0 +1,92 @@
+import logging
+from enum import Enum
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class RenderProfile(str, Enum):
+    """
+    Named sets of PDF output options, trading file size against render time.
+    """
+    FAST = "fast"
+    COMPACT = "compact"
+    ARCHIVAL = "archival"
+
+
+class RenderProfiles:
+    """
+    WeasyPrint ``write_pdf`` options of each render profile.
+
+    - ``fast``: for interactive downloads. Streams are left uncompressed
+      and fonts are embedded whole instead of subset, skipping the two
+      most expensive steps of PDF serialization at the cost of size.
+    - ``compact``: for bulk and mailed invoices. Compressed streams,
+      subset fonts and recompressed, downsampled images.
+    - ``archival``: PDF/A-3b with document metadata, subset fonts and
+      compressed streams, for long-term storage.
+    """
+
+    OPTIONS: Dict[RenderProfile, Dict[str, Any]] = {
+        RenderProfile.FAST: {
+            "uncompressed_pdf": True,
+            "full_fonts": True,
+            "optimize_images": False,
+        },
+        RenderProfile.COMPACT: {
+            "uncompressed_pdf": False,
+            "full_fonts": False,
+            "optimize_images": True,
+            "jpeg_quality": 75,
+            "dpi": 150,
+        },
+        RenderProfile.ARCHIVAL: {
+            "uncompressed_pdf": False,
+            "full_fonts": False,
+            "optimize_images": False,
+            "pdf_variant": "pdf/a-3b",
+            "custom_metadata": True,
+        },
+    }
+
+    @staticmethod
+    def default() -> RenderProfile:
+        """
+        Get the profile used when neither the request nor the user picks one.
+
+        :return: Default render profile from settings
+        """
+        return RenderProfile(getattr(settings, "INVOICE_RENDER_PROFILE", RenderProfile.COMPACT))
+
+    @classmethod
+    def resolve(cls, *names: Optional[str]) -> RenderProfile:
+        """
+        Get the first valid profile of the given names, e.g. the request's
+        profile followed by the user's default.
+
+        :param names: Profile names in order of precedence, None for unset
+
+        :return: Render profile, the default one if no name is valid
+        """
+        for name in names:
+            if not name:
+                continue
+            try:
+                return RenderProfile(name)
+            except ValueError:
+                logger.warning(f"Invalid render profile: {name}, skipping")
+        return cls.default()
+
+    @classmethod
+    def options(cls, profile: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get the ``write_pdf`` options of a profile.
+
+        :param profile: Profile name, the default profile if None
+
+        :return: Keyword arguments for ``Document.write_pdf``
+        """
+        return dict(cls.OPTIONS[cls.resolve(profile)])
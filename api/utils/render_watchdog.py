@@ -0,0 +1,124 @@
+import logging
+import os
+import resource
+import signal
+import threading
+from typing import Any, Dict
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def current_rss_mb() -> float:
+    """
+    Resident set size of this process.
+
+    Read from ``/proc`` where available, falling back to the peak RSS
+    elsewhere.
+
+    :return: RSS in megabytes
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * resource.getpagesize() / (1024 * 1024)
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RenderWatchdog:
+    """
+    Per-process render count and memory watchdog.
+
+    WeasyPrint and Pango do not give all memory back between renders,
+    so processes that render are retired once they reach
+    ``INVOICE_RENDER_MAX_RENDERS`` renders or ``INVOICE_RENDER_MAX_RSS_MB``
+    of RSS (0 disables either limit):
+
+    - a web worker rendering inline asks gunicorn to replace it with
+      SIGTERM, which lets in-flight requests finish before it exits;
+    - render pool workers report their counters with every job and
+      ``RenderPool`` drains and restarts the pool.
+    """
+
+    _renders = 0
+    _retiring = False
+    _lock = threading.Lock()
+
+    @classmethod
+    def record(cls) -> Dict[str, Any]:
+        """
+        Count a render of this process.
+
+        :return: Process id, render count and RSS after the render
+        """
+        with cls._lock:
+            cls._renders += 1
+            renders = cls._renders
+        return {"pid": os.getpid(), "renders": renders,
+                "rss_mb": round(current_rss_mb(), 1)}
+
+    @staticmethod
+    def limits() -> Dict[str, int]:
+        """
+        Configured retirement limits.
+
+        :return: Maximum renders and RSS in megabytes, 0 for no limit
+        """
+        return {
+            "max_renders": getattr(settings, "INVOICE_RENDER_MAX_RENDERS", 0),
+            "max_rss_mb": getattr(settings, "INVOICE_RENDER_MAX_RSS_MB", 0),
+        }
+
+    @classmethod
+    def should_retire(cls, stats: Dict[str, Any]) -> bool:
+        """
+        Check whether a process reached a retirement limit.
+
+        :param stats: Counters returned by ``record``
+
+        :return: True if the process should be replaced
+        """
+        limits = cls.limits()
+        return bool(
+            (limits["max_renders"] and stats["renders"] >= limits["max_renders"])
+            or (limits["max_rss_mb"] and stats["rss_mb"] >= limits["max_rss_mb"])
+        )
+
+    @classmethod
+    def retire_web_worker(cls, stats: Dict[str, Any]) -> None:
+        """
+        Ask gunicorn to gracefully replace this web worker, once.
+
+        Outside gunicorn (runserver, management commands) the limit is
+        only logged.
+
+        :param stats: Counters returned by ``record``
+        """
+        with cls._lock:
+            if cls._retiring:
+                return
+            cls._retiring = True
+
+        if "gunicorn" not in os.environ.get("SERVER_SOFTWARE", ""):
+            logger.warning(f"Process {stats['pid']} reached its render limits "
+                           f"({stats['renders']} renders, {stats['rss_mb']} MB) "
+                           f"but is not a gunicorn worker, not retiring it")
+            return
+        logger.warning(f"Retiring web worker {stats['pid']} after "
+                       f"{stats['renders']} renders at {stats['rss_mb']} MB")
+        # Gunicorn workers stop accepting requests on SIGTERM and exit
+        # once their in-flight requests are done; the arbiter replaces them.
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    @classmethod
+    def snapshot(cls) -> Dict[str, Any]:
+        """
+        Counters of this process.
+
+        :return: Process id, render count, RSS and whether it is retiring
+        """
+        return {"pid": os.getpid(), "renders": cls._renders,
+                "rss_mb": round(current_rss_mb(), 1), "retiring": cls._retiring}
@@ -0,0 +1,609 @@
+import hashlib
+import io
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.template import Context
+from django.template.base import render_value_in_context
+from fontTools.ttLib import TTFont
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import (ContentStream, DictionaryObject, IndirectObject, NameObject,
+                           NumberObject, TextStringObject, create_string_object)
+
+from api.utils.render_pool import RenderPool
+from api.utils.render_profiles import RenderProfile, RenderProfiles
+from api.utils.template_registry import TemplateRegistry
+
+
+logger = logging.getLogger(__name__)
+
+# A field's marker: its slot number, optionally padded with filler
+MARKER_RE = re.compile(r"Qx(\d{4})[0 ]*xQ")
+# Part of a marker outside of a slot, e.g. one split over two lines
+PARTIAL_MARKER_RE = re.compile(r"Qx\d|\dxQ")
+# Text operators of a slot; anything else (spacing, rise, line moves)
+# makes the slot's placement depend on more than its matrix
+SLOT_OPERATORS = {b"Tm", b"Tf", b"TJ", b"Tj"}
+
+
+class _Unstampable(Exception):
+    pass
+
+
+class _Font:
+    """
+    Glyphs and widths of a whole embedded TrueType font (Type0, Identity-H).
+
+    :param font: Type0 font dictionary
+    """
+
+    def __init__(self, font: DictionaryObject) -> None:
+        descendant = font["/DescendantFonts"][0].get_object()
+        if (font.get("/Encoding") != "/Identity-H"
+                or descendant.get("/CIDToGIDMap", "/Identity") != "/Identity"
+                or "/FontFile2" not in descendant["/FontDescriptor"]):
+            raise _Unstampable(f"Unsupported font {font.get('/BaseFont')}")
+        data = descendant["/FontDescriptor"]["/FontFile2"].get_data()
+        ttf = TTFont(io.BytesIO(data), lazy=True)
+        self.glyphs = {code: ttf.getGlyphID(name) for code, name in ttf.getBestCmap().items()}
+        self.characters: Dict[int, str] = {}
+        for code, glyph in sorted(self.glyphs.items(), reverse=True):
+            self.characters[glyph] = chr(code)
+        self.default_width = descendant.get("/DW", 1000)
+        self.widths: Dict[int, float] = {}
+        widths = list(descendant.get("/W", []))
+        while widths:
+            first, second = widths[0], widths[1]
+            if isinstance(second, list):
+                self.widths.update({first + i: width for i, width in enumerate(second)})
+                widths = widths[2:]
+            else:
+                self.widths.update({glyph: widths[2] for glyph in range(first, second + 1)})
+                widths = widths[3:]
+
+    def width(self, glyphs: List[int]) -> float:
+        """
+        Width of glyphs in thousandths of the font size.
+        """
+        return sum(self.widths.get(glyph, self.default_width) for glyph in glyphs)
+
+    def encode(self, text: str) -> Optional[List[int]]:
+        """
+        Glyph ids of text, or None if the font lacks any of its characters.
+        """
+        glyphs = [self.glyphs.get(ord(character)) for character in text]
+        return None if None in glyphs else glyphs
+
+
+class _Unit:
+    """
+    One text box drawn by WeasyPrint: a ``Tm`` and the text shown at it.
+    """
+
+    def __init__(self, matrix: List[float]) -> None:
+        self.operations: List[Tuple[List[Any], bytes]] = []
+        self.matrix = matrix
+        # (resource name, size) of the first text shown, and of all of it
+        self.font: Optional[Tuple[str, float]] = None
+        self.fonts = set()
+        self.glyphs: List[int] = []
+        self.adjustment = 0.0
+        self.adjustments = 0.0
+        self.text: Optional[str] = ""
+        self.plain = True
+
+    @property
+    def x(self) -> float:
+        return self.matrix[4]
+
+    def width(self, fonts: Dict[str, _Font]) -> float:
+        """
+        Advance of the unit's text in user space units.
+        """
+        name, size = self.font
+        return (fonts[name].width(self.glyphs) - self.adjustment) * size / 1000 * self.matrix[0]
+
+
+class _Slot:
+    """
+    A text box of a field in a skeleton: where the field's value is drawn.
+    """
+
+    def __init__(self, index: int, prefix: str, suffix: str, unit: _Unit,
+                 anchor: str, width: float, capacity: float) -> None:
+        self.index = index
+        self.prefix = prefix
+        self.suffix = suffix
+        self.font = unit.font
+        self.matrix = unit.matrix
+        self.anchor = anchor
+        self.width = width
+        self.capacity = capacity
+
+
+class _Layout:
+    """
+    Pages of a probe PDF as static content runs and field text boxes.
+
+    :param pdf: PDF bytes written with the fast render profile
+    """
+
+    def __init__(self, pdf: bytes) -> None:
+        self.reader = PdfReader(io.BytesIO(pdf))
+        self.fonts: Dict[str, _Font] = {}
+        # Per page: serialized static runs, with a field text box between
+        # every two of them
+        self.pages: List[Tuple[List[bytes], List[Tuple[int, str, str, _Unit]]]] = []
+        for page in self.reader.pages:
+            self.pages.append(self._parse(page))
+
+    def _font(self, page: Any, name: str) -> Optional[_Font]:
+        """
+        Font of a page by resource name, None if it cannot be stamped with.
+        """
+        # WeasyPrint names fonts by their hash, the same on every page
+        if name not in self.fonts:
+            try:
+                self.fonts[name] = _Font(page["/Resources"]["/Font"][name].get_object())
+            except _Unstampable:
+                self.fonts[name] = None
+        return self.fonts[name]
+
+    def _parse(self, page: Any) -> Tuple[List[bytes], List[Tuple[int, str, str, _Unit]]]:
+        operations = ContentStream(page.get_contents(), self.reader).operations
+        runs, slots, static = [], [], []
+        unit, font = None, None
+
+        def close() -> None:
+            nonlocal unit
+            if unit is None:
+                return
+            match = MARKER_RE.search(unit.text or "")
+            if match and unit.plain and len(unit.fonts) == 1:
+                if MARKER_RE.search(unit.text, match.end()):
+                    raise _Unstampable(f"Several fields in one text box: {unit.text}")
+                if "\ufffd" in unit.text or self.fonts.get(unit.font[0]) is None:
+                    raise _Unstampable(f"Field drawn with glyphs it cannot map back: {unit.text}")
+                runs.append(_serialize(static))
+                static.clear()
+                slots.append((int(match.group(1)), unit.text[:match.start()],
+                              unit.text[match.end():], unit))
+            else:
+                if PARTIAL_MARKER_RE.search(unit.text or ""):
+                    raise _Unstampable(f"Field drawn in pieces or with spacing: {unit.text}")
+                static.extend(unit.operations)
+            unit = None
+
+        for operands, operator in operations:
+            if operator in (b"Tm", b"ET"):
+                close()
+            if operator == b"Tf":
+                font = (operands[0], float(operands[1]))
+            if operator == b"Tm":
+                unit = _Unit([float(operand) for operand in operands])
+            if unit is None:
+                static.append((operands, operator))
+                continue
+
+            unit.operations.append((operands, operator))
+            if operator not in SLOT_OPERATORS:
+                unit.plain = False
+            elif operator in (b"TJ", b"Tj"):
+                if font is None:
+                    unit.text = None
+                    continue
+                unit.fonts.add(font)
+                unit.font = unit.font or font
+                decoded = self._font(page, font[0])
+                items = operands[0] if operator == b"TJ" else [operands[0]]
+                for item in items:
+                    if isinstance(item, (str, bytes)):
+                        raw = item.original_bytes if isinstance(item, TextStringObject) else bytes(item)
+                        glyphs = [int.from_bytes(raw[i:i + 2], "big") for i in range(0, len(raw), 2)]
+                        unit.glyphs.extend(glyphs)
+                        if decoded is None or unit.text is None:
+                            unit.text = None
+                        else:
+                            unit.text += "".join(decoded.characters.get(glyph, "\ufffd")
+                                                 for glyph in glyphs)
+                    else:
+                        unit.adjustment += float(item)
+                        unit.adjustments += abs(float(item))
+        close()
+        runs.append(_serialize(static))
+        return runs, slots
+
+
+def _serialize(operations: List[Tuple[List[Any], bytes]]) -> bytes:
+    """
+    Serialize content stream operations.
+    """
+    stream = ContentStream(None, None)
+    stream.operations = list(operations)
+    return stream.get_data()
+
+
+def _number(value: float) -> bytes:
+    return f"{value:.4f}".rstrip("0").rstrip(".").encode("ascii")
+
+
+class _Skeleton:
+    """
+    A laid out invoice with its field values cut out, and where to stamp them.
+
+    The base PDF has the static content of every page; a stamped
+    invoice is the base plus an incremental update with new content
+    streams and document info.
+
+    :param probes: Layouts of the short-marker probe and the wide probes
+    """
+
+    def __init__(self, probes: List[_Layout]) -> None:
+        short, wide = probes[0], probes[1:]
+        self.runs: List[List[bytes]] = []
+        self.slots: List[List[_Slot]] = []
+        self.fonts = short.fonts
+        if any(len(probe.pages) != len(short.pages) for probe in wide):
+            raise _Unstampable("Wide values change the page count")
+        for page, (runs, units) in enumerate(short.pages):
+            slots = []
+            for probe in wide:
+                if probe.pages[page][0] != runs:
+                    raise _Unstampable("Wide values move the static content")
+            for position, (index, prefix, suffix, unit) in enumerate(units):
+                others = [probe.pages[page][1][position] for probe in wide]
+                slots.append(self._slot(index, prefix, suffix, unit, others, short, wide))
+            self.runs.append(runs)
+            self.slots.append(slots)
+        self._write_base(short)
+
+    @staticmethod
+    def _slot(index: int, prefix: str, suffix: str, unit: _Unit,
+              others: List[Tuple[int, str, str, _Unit]], short: _Layout,
+              wide: List[_Layout]) -> _Slot:
+        """
+        Work out how a field's text box is aligned from its short and wide probes.
+        """
+        width = unit.width(short.fonts)
+        anchors = None
+        capacity = None
+        for (other_index, other_prefix, other_suffix, other), probe in zip(others, wide):
+            if (other_index, other_prefix, other_suffix) != (index, prefix, suffix):
+                raise _Unstampable("Wide values reorder the fields")
+            if other.font != unit.font or other.matrix[:4] != unit.matrix[:4] \
+                    or abs(other.matrix[5] - unit.matrix[5]) > 0.01:
+                raise _Unstampable(f"Field {index} moves with its value")
+            other_width = other.width(probe.fonts)
+            edges = {
+                "left": (unit.x, other.x),
+                "right": (unit.x + width, other.x + other_width),
+                "center": (unit.x + width / 2, other.x + other_width / 2),
+            }
+            found = {anchor for anchor, (a, b) in edges.items() if abs(a - b) < 0.5}
+            anchors = found if anchors is None else anchors & found
+            capacity = other_width if capacity is None else min(capacity, other_width)
+        for probe_unit in (unit, *(other for _, _, _, other in others)):
+            # Letter or word spacing would have to be applied to the value
+            if probe_unit.glyphs and probe_unit.adjustments / len(probe_unit.glyphs) > 30:
+                raise _Unstampable(f"Field {index} is spaced out")
+        if not anchors:
+            raise _Unstampable(f"Field {index} is neither left, right nor center aligned")
+        anchor = next(name for name in ("left", "right", "center") if name in anchors)
+        return _Slot(index, prefix, suffix, unit, anchor, width, capacity)
+
+    def _write_base(self, short: _Layout) -> None:
+        """
+        Write the static content of the short probe as the base PDF.
+        """
+        writer = PdfWriter(clone_from=short.reader)
+        for page, runs in zip(writer.pages, self.runs):
+            stream = ContentStream(None, None)
+            stream.set_data(b"".join(runs))
+            page.replace_contents(stream)
+        self.info = {key: str(value) for key, value in (writer.metadata or {}).items()}
+        writer.add_metadata({key: MARKER_RE.sub("", value) for key, value in self.info.items()})
+        # Drops the replaced content streams
+        writer.compress_identical_objects(remove_duplicates=False, remove_unreferenced=True)
+        output = io.BytesIO()
+        writer.write(output)
+        self.base = output.getvalue()
+
+        if MARKER_RE.search(self.base.decode("latin-1")) \
+                or re.search(rb"\x00Q\x00x(\x00\d){4}", self.base):
+            raise _Unstampable("Field markers left in the document, e.g. in bookmarks")
+
+        reader = PdfReader(io.BytesIO(self.base))
+        self.contents = []
+        for page in reader.pages:
+            contents = page.raw_get("/Contents")
+            if not isinstance(contents, IndirectObject):
+                raise _Unstampable("Page contents are not a single stream")
+            self.contents.append(contents.idnum)
+        trailer = reader.trailer
+        self.size = int(trailer["/Size"])
+        self.root = trailer.raw_get("/Root")
+        self.info_reference = trailer.raw_get("/Info")
+        self.identifier = trailer.get("/ID")
+        self.previous = int(re.findall(rb"startxref\s+(\d+)", self.base)[-1])
+        if not self.base[self.previous:].startswith(b"xref"):
+            raise _Unstampable("Base PDF has a cross-reference stream")
+
+    def stamp(self, values: Dict[int, str]) -> Optional[bytes]:
+        """
+        Stamp field values on the skeleton.
+
+        :param values: Display text of each field by slot number
+
+        :return: PDF bytes, or None if a value does not fit its text box
+            or has characters the font lacks
+        """
+        contents = []
+        for runs, slots in zip(self.runs, self.slots):
+            parts = [runs[0]]
+            for slot, run in zip(slots, runs[1:]):
+                name, size = slot.font
+                font = self.fonts[name]
+                glyphs = font.encode(slot.prefix + values[slot.index] + slot.suffix)
+                if glyphs is None:
+                    return None
+                width = font.width(glyphs) * size / 1000 * slot.matrix[0]
+                if width > slot.capacity + 0.01:
+                    return None
+                x = slot.matrix[4]
+                if slot.anchor == "right":
+                    x += slot.width - width
+                elif slot.anchor == "center":
+                    x += (slot.width - width) / 2
+                matrix = b" ".join(_number(value) for value in [*slot.matrix[:4], x, slot.matrix[5]])
+                parts.append(matrix + b" Tm\n" + name.encode("ascii") + b" " + _number(size)
+                             + b" Tf\n")
+                if glyphs:
+                    parts.append(b"<" + b"".join(b"%04x" % glyph for glyph in glyphs) + b"> Tj\n")
+                parts.append(run)
+            contents.append(b"".join(parts))
+        return self._update(contents, values)
+
+    def _update(self, contents: List[bytes], values: Dict[int, str]) -> bytes:
+        """
+        Append new page contents and document info to the base PDF.
+        """
+        output = io.BytesIO()
+        output.write(self.base)
+        offsets = []
+        for number, data in zip(self.contents, contents):
+            offsets.append((number, output.tell()))
+            output.write(b"%d 0 obj\n<< /Length %d >>\nstream\n" % (number, len(data)))
+            output.write(data + b"\nendstream\nendobj\n")
+
+        trailer = DictionaryObject({
+            NameObject("/Size"): NumberObject(self.size),
+            NameObject("/Root"): self.root,
+            NameObject("/Prev"): NumberObject(self.previous),
+        })
+        if self.identifier is not None:
+            trailer[NameObject("/ID")] = self.identifier
+        if self.info_reference is not None:
+            info = DictionaryObject({
+                NameObject(key): create_string_object(MARKER_RE.sub(
+                    lambda match: values.get(int(match.group(1)), ""), value))
+                for key, value in self.info.items()
+            })
+            offsets.append((self.info_reference.idnum, output.tell()))
+            output.write(b"%d 0 obj\n" % self.info_reference.idnum)
+            info.write_to_stream(output)
+            output.write(b"\nendobj\n")
+            trailer[NameObject("/Info")] = self.info_reference
+
+        xref = output.tell()
+        output.write(b"xref\n")
+        for number, offset in sorted(offsets):
+            output.write(b"%d 1\n%010d 00000 n \n" % (number, offset))
+        output.write(b"trailer\n")
+        trailer.write_to_stream(output)
+        output.write(b"\nstartxref\n%d\n%%%%EOF\n" % xref)
+        return output.getvalue()
+
+
+class StampedRenderer:
+    """
+    Opt-in fast path that renders an invoice by stamping its values on
+    a cached layout of its template instead of laying it out.
+
+    For each shape of invoice (template, line count and the values that
+    are not stamped, e.g. the currency) the template is rendered once
+    with a marker in place of every stamped value, and twice more with
+    the markers padded to each field's ``FIELDS`` width, breakable and
+    unbreakable. If the padding moves nothing but the markers'
+    own text, the layout does not depend on those values: the pages
+    without the markers are cached as the skeleton, along with each
+    marker's position, font and alignment. Rendering an invoice of that
+    shape is then a string substitution and an incremental PDF update.
+
+    Only the ``fast`` render profile is stamped, as it embeds whole
+    fonts, so any character of a value can be drawn. Values wider than
+    the padded markers, characters missing from the font, layouts that
+    move with their values (e.g. auto width tables) and spaced out
+    fields are rendered in full instead.
+    """
+
+    # Characters of padding in the wide probes, i.e. the longest value
+    # stamped for each field is about this many digits wide
+    FIELDS: Dict[str, int] = {
+        "invoice_number": 24,
+        "date_now": 24,
+        "date_now_en": 24,
+        "receiver_ka": 40,
+        "receiver_en": 40,
+        "receiver_id": 16,
+        "receiver_phone": 20,
+        "payer_ka": 40,
+        "payer_en": 40,
+        "payer_id": 16,
+        "payer_phone": 20,
+        "bank_name_ka": 32,
+        "bank_name_en": 32,
+        "bank_acc_num": 28,
+        "bank_code": 16,
+        "total_amount": 14,
+        "vat_total": 14,
+        "total_without_vat": 14,
+        "total_amount_gel": 14,
+        "exchange_rate": 10,
+    }
+    PURPOSE_FIELDS: Dict[str, int] = {
+        "description": 48,
+        "amount": 12,
+        "vat_amount": 12,
+        "total": 12,
+    }
+    # Padding tried after the full width moved the layout
+    PADDING_SCALES = (1.0, 0.5, 0.25)
+
+    _skeletons: "OrderedDict[Tuple[str, str, str], Optional[_Skeleton]]" = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def enabled() -> bool:
+        """
+        Check whether invoices are stamped when possible.
+
+        :return: True if INVOICE_STAMPED_RENDER_ENABLED is set
+        """
+        return getattr(settings, "INVOICE_STAMPED_RENDER_ENABLED", False)
+
+    @classmethod
+    def render(cls, context: Dict[str, Any], template_name: str,
+               profile: Optional[str] = None) -> Optional[bytes]:
+        """
+        Render an invoice by stamping its values on its skeleton.
+
+        :param context: Invoice template context with annotated purposes
+        :param template_name: Template file to render
+        :param profile: Render profile of the PDF output options
+
+        :return: PDF bytes, or None if the invoice has to be rendered in full
+        """
+        if (not cls.enabled() or RenderProfiles.resolve(profile) != RenderProfile.FAST
+                or len(context.get("purposes", [])) > settings.INVOICE_STAMPED_RENDER_MAX_LINES):
+            return None
+
+        fields = cls._fields(context)
+        template = TemplateRegistry.get(template_name)
+        html = template.render(cls._marked(context, fields))
+        key = (template_name, TemplateRegistry.fingerprint(template_name),
+               hashlib.sha256(html.encode("utf-8")).hexdigest())
+        with cls._lock:
+            found = key in cls._skeletons
+            skeleton = cls._skeletons.get(key)
+            if found:
+                cls._skeletons.move_to_end(key)
+        if not found:
+            try:
+                skeleton = cls._build(html, template, template_name, context, fields)
+            except Exception as e:
+                # Not cached, the next invoice of the shape tries again
+                logger.warning(f"Stamped render skeleton of {template_name} failed: {e}")
+                return None
+            with cls._lock:
+                cls._skeletons[key] = skeleton
+                while len(cls._skeletons) > settings.INVOICE_STAMPED_RENDER_SKELETONS:
+                    cls._skeletons.popitem(last=False)
+        if skeleton is None:
+            return None
+        return skeleton.stamp({index: value for index, (_, _, _, value) in enumerate(fields)})
+
+    @classmethod
+    def clear(cls) -> None:
+        """
+        Drop every cached skeleton.
+        """
+        with cls._lock:
+            cls._skeletons.clear()
+
+    @classmethod
+    def _fields(cls, context: Dict[str, Any]) -> List[Tuple[Optional[int], str, int, str]]:
+        """
+        Stamped values of an invoice.
+
+        Values that are empty or false keep their place in the template,
+        as templates test them, e.g. ``{% if total_amount_gel %}``.
+
+        :param context: Invoice template context
+
+        :return: (purpose row or None, field, padding, display text) of each value
+        """
+        fields = []
+        values = [(None, name, padding, context.get(name)) for name, padding in cls.FIELDS.items()]
+        for row, purpose in enumerate(context.get("purposes", [])):
+            values.extend((row, name, padding, purpose.get(name))
+                          for name, padding in cls.PURPOSE_FIELDS.items())
+        for row, name, padding, value in values:
+            if not value or isinstance(value, bool):
+                continue
+            # As printed by {{ value }}, with HTML white space collapsed
+            text = " ".join(render_value_in_context(value, Context(autoescape=False)).split())
+            if text:
+                fields.append((row, name, padding, text))
+        return fields
+
+    @staticmethod
+    def _marked(context: Dict[str, Any], fields: List[Tuple[Optional[int], str, int, str]],
+                padding: Optional[float] = None, breakable: bool = True) -> Dict[str, Any]:
+        """
+        Copy the context with a marker in place of each stamped value.
+
+        :param context: Invoice template context
+        :param fields: Stamped values, see ``_fields``
+        :param padding: Fraction of each field's padding, None for bare markers
+        :param breakable: Pad with groups of digits instead of one number
+
+        :return: Template context
+        """
+        marked = dict(context)
+        marked["purposes"] = [dict(purpose) for purpose in context.get("purposes", [])]
+        for index, (row, name, width, _) in enumerate(fields):
+            filler = ""
+            if padding is not None:
+                filler = ("0000 " if breakable else "0") * width
+                filler = filler[:max(round(width * padding), 1)].rstrip()
+            marker = f"Qx{index:04d}{filler}xQ"
+            if row is None:
+                marked[name] = marker
+            else:
+                marked["purposes"][row][name] = marker
+        return marked
+
+    @classmethod
+    def _build(cls, html: str, template: Any, template_name: str, context: Dict[str, Any],
+               fields: List[Tuple[Optional[int], str, int, str]]) -> Optional[_Skeleton]:
+        """
+        Lay out the skeleton of an invoice shape.
+
+        :return: Skeleton, or None if the shape cannot be stamped
+        """
+        try:
+            short = _Layout(RenderPool.render(html, template_name, RenderProfile.FAST))
+            for scale in cls.PADDING_SCALES:
+                wide = [
+                    _Layout(RenderPool.render(
+                        template.render(cls._marked(context, fields, scale, breakable)),
+                        template_name, RenderProfile.FAST,
+                    ))
+                    for breakable in (True, False)
+                ]
+                try:
+                    skeleton = _Skeleton([short, *wide])
+                except _Unstampable as e:
+                    reason = e
+                    continue
+                logger.info(f"Stamped render skeleton of {template_name} laid out "
+                            f"at {scale:.0%} field width")
+                return skeleton
+        except _Unstampable as e:
+            reason = e
+        logger.info(f"Invoices like this one of {template_name} are rendered in full: {reason}")
+        return None
@@ -0,0 +1,207 @@
+import io
+import json
+from decimal import Decimal
+from typing import Any, Dict, Iterator
+from xml.sax.saxutils import XMLGenerator
+
+from api.utils.invoice_generator import InvoiceService, VATCalculator
+
+
+class StructuredInvoiceWriter:
+    """
+    Writes an invoice as a UBL 2.1 style XML document or as JSON,
+    straight from the invoice template context and without any layout.
+
+    Both formats are generated incrementally: the header is yielded
+    first and then one chunk per ``LINES_PER_CHUNK`` invoice lines, so
+    the response can be streamed and memory stays flat for invoices
+    with many purposes.
+
+    :param context: Invoice template context with unannotated purposes
+    """
+
+    LINES_PER_CHUNK = 100
+
+    UBL_NAMESPACES = {
+        "xmlns": "urn:oasis:names:specification:ubl:schema:xsd:Invoice-2",
+        "xmlns:cac": "urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2",
+        "xmlns:cbc": "urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2",
+    }
+    # UNCL 1001 commercial invoice, UNCL 4461 credit transfer,
+    # UN/ECE rec 20 "one" unit
+    INVOICE_TYPE_CODE = "380"
+    PAYMENT_MEANS_CODE = "30"
+    UNIT_CODE = "C62"
+
+    def __init__(self, context: Dict[str, Any]) -> None:
+        self.context = context
+        suffix = "ka" if context.get("language") == "ka" else "en"
+        self.receiver_name = context[f"receiver_{suffix}"]
+        self.payer_name = context[f"payer_{suffix}"]
+        self.bank_name = context[f"bank_name_{suffix}"]
+        self.vat_percent = f"{VATCalculator.VAT_RATE * 100:.0f}"
+
+    def iter_xml(self) -> Iterator[bytes]:
+        """
+        Write the invoice as a UBL 2.1 style ``Invoice`` document.
+
+        :return: Iterator over XML document bytes
+        """
+        stream = io.StringIO()
+        xml = XMLGenerator(stream, encoding="utf-8", short_empty_elements=True)
+        context = self.context
+        currency = {"currencyID": context["currency"]}
+
+        xml.startDocument()
+        xml.startElement("Invoice", self.UBL_NAMESPACES)
+        self._element(xml, "cbc:UBLVersionID", "2.1")
+        self._element(xml, "cbc:ID", context["invoice_number"])
+        self._element(xml, "cbc:IssueDate", context["issue_date"])
+        self._element(xml, "cbc:InvoiceTypeCode", self.INVOICE_TYPE_CODE)
+        self._element(xml, "cbc:DocumentCurrencyCode", context["currency"])
+
+        self._party(xml, "cac:AccountingSupplierParty", context["receiver_id"],
+                    self.receiver_name, context["receiver_phone"])
+        self._party(xml, "cac:AccountingCustomerParty", context["payer_id"],
+                    self.payer_name, context["payer_phone"])
+
+        xml.startElement("cac:PaymentMeans", {})
+        self._element(xml, "cbc:PaymentMeansCode", self.PAYMENT_MEANS_CODE)
+        xml.startElement("cac:PayeeFinancialAccount", {})
+        self._element(xml, "cbc:ID", context["bank_acc_num"])
+        self._element(xml, "cbc:Name", self.bank_name)
+        xml.startElement("cac:FinancialInstitutionBranch", {})
+        self._element(xml, "cbc:ID", context["bank_code"])
+        xml.endElement("cac:FinancialInstitutionBranch")
+        xml.endElement("cac:PayeeFinancialAccount")
+        xml.endElement("cac:PaymentMeans")
+
+        xml.startElement("cac:TaxTotal", {})
+        self._element(xml, "cbc:TaxAmount", context["vat_total"], currency)
+        xml.endElement("cac:TaxTotal")
+
+        xml.startElement("cac:LegalMonetaryTotal", {})
+        self._element(xml, "cbc:LineExtensionAmount", context["total_without_vat"], currency)
+        self._element(xml, "cbc:TaxExclusiveAmount", context["total_without_vat"], currency)
+        self._element(xml, "cbc:TaxInclusiveAmount", context["total_amount"], currency)
+        self._element(xml, "cbc:PayableAmount", context["total_amount"], currency)
+        xml.endElement("cac:LegalMonetaryTotal")
+
+        for position, purpose, vat_amount, total in self._lines():
+            xml.startElement("cac:InvoiceLine", {})
+            self._element(xml, "cbc:ID", position)
+            self._element(xml, "cbc:InvoicedQuantity", 1, {"unitCode": self.UNIT_CODE})
+            self._element(xml, "cbc:LineExtensionAmount", purpose["amount"], currency)
+            xml.startElement("cac:TaxTotal", {})
+            self._element(xml, "cbc:TaxAmount", vat_amount, currency)
+            xml.endElement("cac:TaxTotal")
+            xml.startElement("cac:Item", {})
+            self._element(xml, "cbc:Description", purpose["description"])
+            xml.startElement("cac:ClassifiedTaxCategory", {})
+            # UNCL 5305: S standard rate, O not subject to VAT
+            self._element(xml, "cbc:ID", "S" if purpose["has_vat"] else "O")
+            self._element(xml, "cbc:Percent", self.vat_percent if purpose["has_vat"] else "0")
+            xml.startElement("cac:TaxScheme", {})
+            self._element(xml, "cbc:ID", "VAT")
+            xml.endElement("cac:TaxScheme")
+            xml.endElement("cac:ClassifiedTaxCategory")
+            xml.endElement("cac:Item")
+            xml.startElement("cac:Price", {})
+            self._element(xml, "cbc:PriceAmount", purpose["amount"], currency)
+            xml.endElement("cac:Price")
+            xml.endElement("cac:InvoiceLine")
+            if position % self.LINES_PER_CHUNK == 0:
+                yield self._drain(stream)
+
+        xml.endElement("Invoice")
+        xml.endDocument()
+        yield self._drain(stream)
+
+    def iter_json(self) -> Iterator[bytes]:
+        """
+        Write the invoice as a JSON object with its lines last.
+
+        :return: Iterator over JSON document bytes
+        """
+        context = self.context
+        header = {
+            "invoice_number": context["invoice_number"],
+            "issue_date": context["issue_date"],
+            "currency": context["currency"],
+            "language": context.get("language", "en"),
+            "should_use_invoice_date_currency_rate":
+                context.get("should_use_invoice_date_currency_rate", False),
+            "receiver": {"identification_code": context["receiver_id"],
+                         "name": self.receiver_name,
+                         "phone_number": context["receiver_phone"]},
+            "payer": {"identification_code": context["payer_id"],
+                      "name": self.payer_name,
+                      "phone_number": context["payer_phone"]},
+            "bank": {"name": self.bank_name,
+                     "account_number": context["bank_acc_num"],
+                     "code": context["bank_code"]},
+            "total_without_vat": str(context["total_without_vat"]),
+            "vat_total": str(context["vat_total"]),
+            "total_amount": str(context["total_amount"]),
+        }
+        if context.get("total_amount_gel"):
+            header["exchange_rate"] = {"rate": str(context["exchange_rate"]),
+                                       "date": context["exchange_rate_date"].isoformat(),
+                                       "total_amount_gel": str(context["total_amount_gel"])}
+        # Reopen the header object to append the lines array
+        chunk = json.dumps(header, ensure_ascii=False)[:-1] + ', "lines": ['
+        for position, purpose, vat_amount, total in self._lines():
+            line = {"position": position,
+                    "description": purpose["description"],
+                    "amount": str(purpose["amount"]),
+                    "has_vat": bool(purpose["has_vat"]),
+                    "vat_amount": str(vat_amount),
+                    "total": str(total)}
+            chunk += ("" if position == 1 else ", ") + json.dumps(line, ensure_ascii=False)
+            if position % self.LINES_PER_CHUNK == 0:
+                yield chunk.encode("utf-8")
+                chunk = ""
+        yield (chunk + "]}").encode("utf-8")
+
+    def _lines(self) -> Iterator[tuple]:
+        """
+        Invoice lines with their rounded VAT amount and total.
+
+        :return: Iterator over (1-based position, purpose, VAT amount, total)
+        """
+        for position, purpose in enumerate(self.context["purposes"], start=1):
+            vat_amount, total = InvoiceService.line_totals(purpose, self.context["currency"])
+            yield position, purpose, vat_amount, total
+
+    def _party(self, xml: XMLGenerator, tag: str, identification_code: str,
+               name: str, phone_number: str) -> None:
+        xml.startElement(tag, {})
+        xml.startElement("cac:Party", {})
+        xml.startElement("cac:PartyIdentification", {})
+        self._element(xml, "cbc:ID", identification_code)
+        xml.endElement("cac:PartyIdentification")
+        xml.startElement("cac:PartyName", {})
+        self._element(xml, "cbc:Name", name)
+        xml.endElement("cac:PartyName")
+        if phone_number:
+            xml.startElement("cac:Contact", {})
+            self._element(xml, "cbc:Telephone", phone_number)
+            xml.endElement("cac:Contact")
+        xml.endElement("cac:Party")
+        xml.endElement(tag)
+
+    @staticmethod
+    def _element(xml: XMLGenerator, tag: str, value: Any,
+                 attributes: Dict[str, str] = None) -> None:
+        if isinstance(value, Decimal):
+            value = f"{value:.2f}"
+        xml.startElement(tag, attributes or {})
+        xml.characters(str(value) if value is not None else "")
+        xml.endElement(tag)
+
+    @staticmethod
+    def _drain(stream: io.StringIO) -> bytes:
+        data = stream.getvalue()
+        stream.seek(0)
+        stream.truncate(0)
+        return data.encode("utf-8")
@@ -0,0 +1,109 @@
+import logging
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from django.template import engines
+from weasyprint import CSS
+from weasyprint.text.fonts import FontConfiguration
+
+from api.utils.template_registry import TemplateRegistry
+
+
+logger = logging.getLogger(__name__)
+
+STYLE_BLOCK_RE = re.compile(r"<style[^>]*>(.*?)</style>", re.S | re.I)
+
+
+class StylesheetCache:
+    """
+    Per-process cache of the compiled CSS embedded in invoice templates.
+
+    Each template's ``<style>`` block is extracted and compiled into a
+    ``weasyprint.CSS`` once, together with a shared ``FontConfiguration``.
+    At render time the (identical) block is stripped from the rendered
+    HTML and the compiled stylesheet is passed to WeasyPrint instead, so
+    per-request work is only the HTML body.
+    """
+
+    _stylesheets: Dict[str, Tuple[str, CSS]] = {}
+    _font_config: Optional[FontConfiguration] = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def font_config(cls) -> FontConfiguration:
+        """
+        Get the font configuration shared by all renders in this process.
+
+        :return: FontConfiguration
+        """
+        with cls._lock:
+            if cls._font_config is None:
+                cls._font_config = FontConfiguration()
+            return cls._font_config
+
+    @classmethod
+    def load(cls) -> None:
+        """
+        Compile the stylesheets of every known invoice template.
+        """
+        from api.utils.invoice_generator import TemplateSelector
+
+        for templates in TemplateSelector.TEMPLATE_MAPPING.values():
+            for template_name in templates.values():
+                cls.get(template_name)
+        logger.info(f"Compiled {len(cls._stylesheets)} invoice stylesheets")
+
+    @classmethod
+    def clear(cls) -> None:
+        """
+        Drop the compiled stylesheets, e.g. after the templates changed.
+        """
+        with cls._lock:
+            cls._stylesheets = {}
+
+    @classmethod
+    def get(cls, template_name: str) -> Optional[Tuple[str, CSS]]:
+        """
+        Get the raw style block and compiled stylesheet of a template.
+
+        :param template_name: Template file name
+
+        :return: (style block, CSS) or None if the template has no styles
+        """
+        cached = cls._stylesheets.get(template_name)
+        if cached is not None:
+            return cached
+
+        source = TemplateRegistry.get(template_name).template.source
+        match = STYLE_BLOCK_RE.search(source)
+        if not match:
+            return None
+
+        # Render the block on its own so template comments inside the CSS
+        # are dropped exactly as they are in the rendered invoice.
+        style_block = engines["django"].from_string(match.group(0)).render({})
+        css = STYLE_BLOCK_RE.search(style_block).group(1)
+        stylesheet = CSS(string=css, font_config=cls.font_config())
+        with cls._lock:
+            cls._stylesheets[template_name] = (style_block, stylesheet)
+        return cls._stylesheets[template_name]
+
+    @classmethod
+    def split(cls, html: str, template_name: Optional[str]) -> Tuple[str, List[CSS]]:
+        """
+        Replace the embedded style block of rendered HTML with the compiled stylesheet.
+
+        :param html: Rendered invoice HTML
+        :param template_name: Template file the HTML was rendered from
+
+        :return: (HTML without the style block, stylesheets to apply)
+        """
+        cached = cls.get(template_name) if template_name else None
+        if cached is None:
+            return html, []
+
+        style_block, stylesheet = cached
+        if style_block not in html:
+            return html, []
+        return html.replace(style_block, "", 1), [stylesheet]
@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.dispatch import Signal
+from django.template import engines
+from django.template.loader import get_template
+
+
+logger = logging.getLogger(__name__)
+
+# Sent after the invoice templates have been reloaded.
+templates_reloaded = Signal()
+
+
+class TemplateRegistry:
+    """
+    Per-process registry of the compiled invoice templates.
+
+    Every template of ``TemplateSelector.TEMPLATE_MAPPING`` is loaded and
+    rendered with a synthetic context when the app is ready, so a
+    missing or broken template stops the process at startup instead of
+    failing requests. Lookups afterwards are a dictionary hit.
+
+    Running processes reload the templates without a restart when the
+    ``INVOICE_TEMPLATE_RELOAD_FILE`` is touched, which is what
+    ``manage.py reload_templates`` does after validating them.
+    """
+
+    RELOAD_CHECK_INTERVAL = 5
+
+    _templates: Dict[str, Any] = {}
+    _fingerprints: Dict[str, str] = {}
+    _lock = threading.Lock()
+    _reload_mtime: Optional[float] = None
+    _reload_checked = 0.0
+
+    @classmethod
+    def load(cls) -> None:
+        """
+        Compile and validate every invoice template.
+
+        :raises: ImproperlyConfigured: If any template is missing or fails to render
+        """
+        templates = cls.compile()
+        with cls._lock:
+            cls._templates = templates
+            cls._fingerprints = {}
+            cls._reload_mtime = cls._reload_file_mtime()
+        logger.info(f"Loaded {len(templates)} invoice templates")
+
+    @staticmethod
+    def compile() -> Dict[str, Any]:
+        """
+        Load every invoice template and render it with a synthetic context.
+
+        :return: Template name to compiled template
+
+        :raises: ImproperlyConfigured: If any template is missing or fails to render
+        """
+        from api.utils.invoice_generator import TemplateSelector
+        from api.utils.render_pool import WARMUP_CONTEXT
+
+        templates = {}
+        errors = []
+        for mapping in TemplateSelector.TEMPLATE_MAPPING.values():
+            for template_name in mapping.values():
+                try:
+                    template = get_template(template_name)
+                    template.render(WARMUP_CONTEXT)
+                    templates[template_name] = template
+                except Exception as e:
+                    errors.append(f"{template_name}: {e}")
+
+        if errors:
+            raise ImproperlyConfigured("Invalid invoice templates:\n" + "\n".join(errors))
+        return templates
+
+    @classmethod
+    def get(cls, template_name: str) -> Any:
+        """
+        Get a compiled template.
+
+        :param template_name: Template file name
+
+        :return: Template object
+
+        :raises: TemplateDoesNotExist: If the template is not registered and cannot be loaded
+        """
+        cls._check_reload()
+        template = cls._templates.get(template_name)
+        if template is None:
+            template = get_template(template_name)
+            with cls._lock:
+                cls._templates[template_name] = template
+        return template
+
+    @classmethod
+    def fingerprint(cls, template_name: str) -> str:
+        """
+        Get a hash of a template's source, e.g. to version anything rendered from it.
+
+        :param template_name: Template file name
+
+        :return: Hex SHA-256 digest of the template source
+        """
+        fingerprint = cls._fingerprints.get(template_name)
+        if fingerprint is None:
+            source = cls.get(template_name).template.source
+            fingerprint = hashlib.sha256(source.encode("utf-8")).hexdigest()
+            with cls._lock:
+                cls._fingerprints[template_name] = fingerprint
+        return fingerprint
+
+    @classmethod
+    def reload(cls) -> None:
+        """
+        Reload the templates from disk and drop everything derived from them.
+
+        The old templates stay in use if the new ones do not validate.
+        The render pool, if running, is replaced by freshly warmed workers.
+
+        :raises: ImproperlyConfigured: If any template is missing or fails to render
+        """
+        from api.utils.render_pool import RenderPool
+        from api.utils.stylesheets import StylesheetCache
+
+        for loader in engines["django"].engine.template_loaders:
+            if hasattr(loader, "reset"):
+                loader.reset()
+        cls.load()
+        StylesheetCache.clear()
+        RenderPool.restart()
+        templates_reloaded.send(sender=cls)
+        logger.info("Invoice templates reloaded")
+
+    @classmethod
+    def _check_reload(cls) -> None:
+        """
+        Reload when the reload file changed, checking at most every few seconds.
+        """
+        now = time.monotonic()
+        if now - cls._reload_checked < cls.RELOAD_CHECK_INTERVAL:
+            return
+        cls._reload_checked = now
+
+        mtime = cls._reload_file_mtime()
+        if mtime is None or mtime == cls._reload_mtime:
+            return
+        try:
+            cls.reload()
+        except Exception:
+            logger.exception("Invoice template reload failed, keeping the loaded templates")
+            cls._reload_mtime = mtime
+
+    @staticmethod
+    def _reload_file_mtime() -> Optional[float]:
+        path = getattr(settings, "INVOICE_TEMPLATE_RELOAD_FILE", "")
+        if not path:
+            return None
+        try:
+            return os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
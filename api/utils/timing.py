@@ -0,0 +1,191 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+
+_current_timer: ContextVar[Optional["StageTimer"]] = ContextVar("stage_timer", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a named stage on the timer of the current request, if any.
+
+    :param name: Stage name
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, (time.perf_counter() - start) * 1000)
+
+
+def record_stages(timings: Dict[str, float]) -> None:
+    """
+    Add stage durations measured elsewhere (e.g. in a render worker) to the current timer.
+
+    :param timings: Stage name to duration in milliseconds
+    """
+    timer = _current_timer.get()
+    if timer is not None:
+        for name, duration in timings.items():
+            timer.add(name, duration)
+
+
+class StageTimer:
+    """
+    Collects named stage durations of one invoice request.
+
+    While active, ``stage()`` blocks anywhere in the call stack and every
+    database query (under the ``db`` stage) are recorded on it.
+    """
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    def add(self, name: str, duration: float) -> None:
+        """
+        Add a duration to a stage.
+
+        :param name: Stage name
+        :param duration: Duration in milliseconds
+        """
+        self.stages[name] = self.stages.get(name, 0.0) + duration
+
+    @contextmanager
+    def activate(self) -> Iterator["StageTimer"]:
+        """
+        Make this the timer of the current request.
+        """
+        token = _current_timer.set(self)
+        try:
+            yield self
+        finally:
+            _current_timer.reset(token)
+
+    def query_wrapper(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper timing every query under the ``db`` stage.
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add("db", (time.perf_counter() - start) * 1000)
+
+    def finish(self) -> Dict[str, float]:
+        """
+        Record the total time and feed all stages into the histograms.
+
+        :return: Stage name to duration in milliseconds
+        """
+        self.add("total", (time.perf_counter() - self._start) * 1000)
+        for name, duration in self.stages.items():
+            StageHistograms.observe(name, duration)
+        return self.as_dict()
+
+    def as_dict(self) -> Dict[str, float]:
+        """
+        Stage durations rounded for logging.
+
+        :return: Stage name to duration in milliseconds
+        """
+        return {name: round(duration, 2) for name, duration in self.stages.items()}
+
+    def header(self) -> str:
+        """
+        Format the stages as a ``Server-Timing`` header value.
+
+        :return: Header value
+        """
+        return ", ".join(f"{name};dur={duration:.1f}"
+                         for name, duration in self.stages.items())
+
+
+class StageHistograms:
+    """
+    In-process histograms of stage durations, per stage name.
+    """
+
+    BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    _stages: Dict[str, Dict[str, Any]] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def observe(cls, name: str, duration: float) -> None:
+        """
+        Record one duration.
+
+        :param name: Stage name
+        :param duration: Duration in milliseconds
+        """
+        with cls._lock:
+            histogram = cls._stages.setdefault(name, {
+                "count": 0,
+                "sum": 0.0,
+                "max": 0.0,
+                "buckets": [0] * (len(cls.BUCKETS) + 1),
+            })
+            histogram["count"] += 1
+            histogram["sum"] += duration
+            histogram["max"] = max(histogram["max"], duration)
+            for index, bound in enumerate(cls.BUCKETS):
+                if duration <= bound:
+                    histogram["buckets"][index] += 1
+                    break
+            else:
+                histogram["buckets"][-1] += 1
+
+    @classmethod
+    def snapshot(cls) -> Dict[str, Dict[str, Any]]:
+        """
+        Summaries of every stage with bucket-estimated percentiles.
+
+        :return: Stage name to summary
+        """
+        bounds = [str(bound) for bound in cls.BUCKETS] + ["+Inf"]
+        with cls._lock:
+            summary = {}
+            for name, histogram in cls._stages.items():
+                count = histogram["count"]
+                summary[name] = {
+                    "count": count,
+                    "mean_ms": round(histogram["sum"] / count, 2),
+                    "max_ms": round(histogram["max"], 2),
+                    "p50_ms": cls._percentile(histogram, 0.50),
+                    "p95_ms": cls._percentile(histogram, 0.95),
+                    "p99_ms": cls._percentile(histogram, 0.99),
+                    "buckets": dict(zip(bounds, histogram["buckets"])),
+                }
+            return summary
+
+    @classmethod
+    def reset(cls) -> None:
+        """
+        Drop all recorded durations.
+        """
+        with cls._lock:
+            cls._stages.clear()
+
+    @classmethod
+    def _percentile(cls, histogram: Dict[str, Any], quantile: float) -> float:
+        """
+        Upper bound of the bucket containing the quantile.
+        """
+        target = histogram["count"] * quantile
+        seen = 0
+        for index, count in enumerate(histogram["buckets"]):
+            seen += count
+            if seen >= target and count:
+                if index < len(cls.BUCKETS):
+                    return float(cls.BUCKETS[index])
+                break
+        return round(histogram["max"], 2)
@@ -1,35 +1,246 @@
 import logging
+import re
 from datetime import datetime
 
-from django.http import FileResponse
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import (FileResponse, Http404, HttpResponse, HttpResponseNotModified,
+                         StreamingHttpResponse)
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.http import parse_etags
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
-from rest_framework.viewsets import ModelViewSet
-from api.exceptions import InvoiceGenerationError, LanguageNotSupportedError
-from api.models import Payer, Invoice
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
+from api.exceptions import InvoiceGenerationError, LanguageNotSupportedError, PayerImportError
+from api.models import GeneratedInvoice, Payer, Invoice, InvoiceJob
+from api.pagination import KeysetPagination
 from api.permissions import IsOwner
+from api.renderers import XMLRenderer
 from api.serializers import (PayerSerializer, InvoiceGenerationSerializer,
-                             InvoiceFavoriteSerializer, InvoiceDisplaySerializer)
-from api.utils.invoice_generator import InvoiceGenerator
+                             InvoiceFavoriteSerializer, InvoiceDisplaySerializer,
+                             InvoiceJobSerializer, GeneratedInvoiceSerializer)
+from api.utils.batch_generator import BatchInvoiceGenerator
+from api.utils.blob_store import BlobStore
+from api.utils.favourite_pdfs import FavouritePDFs
+from api.utils.invoice_generator import InvoiceGenerator, InvoiceService
+from api.utils.invoice_history import InvoiceHistory
+from api.utils.payer_import import PayerImport
+from api.utils.payer_search import PayerSearch
+from api.utils.render_pool import RenderPool
+from api.utils.render_watchdog import RenderWatchdog
+from api.utils.timing import StageHistograms, StageTimer, stage
 import io
 
 
 logger = logging.getLogger(__name__)
 
 
+def pdf_response(pdf):
+    """
+    Build an inline PDF file response.
+
+    :param pdf: PDF file content or an open PDF file object
+
+    :return: FileResponse with the PDF
+    """
+    pdf_file = io.BytesIO(pdf) if isinstance(pdf, bytes) else pdf
+    response = FileResponse(
+        pdf_file,
+        content_type="application/pdf",
+        as_attachment=False
+    )
+    timestamp = datetime.now().strftime("%Y%m%d")
+    filename = f"invoice_{timestamp}.pdf"
+    response["Content-Disposition"] = f'inline; filename="{filename}"'
+    return response
+
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range ``Range`` header.
+
+    Multiple ranges are not supported and get the whole file, which
+    RFC 9110 allows.
+
+    :param header: Range header value or None
+    :param size: File size in bytes
+
+    :return: (first, last) byte positions, None for the whole file, or
+        False if the range cannot be satisfied
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if not length or not size:
+            return False
+        return max(size - length, 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size or first > last:
+        return False
+    return first, last
+
+
+def blob_response(request, digest, size, filename):
+    """
+    Build a PDF response for a blob store PDF.
+
+    The ETag is the content hash, so ``If-None-Match`` is answered
+    without touching the file. With ``INVOICE_BLOB_SENDFILE`` set the
+    bytes are left to the web server (nginx ``X-Accel-Redirect`` or
+    Apache/lighttpd ``X-Sendfile``), which also handles ``Range``;
+    otherwise single byte ranges are served here.
+
+    :param request: Request object.
+    :param digest: Hex SHA-256 of the PDF
+    :param size: PDF size in bytes
+    :param filename: Download file name
+
+    :return: PDF, partial content, 304 or 416 response
+
+    :raises: Http404: If the blob is missing from the store
+    """
+    etag = f'"{digest}"'
+    if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+    if etag in if_none_match or "*" in if_none_match:
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+
+    store = BlobStore()
+    sendfile = getattr(settings, "INVOICE_BLOB_SENDFILE", "")
+    if sendfile:
+        response = HttpResponse(content_type="application/pdf")
+        if sendfile == "x-accel-redirect":
+            prefix = settings.INVOICE_BLOB_ACCEL_PREFIX.rstrip("/")
+            response["X-Accel-Redirect"] = f"{prefix}/{store.relative_path(digest)}"
+        else:
+            response["X-Sendfile"] = str(store.path(digest))
+    else:
+        # A Range of another version of the file is ignored
+        if_range = request.headers.get("If-Range")
+        byte_range = (parse_range(request.headers.get("Range"), size)
+                      if if_range is None or if_range == etag else None)
+        if byte_range is False:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+        try:
+            pdf_file = store.open(digest)
+        except FileNotFoundError:
+            logger.error(f"Blob {digest} is missing from the store")
+            raise Http404("The invoice PDF is no longer stored")
+        if byte_range is None:
+            response = FileResponse(pdf_file, content_type="application/pdf")
+        else:
+            first, last = byte_range
+            pdf_file.seek(first)
+            response = StreamingHttpResponse(
+                _read_range(pdf_file, last - first + 1),
+                status=status.HTTP_206_PARTIAL_CONTENT,
+                content_type="application/pdf"
+            )
+            response["Content-Range"] = f"bytes {first}-{last}/{size}"
+            response["Content-Length"] = str(last - first + 1)
+        response["Accept-Ranges"] = "bytes"
+
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, max-age=0"
+    response["Content-Disposition"] = f'inline; filename="{filename}"'
+    return response
+
+
+def _read_range(pdf_file, length):
+    """
+    Yield ``length`` bytes of a file from its position, then close it.
+    """
+    try:
+        while length > 0:
+            chunk = pdf_file.read(min(length, BlobStore.CHUNK_SIZE))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        pdf_file.close()
+
+
+STRUCTURED_FORMATS = {
+    "application/xml": ("xml", "application/xml; charset=utf-8"),
+    "application/json": ("json", "application/json"),
+}
+
+
+def structured_format(request):
+    """
+    Pick a structured invoice format from the ``Accept`` header.
+
+    Only clients that explicitly ask for XML or JSON, without also
+    accepting PDF or any type, get structured output.
+
+    :param request: Request object.
+
+    :return: (format, content type) or None for a PDF
+    """
+    media_types = [media_type.split(";")[0].strip().lower()
+                   for media_type in request.META.get("HTTP_ACCEPT", "").split(",")]
+    if "*/*" in media_types or "application/*" in media_types or "application/pdf" in media_types:
+        return None
+    for media_type in media_types:
+        if media_type in STRUCTURED_FORMATS:
+            return STRUCTURED_FORMATS[media_type]
+    return None
+
+
+class ServerTimingMixin:
+    """
+    Times the named stages of a request, including database queries,
+    and reports them in a ``Server-Timing`` header, in the logs and in
+    the in-process stage histograms.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        timer = StageTimer()
+        with timer.activate(), connection.execute_wrapper(timer.query_wrapper):
+            response = super().dispatch(request, *args, **kwargs)
+        timings = timer.finish()
+        response["Server-Timing"] = timer.header()
+        logger.info("Request stage timings",
+                    extra={"path": request.path,
+                           "status_code": response.status_code,
+                           "stage_timings": timings})
+        return response
+
+
 class PayerViewSet(ModelViewSet):
     """
     API endpoint that allows payers to be viewed or edited.
 
     retrieve: Return the given payer.
-    list: Return a list of all the existing payers for the user.
+    list: Return a page of the payers for the user, oldest first.
+    search: Return the user's payers best matching a query, for autocomplete.
     create: Create a new payer.
+    bulk_import: Create or update payers from a CSV or NDJSON body.
     update: Update a payer.
     destroy: Delete a payer.
     """
     serializer_class = PayerSerializer
+    pagination_class = KeysetPagination
+    # Queries per request including the JWT user lookup, checked in
+    # development by api.middleware.QueryBudgetMiddleware
+    query_budgets = {"list": 2, "retrieve": 2, "update": 4, "partial_update": 4, "destroy": 8,
+                     "search": 3}
 
     def get_permissions(self):
         """
@@ -50,6 +261,55 @@ class PayerViewSet(ModelViewSet):
         """
         return Payer.objects.filter(owner=self.request.user)
 
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """
+        Search the user's payers by name or identification code.
+
+        Query parameters: ``q``, part of a Georgian or English name or of
+        an identification code, and ``limit``, the maximum number of
+        results (10 by default, at most 50).
+
+        :param request: Request object
+
+        :return: Response with the matching payers, best match first
+        """
+        query = request.query_params.get("q", "")
+        try:
+            limit = int(request.query_params.get("limit", PayerSearch.DEFAULT_LIMIT))
+        except ValueError:
+            return Response({"error": "limit must be an integer"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        payers = PayerSearch.search(request.user, query, limit)
+        return Response({"results": self.get_serializer(payers, many=True).data})
+
+    @action(detail=False, methods=["post"], url_path="import")
+    def bulk_import(self, request):
+        """
+        Create or update the user's payers from a CSV or NDJSON body.
+
+        The body is streamed, not parsed by DRF, and rows are upserted on
+        the identification code in batches (see PayerImport).
+
+        :param request: Request object with a text/csv or
+            application/x-ndjson body
+
+        :return: Response with counts and the errors of invalid rows
+        """
+        import_format = PayerImport.format_for(request.content_type)
+        if import_format is None:
+            return Response({"error": "Send the payers as text/csv or application/x-ndjson"},
+                            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        if request.stream is None:
+            return Response({"error": "The request body is empty"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            report = PayerImport(request).run(request.stream, import_format)
+        except PayerImportError as e:
+            return Response({"error": str(e)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(report)
+
 
 class FavouritesViewSet(ModelViewSet):
     """
@@ -57,11 +317,15 @@ class FavouritesViewSet(ModelViewSet):
     viewed or edited.
 
     retrieve: Return the given favourite invoice template.
-    list: Return a list of all the existing favourite invoice templates for the user.
+    list: Return a page of the favourite invoice templates for the user, oldest first.
     create: Create a new favourite invoice template.
     update: Update a favourite invoice template.
     destroy: Delete a favourite invoice template.
     """
+    pagination_class = KeysetPagination
+    query_budgets = {"list": 3, "retrieve": 3, "pdf": 3, "update": 9, "partial_update": 8,
+                     "destroy": 5}
+
     def get_serializer_class(self):
         if self.action in ["create", "update", "partial_update"]:
             return InvoiceFavoriteSerializer
@@ -73,54 +337,154 @@ class FavouritesViewSet(ModelViewSet):
 
         :return: Queryset of favourite invoice templates
         """
-        return Invoice.objects.filter(receiver=self.request.user)
+        queryset = Invoice.objects.filter(receiver=self.request.user)
+        if self.action in ("list", "retrieve"):
+            # Serialized with the payer and purposes of every favourite
+            queryset = queryset.select_related("payer").prefetch_related("purposes")
+        elif self.action in ("pdf", "update", "partial_update"):
+            # Both are part of the PDF's source version, and an update
+            # numbers the invoice in its receiver's series
+            queryset = queryset.select_related("payer", "receiver")
+        return queryset
+
+    @action(detail=True, methods=["get"])
+    def pdf(self, request, pk=None):
+        """
+        Return the pre-rendered PDF of a favourite, rebuilding it if stale.
+
+        :param request: Request object.
+        :param pk: Favourite invoice id.
+
+        :return: Response object with a PDF file
+        """
+        invoice = self.get_object()
+        try:
+            return pdf_response(FavouritePDFs.get(invoice))
+        except InvoiceGenerationError as e:
+            logger.exception("Favourite PDF generation error")
+            return Response({"error": str(e)},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except LanguageNotSupportedError as e:
+            return Response({"error": str(e)},
+                            status=status.HTTP_400_BAD_REQUEST)
 
 
-class GenerateInvoiceAPIView(APIView):
+class GeneratedInvoiceViewSet(ReadOnlyModelViewSet):
+    """
+    API endpoint that lists the invoices the user generated.
+
+    list: Return a page of the user's generated invoices, oldest first.
+    retrieve: Return the given generated invoice.
+    download: Return the stored PDF of the given generated invoice.
+    """
+    serializer_class = GeneratedInvoiceSerializer
+    pagination_class = KeysetPagination
+    permission_classes = [IsOwner]
+    query_budgets = {"list": 2, "retrieve": 2, "download": 2}
+
+    def get_queryset(self):
+        """
+        Get the invoices the user generated.
+
+        :return: Queryset of generated invoices
+        """
+        return GeneratedInvoice.objects.filter(owner=self.request.user)
+
+    @action(detail=True, methods=["get"])
+    def download(self, request, pk=None):
+        """
+        Return the stored PDF, without rendering it again.
+
+        :param request: Request object.
+        :param pk: Generated invoice id.
+
+        :return: PDF response, see ``blob_response``
+        """
+        record = self.get_object()
+        return blob_response(request, record.sha256, record.size,
+                             f"invoice_{record.invoice_number}.pdf")
+
+
+class GenerateInvoiceAPIView(ServerTimingMixin, APIView):
     """
     API endpoint that allows generating an invoice.
     """
     permission_classes = [IsAuthenticated]
     serializer_class = InvoiceDisplaySerializer
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [XMLRenderer]
 
     def post(self, request):
         """
         Generate an invoice and return it as a PDF file.
 
+        With ``?async=true`` the invoice is queued instead and the
+        response is ``202`` with the job id to poll. With
+        ``Accept: application/xml`` or ``Accept: application/json`` the
+        invoice is returned as a UBL 2.1 style XML or a JSON document.
+
         :param request: Request object.
 
-        :return: Response object with a PDF file
+        :return: Response object with a PDF file or the queued job
         """
         serializer = InvoiceGenerationSerializer(data=request.data,
                                                  context={"request": request})
 
-        if not serializer.is_valid():
+        with stage("validate"):
+            is_valid = serializer.is_valid()
+        if not is_valid:
             logger.warning("Invoice validation failed",
                            extra={"errors": serializer.errors})
             return Response({"error": serializer.errors},
                             status=status.HTTP_400_BAD_REQUEST)
 
+        if request.query_params.get("async") in ("1", "true", "True"):
+            job = InvoiceJob.objects.create(owner=request.user,
+                                            payload=request.data)
+            status_url = reverse("api:invoice_job", args=[job.id])
+            logger.info("Invoice job queued", extra={"job_id": str(job.id)})
+            return Response(
+                {"job_id": job.id, "status": job.status, "status_url": status_url},
+                status=status.HTTP_202_ACCEPTED,
+                headers={"Location": status_url}
+            )
+
         try:
             invoice_generator = InvoiceGenerator(serializer.validated_data,
                                                  request.user)
-            pdf_bytes = invoice_generator.generate_invoice()
-
-            if not pdf_bytes or isinstance(pdf_bytes, str):
-                logger.error("Invalid PDF generated",
-                             extra={"pdf_content": pdf_bytes})
-                return Response(
-                    {"error": "Failed to generate valid PDF"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            negotiated = structured_format(request)
+            if negotiated is not None:
+                output_format, content_type = negotiated
+                response = StreamingHttpResponse(
+                    invoice_generator.generate_structured(output_format),
+                    content_type=content_type
                 )
-            pdf_file = io.BytesIO(pdf_bytes)
-            response = FileResponse(
-                pdf_file,
-                content_type="application/pdf",
-                as_attachment=False
-            )
-            timestamp = datetime.now().strftime("%Y%m%d")
-            filename = f"invoice_{timestamp}.pdf"
-            response["Content-Disposition"] = f'inline; filename="{filename}"'
+                timestamp = datetime.now().strftime("%Y%m%d")
+                response["Content-Disposition"] = (f'inline; filename="invoice_'
+                                                   f'{timestamp}.{output_format}"')
+                return response
+
+            # The invoice number is committed with the history record
+            with transaction.atomic():
+                if invoice_generator.is_large():
+                    # Streamed from a spooled temporary file
+                    pdf_bytes = invoice_generator.generate_invoice_file()
+                else:
+                    pdf_bytes = invoice_generator.generate_invoice()
+
+                if not pdf_bytes or isinstance(pdf_bytes, str):
+                    logger.error("Invalid PDF generated",
+                                 extra={"pdf_content": pdf_bytes})
+                    return Response(
+                        {"error": "Failed to generate valid PDF"},
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                    )
+                with stage("history"):
+                    record = InvoiceHistory.record(invoice_generator.invoice_data,
+                                                   request.user, pdf_bytes)
+            response = pdf_response(pdf_bytes)
+            if record is not None:
+                response["Content-Location"] = reverse("api:generated_invoice-download",
+                                                       args=[record.pk])
             logger.info("Invoice generation successful")
             return response
 
@@ -136,3 +500,269 @@ class GenerateInvoiceAPIView(APIView):
             logger.exception("Unexpected error")
             return Response({"error": str(e)},
                             status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def validate_invoice_list(request, invoices):
+    """
+    Validate a list of invoice payloads, fetching all their payers in one query.
+
+    :param request: Request object.
+    :param invoices: List of invoice payloads.
+
+    :return: (validated data, error response or None)
+    """
+    if not isinstance(invoices, list) or not invoices:
+        return None, Response({"error": "Expected a non-empty list of invoices"},
+                              status=status.HTTP_400_BAD_REQUEST)
+    if len(invoices) > settings.INVOICE_BATCH_MAX_SIZE:
+        return None, Response(
+            {"error": f"At most {settings.INVOICE_BATCH_MAX_SIZE} "
+                      f"invoices can be generated at once"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Fetch every payer of the list in one query
+    payer_ids = {str(item.get("payer")) for item in invoices
+                 if isinstance(item, dict)}
+    payers = Payer.objects.filter(
+        owner=request.user,
+        pk__in=[pk for pk in payer_ids if pk.isdigit()]
+    ).in_bulk()
+
+    serializer = InvoiceGenerationSerializer(
+        data=invoices,
+        many=True,
+        context={"request": request, "payers": payers}
+    )
+    if not serializer.is_valid():
+        logger.warning("Invoice list validation failed",
+                       extra={"errors": serializer.errors})
+        return None, Response({"error": serializer.errors},
+                              status=status.HTTP_400_BAD_REQUEST)
+    return serializer.validated_data, None
+
+
+class BatchGenerateInvoiceAPIView(APIView):
+    """
+    API endpoint that generates many invoices at once as a ZIP archive.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = InvoiceGenerationSerializer
+
+    def post(self, request):
+        """
+        Generate a list of invoices and stream them back in a ZIP file.
+
+        :param request: Request object with a list of invoice payloads.
+
+        :return: Streaming response with the ZIP archive
+        """
+        invoices, error_response = validate_invoice_list(request, request.data)
+        if error_response:
+            return error_response
+
+        batch_generator = BatchInvoiceGenerator(invoices, request.user)
+        response = StreamingHttpResponse(batch_generator.stream_zip(),
+                                         content_type="application/zip")
+        timestamp = datetime.now().strftime("%Y%m%d")
+        response["Content-Disposition"] = (f'attachment; '
+                                           f'filename="invoices_{timestamp}.zip"')
+        return response
+
+
+class PreviewInvoiceAPIView(ServerTimingMixin, APIView):
+    """
+    API endpoint that renders an invoice preview as HTML.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = InvoiceGenerationSerializer
+
+    def post(self, request):
+        """
+        Validate the invoice data and return the rendered invoice HTML.
+
+        The response carries a strong ``ETag``; sending it back in
+        ``If-None-Match`` returns ``304`` without rendering while the
+        preview is unchanged.
+
+        :param request: Request object.
+
+        :return: HTML response, or 304 if the client's preview is current
+        """
+        serializer = InvoiceGenerationSerializer(data=request.data,
+                                                 context={"request": request})
+        with stage("validate"):
+            is_valid = serializer.is_valid()
+        if not is_valid:
+            return Response({"error": serializer.errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            invoice_generator = InvoiceGenerator(serializer.validated_data,
+                                                 request.user)
+            html, etag = invoice_generator.generate_preview(
+                parse_etags(request.headers.get("If-None-Match", ""))
+            )
+        except InvoiceGenerationError as e:
+            logger.exception("Invoice preview error")
+            return Response({"error": str(e)},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except LanguageNotSupportedError as e:
+            return Response({"error": str(e)},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if html is None:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(html, content_type="text/html; charset=utf-8")
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+
+class MergedInvoiceAPIView(ServerTimingMixin, APIView):
+    """
+    API endpoint that generates many invoices as one merged PDF.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = InvoiceGenerationSerializer
+
+    def post(self, request):
+        """
+        Generate one PDF with a page per invoice.
+
+        Accepts either a list of invoice payloads or
+        ``{"favourites": [<favourite id>, ...]}``.
+
+        :param request: Request object.
+
+        :return: Response object with a PDF file
+        """
+        with stage("validate"):
+            if isinstance(request.data, dict) and "favourites" in request.data:
+                invoices, error_response = self._favourite_invoices(
+                    request, request.data["favourites"]
+                )
+            else:
+                invoices, error_response = validate_invoice_list(request, request.data)
+        if error_response:
+            return error_response
+
+        try:
+            pdf_bytes = InvoiceGenerator.generate_merged(invoices, request.user)
+            logger.info("Merged invoice generation successful")
+            return pdf_response(pdf_bytes)
+        except InvoiceGenerationError as e:
+            logger.exception("Invoice generation error")
+            return Response({"error": str(e)},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except LanguageNotSupportedError as e:
+            logger.exception("Language not supported")
+            return Response({"error": str(e)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.exception("Unexpected error")
+            return Response({"error": str(e)},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @staticmethod
+    def _favourite_invoices(request, favourite_ids):
+        """
+        Load the user's favourites as invoice generation data, keeping the requested order.
+
+        :param request: Request object.
+        :param favourite_ids: List of favourite invoice ids.
+
+        :return: (invoice data list, error response or None)
+        """
+        if (not isinstance(favourite_ids, list) or not favourite_ids
+                or not all(isinstance(pk, int) for pk in favourite_ids)):
+            return None, Response({"error": "Expected a non-empty list of favourite ids"},
+                                  status=status.HTTP_400_BAD_REQUEST)
+        if len(favourite_ids) > settings.INVOICE_BATCH_MAX_SIZE:
+            return None, Response(
+                {"error": f"At most {settings.INVOICE_BATCH_MAX_SIZE} "
+                          f"invoices can be generated at once"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        favourites = (Invoice.objects
+                      .filter(receiver=request.user, pk__in=favourite_ids)
+                      .select_related("payer")
+                      .prefetch_related("purposes")
+                      .in_bulk())
+        missing = [pk for pk in favourite_ids if pk not in favourites]
+        if missing:
+            return None, Response({"error": f"Favourites not found: {missing}"},
+                                  status=status.HTTP_404_NOT_FOUND)
+        return [InvoiceService.invoice_data_from_favourite(favourites[pk])
+                for pk in favourite_ids], None
+
+
+class InvoiceJobAPIView(APIView):
+    """
+    API endpoint that reports the status of an asynchronous invoice job.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = InvoiceJobSerializer
+    query_budgets = {"get": 2}
+
+    def get(self, request, job_id):
+        """
+        Return the job status, or the PDF once the job is done.
+
+        :param request: Request object.
+        :param job_id: Job identifier.
+
+        :return: Response with the job status or a PDF file
+        """
+        job = get_object_or_404(InvoiceJob, pk=job_id, owner=request.user)
+        if job.status == "done":
+            return pdf_response(bytes(job.pdf))
+
+        response = Response(InvoiceJobSerializer(job).data)
+        if job.status in ("pending", "running"):
+            response["Retry-After"] = "1"
+        return response
+
+
+class RenderTimingsAPIView(APIView):
+    """
+    API endpoint that lets staff read the stage timing histograms
+    of this process.
+    """
+    permission_classes = [IsAdminUser]
+    query_budgets = {"get": 1}
+
+    def get(self, request):
+        """
+        Return count, mean, max, percentiles and buckets per stage.
+
+        :param request: Request object.
+
+        :return: Response with the histograms
+        """
+        return Response(StageHistograms.snapshot())
+
+
+class RenderWorkersAPIView(APIView):
+    """
+    API endpoint that lets staff read the render watchdog counters
+    of this process and its render pool.
+    """
+    permission_classes = [IsAdminUser]
+    query_budgets = {"get": 1}
+
+    def get(self, request):
+        """
+        Return render counts and RSS of this process and the pool workers.
+
+        :param request: Request object.
+
+        :return: Response with the counters and limits
+        """
+        return Response({
+            "limits": RenderWatchdog.limits(),
+            "process": RenderWatchdog.snapshot(),
+            "pool": RenderPool.stats(),
+        })
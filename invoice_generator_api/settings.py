@@ -62,6 +62,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'invoice_generator_api.urls'
@@ -92,6 +93,12 @@ WSGI_APPLICATION = 'invoice_generator_api.wsgi.application'
 DATABASES = {
     'default': dj_database_url.config(default=os.getenv('DATABASE_URL'))
 }
+# SQLite test databases are kept in a file rather than in memory, so
+# the threads of concurrency tests can wait for each other's locks
+if DATABASES['default'].get('ENGINE') == 'django.db.backends.sqlite3':
+    DATABASES['default'].setdefault('TEST', {}).setdefault(
+        'NAME', str(BASE_DIR / 'test_db.sqlite3')
+    )
 
 
 # Password validation
@@ -185,6 +192,98 @@ SIMPLE_JWT = {
     # 'AUTH_COOKIE_SAMESITE': 'None',
 }
 
+# Invoice rendering
+# PDFs are rendered in a pool of pre-warmed worker processes. Pool size
+# defaults to the CPU count divided by WEB_CONCURRENCY when set to 0.
+INVOICE_RENDER_POOL_ENABLED = os.getenv("INVOICE_RENDER_POOL_ENABLED", "True") == "True"
+INVOICE_RENDER_POOL_SIZE = int(os.getenv("INVOICE_RENDER_POOL_SIZE", "0"))
+INVOICE_RENDER_TIMEOUT = int(os.getenv("INVOICE_RENDER_TIMEOUT", "60"))
+
+# Invoice templates are compiled and validated when the app is ready.
+# Touching INVOICE_TEMPLATE_RELOAD_FILE (`manage.py reload_templates`)
+# reloads them in running processes.
+INVOICE_TEMPLATE_PRELOAD = os.getenv("INVOICE_TEMPLATE_PRELOAD", "True") == "True"
+INVOICE_TEMPLATE_RELOAD_FILE = os.getenv("INVOICE_TEMPLATE_RELOAD_FILE", "")
+
+# Rendered PDFs are cached by content hash. The invoice number is re-used for
+# identical invoices within INVOICE_PDF_CACHE_TTL seconds; set
+# INVOICE_PDF_CACHE_DIR to enable the on-disk tier.
+INVOICE_PDF_CACHE_ENABLED = os.getenv("INVOICE_PDF_CACHE_ENABLED", "True") == "True"
+INVOICE_PDF_CACHE_MEMORY_BYTES = int(os.getenv("INVOICE_PDF_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+INVOICE_PDF_CACHE_DIR = os.getenv("INVOICE_PDF_CACHE_DIR", "")
+INVOICE_PDF_CACHE_DISK_BYTES = int(os.getenv("INVOICE_PDF_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+INVOICE_PDF_CACHE_TTL = int(os.getenv("INVOICE_PDF_CACHE_TTL", str(24 * 60 * 60)))
+
+# Asynchronous invoice jobs are drained by `manage.py process_invoice_jobs`.
+INVOICE_JOB_CONCURRENCY = int(os.getenv("INVOICE_JOB_CONCURRENCY", "2"))
+INVOICE_JOB_STALE_AFTER = int(os.getenv("INVOICE_JOB_STALE_AFTER", "600"))
+
+# Batch generation renders this many invoices at a time (0 = render pool size).
+INVOICE_BATCH_MAX_SIZE = int(os.getenv("INVOICE_BATCH_MAX_SIZE", "1000"))
+INVOICE_BATCH_CONCURRENCY = int(os.getenv("INVOICE_BATCH_CONCURRENCY", "0"))
+
+# Processes that render PDFs (web workers rendering inline, render pool
+# workers) are replaced after INVOICE_RENDER_MAX_RENDERS renders or once their
+# RSS reaches INVOICE_RENDER_MAX_RSS_MB (0 = no limit), after in-flight work.
+INVOICE_RENDER_MAX_RENDERS = int(os.getenv("INVOICE_RENDER_MAX_RENDERS", "1000"))
+INVOICE_RENDER_MAX_RSS_MB = int(os.getenv("INVOICE_RENDER_MAX_RSS_MB", "0"))
+
+# PDF output options used when neither the request nor the user picks a
+# render profile: "fast", "compact" or "archival" (api.utils.render_profiles).
+INVOICE_RENDER_PROFILE = os.getenv("INVOICE_RENDER_PROFILE", "compact")
+
+# With the "fast" profile, invoices of up to INVOICE_STAMPED_RENDER_MAX_LINES
+# purposes are stamped on a cached layout of their template instead of being
+# laid out (api.utils.stamped_renderer). Up to INVOICE_STAMPED_RENDER_SKELETONS
+# layouts, one per template and invoice shape, are kept per process.
+INVOICE_STAMPED_RENDER_ENABLED = os.getenv("INVOICE_STAMPED_RENDER_ENABLED", "False") == "True"
+INVOICE_STAMPED_RENDER_MAX_LINES = int(os.getenv("INVOICE_STAMPED_RENDER_MAX_LINES", "20"))
+INVOICE_STAMPED_RENDER_SKELETONS = int(os.getenv("INVOICE_STAMPED_RENDER_SKELETONS", "16"))
+
+# Favourites keep a pre-rendered PDF, rebuilt on background threads after
+# the favourite, its payer or the owner's invoice details change.
+INVOICE_FAVOURITE_PDF_ENABLED = os.getenv("INVOICE_FAVOURITE_PDF_ENABLED", "True") == "True"
+INVOICE_FAVOURITE_PDF_CONCURRENCY = int(os.getenv("INVOICE_FAVOURITE_PDF_CONCURRENCY", "1"))
+
+# National Bank rates imported with `manage.py import_exchange_rates` are
+# cached per process and reloaded after INVOICE_EXCHANGE_RATE_CACHE_TTL seconds.
+INVOICE_EXCHANGE_RATE_CACHE_TTL = int(os.getenv("INVOICE_EXCHANGE_RATE_CACHE_TTL", "3600"))
+
+# Invoice numbers come from a series per receiver (api.utils.invoice_numbers).
+# "blocks" reserves INVOICE_NUMBER_BLOCK_SIZE numbers per process at a time and
+# may skip numbers; "gapless" reserves each number in the invoice's transaction.
+# INVOICE_NUMBER_FORMAT must include {receiver}, the receiver's identification
+# code, to keep numbers unique; {receiver_id} (the user id) also works but
+# exposes internal ids on every invoice.
+INVOICE_NUMBER_GAP_POLICY = os.getenv("INVOICE_NUMBER_GAP_POLICY", "blocks")
+INVOICE_NUMBER_BLOCK_SIZE = int(os.getenv("INVOICE_NUMBER_BLOCK_SIZE", "100"))
+INVOICE_NUMBER_FORMAT = os.getenv("INVOICE_NUMBER_FORMAT", "{receiver}-{number:06d}")
+
+# With DEBUG on, requests running more queries than their view's
+# query_budgets are logged ("log") or fail ("raise"); "" turns it off.
+INVOICE_QUERY_BUDGET = os.getenv("INVOICE_QUERY_BUDGET", "log")
+
+# Generated invoices are recorded with their PDF in a content-addressed
+# store under INVOICE_BLOB_STORE_DIR. Downloads are handed to the web server
+# with INVOICE_BLOB_SENDFILE = "x-accel-redirect" (nginx, internal location
+# INVOICE_BLOB_ACCEL_PREFIX aliased to the store) or "x-sendfile".
+INVOICE_HISTORY_ENABLED = os.getenv("INVOICE_HISTORY_ENABLED", "True") == "True"
+INVOICE_BLOB_STORE_DIR = os.getenv("INVOICE_BLOB_STORE_DIR", str(BASE_DIR / "invoice_blobs"))
+INVOICE_BLOB_SENDFILE = os.getenv("INVOICE_BLOB_SENDFILE", "")
+INVOICE_BLOB_ACCEL_PREFIX = os.getenv("INVOICE_BLOB_ACCEL_PREFIX", "/protected/invoices/")
+
+# Invoices with at least INVOICE_LARGE_INVOICE_LINES purposes (0 = never) are
+# rendered, laid out and written INVOICE_LARGE_CHUNK_LINES purposes at a
+# time, and the chunk PDFs are then concatenated. Peak memory per render is
+# one chunk's HTML, DOM and layout plus the parsed chunk PDFs while they are
+# concatenated, several times the size of the PDF. The PDF itself stays in
+# memory up to INVOICE_PDF_SPOOL_BYTES and is spooled to a temporary file
+# beyond that.
+INVOICE_LARGE_INVOICE_LINES = int(os.getenv("INVOICE_LARGE_INVOICE_LINES", "500"))
+INVOICE_LARGE_CHUNK_LINES = int(os.getenv("INVOICE_LARGE_CHUNK_LINES", "200"))
+INVOICE_LARGE_RENDER_TIMEOUT = int(os.getenv("INVOICE_LARGE_RENDER_TIMEOUT", "600"))
+INVOICE_PDF_SPOOL_BYTES = int(os.getenv("INVOICE_PDF_SPOOL_BYTES", str(16 * 1024 * 1024)))
+
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 EMAIL_USE_TLS = True
@@ -0,0 +1,24 @@
+"""
+Settings for running the invoice benchmarks offline.
+
+Uses an in-memory SQLite database and needs no environment variables
+or external services:
+
+    DJANGO_SETTINGS_MODULE=invoice_generator_api.settings_benchmark \
+        python manage.py benchmark_invoices
+"""
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://:memory:")
+
+from invoice_generator_api.settings import *  # noqa: E402,F401,F403
+
+SECRET_KEY = SECRET_KEY or "benchmark-only-secret-key"  # noqa: F405
+DEBUG = False
+ALLOWED_HOSTS = ["*"]
+CORS_ORIGIN_WHITELIST = []
+CSRF_TRUSTED_ORIGINS = []
+
+# Measure the rendering itself, in-process and without cached results.
+INVOICE_RENDER_POOL_ENABLED = False
+INVOICE_PDF_CACHE_ENABLED = False
@@ -14,3 +14,12 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_generator_api.settings')
 
 application = get_wsgi_application()
+
+# Start the pre-warmed PDF render pool at boot rather than on the first request.
+from api.utils.render_pool import RenderPool  # noqa: E402
+from api.utils.stylesheets import StylesheetCache  # noqa: E402
+
+if RenderPool.enabled():
+    RenderPool.start()
+else:
+    StylesheetCache.load()
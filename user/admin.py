@@ -15,6 +15,7 @@ class UserAdmin(BaseUserAdmin):
         (None, {"fields": ("email", "password")}),
         ("Personal Info", {"fields": ("receiver_name_ka", "receiver_name_en",
                                       "identification_code")}),
+        ("Invoices", {"fields": ("render_profile",)}),
         ("Permissions", {"fields": ("is_active", "is_staff", "is_superuser")}),
     )
     add_fieldsets = (
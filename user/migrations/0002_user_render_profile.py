@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 19:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='render_profile',
+            field=models.CharField(blank=True, choices=[('fast', 'fast'), ('compact', 'compact'), ('archival', 'archival')], help_text="Default render profile of the user's invoice PDFs.", max_length=20, null=True),
+        ),
+    ]
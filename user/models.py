@@ -2,6 +2,7 @@ from django.contrib.auth.base_user import AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
 from django.db import models
 
+from api.utils.render_profiles import RenderProfile
 from user.managers import UserManager
 
 
@@ -18,6 +19,13 @@ class User(AbstractBaseUser, PermissionsMixin):
     bank_name_en = models.CharField(max_length=100, blank=True, null=True)
     bank_name_ka = models.CharField(max_length=100)
     bank_code = models.CharField(max_length=100)
+    render_profile = models.CharField(
+        max_length=20,
+        choices=[(profile.value, profile.value) for profile in RenderProfile],
+        blank=True,
+        null=True,
+        help_text="Default render profile of the user's invoice PDFs."
+    )
 
     REQUIRED_FIELDS = ['receiver_name_ka',
                        'identification_code',
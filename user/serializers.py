@@ -27,6 +27,7 @@ class UserSerializer(serializers.ModelSerializer):
                   "bank_code",
                   "bank_account_number",
                   "phone_number",
+                  "render_profile",
                   "current_password",
                   "password",
                   "confirm_password"]
@@ -37,6 +38,7 @@ class UserSerializer(serializers.ModelSerializer):
             "address": {"required": False},
             "current_password": {"write_only": True, "required": False},
             "phone_number": {"required": False},
+            "render_profile": {"required": False},
             "is_staff": {"read_only": True},
             "is_active": {"read_only": True},
             "is_superuser": {"read_only": True},
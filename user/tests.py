@@ -1,3 +1,49 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from api.utils.query_budget import QueryBudget
+from user.models import User
+from user.views import CurrentUserView, UserViewSet
+
+
+@override_settings(INVOICE_FAVOURITE_PDF_ENABLED=False)
+class QueryBudgetTests(TestCase):
+    """
+    The user endpoints stay within the queries their views declare in
+    ``query_budgets``, the JWT user lookup included.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            "მიმღები", "123456789", "budgets@tests.invalid", "password",
+            bank_account_number="GE00TB0000000000000000", bank_name_ka="ბანკი",
+            bank_code="TBCBGE22",
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def _request(self, view, action, method, url, data=None):
+        """
+        Send a request inside the budget the view declares for the action.
+        """
+        with QueryBudget(view.query_budgets[action], f"{view.__name__}.{action}"):
+            response = getattr(self.client, method)(url, data, format="json", secure=True)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response
+
+    def test_current_user(self):
+        response = self._request(CurrentUserView, "get", "get", reverse("user:current_user"))
+        self.assertEqual(response.data["identification_code"], "123456789")
+
+    def test_update(self):
+        detail = reverse("user:user-detail", args=[self.user.identification_code])
+        self._request(UserViewSet, "update", "put", detail, {
+            "receiver_name_ka": "ახალი მიმღები", "identification_code": "987654321",
+            "email": "budgets@tests.invalid", "bank_name_ka": "ბანკი", "bank_code": "TBCBGE22",
+            "bank_account_number": "GE00TB0000000000000001",
+        })
+        detail = reverse("user:user-detail", args=["987654321"])
+        self._request(UserViewSet, "partial_update", "patch", detail,
+                      {"receiver_name_en": "Receiver"})
@@ -28,6 +28,8 @@ class UserViewSet(UpdateModelMixin,
     serializer_class = UserSerializer
     lookup_field = "identification_code"
     permission_classes = []
+    # Queries per request, see api.middleware.QueryBudgetMiddleware
+    query_budgets = {"update": 5, "partial_update": 5}
 
     def get_permissions(self):
         """
@@ -116,6 +118,7 @@ class CurrentUserView(APIView):
     API endpoint that allows the current user to be viewed.
     """
     permission_classes = [IsCorrectUser]
+    query_budgets = {"get": 1}
 
     def get(self, request):
         """